@@ -1,184 +1,158 @@
-from datetime import timedelta, date
-import rich
+from datetime import date
+from instrumentation import timed
+from periodicity import parse_periodicity
+from renderers import get_renderer, longest_streak_message
+from results import CompletionState
 
 class HabitAnalyzer:
     """Class to analyze habits and provide insights based on their periodicity, streaks, and events."""
 
-    # pass in HabitRepository instance so we can access its methods and the db connection
-    def __init__(self, repo):
+    # pass in HabitRepository instance so we can access its methods and the db connection. Results are rendered by
+    # the given renderer, by default the one of the repository.
+    def __init__(self, repo, renderer=None):
         self.repo = repo
+        self.renderer = get_renderer(renderer) if renderer is not None else repo.renderer
+
+    def for_user(self, user_id):
+        """Return an analyzer for the habits of another user of the same database, sharing the repository's
+        connection pool and this analyzer's renderer."""
+        return HabitAnalyzer(self.repo.for_user(user_id), self.renderer)
+
+    def longest_streak_habit(self):
+        """Return the HabitStats of the habit with the longest current streak, or None if no habit has a streak."""
+        leaders = self.repo.get_leaderboard(1, by="streak")
+        return leaders[0] if leaders and leaders[0].streak > 0 else None
 
     def longest_overall_streak(self):
-        """Calculate the longest overall streak for all habits."""
-
-        # Get all habits from the db
-        habits = self.repo.get_all_habits()
-        top_habit = None
-
-        # If no habits are found, return "No habits found."
-        if not habits:
-            return "No habits found."
-
-        # Find the habit with the longest streak and save it in top_habit
-        longest_streak = 0
-        for habit in habits:
-            if habit.streak > longest_streak:
-                longest_streak = habit.streak
-                top_habit = habit
-
-        # Intercept the possibility that no habit has a streak
-        if top_habit is None:
-            return "No habits with a streak were found."
-
-        # If the top_habit is a daily habit, print the longest streak in days
-        if top_habit.periodicity.lower() == "daily":
-            rich.print(f"The longest overall streak is [bold purple]{longest_streak} days[/bold purple] for daily the"
-                       f" habit [bold purple]{top_habit.name}[/bold purple].")
-            return (f"The longest overall streak is [bold purple]{longest_streak} days[/bold purple] for the daily"
-                    f" habit [bold purple]{top_habit.name}[/bold purple].")
-
-        # If the top_habit is a weekly habit, print the longest streak in weeks
-        elif top_habit.periodicity.lower() == "weekly":
-            rich.print(f"The longest overall streak is [bold purple]{longest_streak} week/s[/bold purple] for the weekly"
-                       f" habit [bold purple]{top_habit.name}[/bold purple].")
-            return (f"The longest overall streak is [bold purple]{longest_streak} week/s[/bold purple] for the weekly"
-                    f" habit [bold purple]{top_habit.name}[/bold purple].")
-        return None
+        """Calculate the longest overall streak for all habits, render it and return it as a message."""
 
-    def daily_habit_completed(self, habit_name: str):
-        """Check if a daily habit was completed today."""
+        # Look up the habit with the longest streak at the top of the leaderboard
+        top_habit = self.longest_streak_habit()
+
+        # Only check for habits at all if none has a streak
+        has_habits = top_habit is not None or self.repo.has_habits()
+        self.renderer.longest_streak(top_habit, has_habits)
+        return longest_streak_message(top_habit, has_habits)
+
+    @timed()
+    def top_habits(self, k: int = 10, by: str = "streak", periodicity: str = None):
+        """Return the top k habits by current streak, longest streak or struggle score as HabitStats objects."""
+        return self.repo.get_leaderboard(k, by=by, periodicity=periodicity)
+
+    def list_top_habits(self, k: int = 10, by: str = "streak", periodicity: str = None):
+        """List the top k habits by current streak, longest streak or struggle score."""
+        leaders = self.top_habits(k, by=by, periodicity=periodicity)
+        self.renderer.leaderboard(leaders, by)
+        return leaders
+
+    def schedule_completion(self, habit_name: str, periodicity: str, today: date = None):
+        """Return the CompletionState of a habit checked against the schedule of a periodicity."""
 
         # Get today's date and the last event date for the habit
-        today = date.today()
+        today = today or date.today()
         last_event_date = self.repo.get_last_event_date(habit_name)
+        schedule = parse_periodicity(periodicity)
+
+        # The habit is completed as long as another event today would still be too soon. Once its next due date is
+        # reached, or if there is no event at all, the habit is due today
+        completed = last_event_date is not None and schedule.event_too_soon(last_event_date, today)
+        return CompletionState(habit_name=habit_name, periodicity=periodicity, completed=completed,
+                               last_event_date=last_event_date, next_due_date=schedule.next_due(last_event_date),
+                               checked_on=today)
+
+    def daily_completion(self, habit_name: str, today: date = None):
+        """Return the CompletionState of a habit checked as a daily habit."""
+        return self.schedule_completion(habit_name, "Daily", today)
+
+    def weekly_completion(self, habit_name: str, today: date = None):
+        """Return the CompletionState of a habit checked as a weekly habit."""
+        return self.schedule_completion(habit_name, "Weekly", today)
+
+    @timed()
+    def completion_state(self, habit_name: str, today: date = None):
+        """Return the CompletionState of a habit according to its periodicity, or None if the habit does not exist
+        or has a periodicity without a schedule."""
+        habits = self.repo.get_one_habit(habit_name)
+        if not habits or habits[0].schedule.gap is None:
+            return None
+        return self.schedule_completion(habit_name, habits[0].periodicity, today)
 
-        # If today's date is the same as the last event date, the habit has been completed today
-        if today == last_event_date:
-                rich.print(f"[green]Daily habit [bold purple]{habit_name}[/bold purple] has already been completed"
-                           f" today![/green]")
-                return True
-
-        # If today's date is not the same as the last event date, habit has not been completed today
-        rich.print(f"[red]Daily habit [bold purple]{habit_name}[/bold purple] still to be completed today![/red]")
-        return False
+    def daily_habit_completed(self, habit_name: str):
+        """Check if a daily habit was completed today."""
+        state = self.daily_completion(habit_name)
+        self.renderer.completion(state)
+        return state.completed
 
     def weekly_habit_completed(self, habit_name: str):
         """Check if a weekly habit was completed this week."""
+        state = self.weekly_completion(habit_name)
+        self.renderer.completion(state)
+        return state.completed
 
-        # Get today's date and the last event date for the habit
-        today: date = date.today()
-        last_event_date: date = self.repo.get_last_event_date(habit_name)
-
-        # If a last event date exists, calculate next_due_date and next_due_in_days
-        if last_event_date:
-            next_due_date = last_event_date + timedelta(weeks=1)
-            next_due_in_days = (next_due_date - today).days
-
-            delta = (today - last_event_date).days
-
-            # If the last event date is within the current week, it has been completed this week
-            if delta < 7:
-                rich.print(f"[green]Weekly habit [bold purple]{habit_name}[/bold purple] was completed on the"
-                           f" [bold purple]{last_event_date}[/bold purple] of this week! Next completion due in"
-                           f" [bold purple]{next_due_in_days} days[/bold purple] on the"
-                           f" [bold purple]{next_due_date}[/bold purple]![/green]")
-                return True
-
-            # If the last event date is exactly 7 days ago, it is due today
-            elif delta == 7:
-                rich.print(f"[red]Weekly habit [bold purple]{habit_name}[/bold purple] was not completed this week"
-                           f" and is due today![/red]")
-                return False
-
-        # If there is no last even date, or it is more than 7 days ago, the habit is considered overdue
-        rich.print(f"[red]Weekly habit [bold purple]{habit_name}[/bold purple] was not completed this week and is"
-                   f" due today![/red]")
-        return False
+    @timed()
+    def overdue_habits(self, today: date = None):
+        """Return all habits that are overdue today as OverdueHabit objects, without printing anything."""
+        return self.repo.get_overdue_habits(today or date.today())
 
     def list_all_overdue_habits(self):
         """List all habits that are overdue today"""
 
-        # Get today's date and initialize an empty list for overdue habits
-        today = date.today()
-        overdue_habits = []
-
-        # Iterate through all habits and check their last event date
-        for habit in self.repo.get_all_habits():
-            last_event_date = self.repo.get_last_event_date(habit.name)
-
-            # If a last event date exists, check if the habit is overdue based on its periodicity
-            if last_event_date:
-                if habit.periodicity.lower() == "daily":
-                    if (today - last_event_date).days >= 1:
-                        overdue_habits.append(habit)
-                elif habit.periodicity.lower() == "weekly":
-                    if (today - last_event_date).days >= 7:
-                        overdue_habits.append(habit)
-
-            # If there is no last event date, the habit is considered overdue
-            elif not self.repo.get_one_habit_events(habit.name):
-                overdue_habits.append(habit)
-
-        # Incase no overdue habits are found, print No overdue habits found and return
-        if not overdue_habits:
-            rich.print("[green]No overdue habits found![/green]")
-            return
-
-        # Print the overdue habits with their last completed date, differentiate between if there ever was an event or not
-        rich.print("[dark_orange]Overdue habits:[/dark_orange]")
-        for habit in overdue_habits:
-            if self.repo.get_last_event_date(habit.name):
-                rich.print(f"[bold purple]{habit.name}[/bold purple] - Last completed on:[bold purple] {self.repo.get_last_event_date(habit.name)}[/bold purple]")
-            else:
-                rich.print(f"[bold purple]{habit.name}[/bold purple] - Last completed on:[bold purple] Never[/bold purple]")
+        # Compute the overdue habits and their last completion dates in one query, then render them
+        overdue_habits = self.overdue_habits()
+        self.renderer.overdue(overdue_habits)
+        return overdue_habits
+
+    def struggle_habit(self):
+        """Return the HabitStats of the habit with the highest struggle score, or None if no habit struggles."""
+        leaders = self.repo.get_leaderboard(1, by="struggle")
+        # A habit struggles if some of its events are not part of its current streak, see habit_stats.struggle_score
+        return leaders[0] if leaders and leaders[0].struggle > 0 else None
 
     def biggest_struggle(self):
-        """Identify the habit the user struggles with the most, based on streak stability."""
-
-        # Get all habits from the db
-        habits = self.repo.get_all_habits()
-
-        # If no habits are found, print a message and return
-        if not habits:
-            rich.print("[red]No habits found to analyze.[/red]")
-            return
-
-        # Initialize variables to track the habit with the highest struggle score
-        struggle_habit = None
-        highest_score = -1
-
-        # No data to analyze
-        for habit in habits:
-            if habit.event_count == 0:
-                continue
-
-            # No struggle if streak equals event count
-            if habit.event_count == habit.streak:
-                continue
-
-            # Calculate the struggle score as a relation between event count and streak
-            score = (habit.event_count - habit.streak) / habit.event_count
-
-            if score > highest_score:
-                highest_score = score
-                struggle_habit = habit
-
-        # if a struggling habit was found, print its details
-        if struggle_habit:
-            rich.print(
-                f"[dark_orange]Your biggest struggle is the habit [bold purple]{struggle_habit.name}[/bold purple], "
-                f"with a struggle score of [bold purple]{highest_score:.2f}[/bold purple]. "
-                f"This is your most difficult to maintain habit currently."
-                f"\n The struggle score lives between '0' and '1', scores closer to '1' indicate a bigger struggle, "
-                f"scores closer to '0' indicate a smaller struggle :) [/dark_orange]"
-            )
-        # If no struggling habits were found, print You're doing great! No struggling habits found
-        else:
-            rich.print("[green]You're doing great! No struggling habits found.[/green]")
+        """Identify the habit the user struggles with the most, based on streak stability. Renders it and returns its
+        HabitStats, or None."""
+
+        # Look up the habit with the highest struggle score at the top of the leaderboard
+        struggle_habit = self.struggle_habit()
+
+        # Only check for habits at all if none struggles
+        has_habits = struggle_habit is not None or self.repo.has_habits()
+        self.renderer.struggle(struggle_habit, has_habits)
+        return struggle_habit
+
+    def habit_trends(self, windows=None, weeks: int = None, today: date = None):
+        """Return the HabitTrends of all habits: the completion rates over the last 7, 30 and 90 days (or the given
+        windows), a heatmap of the last weeks and the completions per weekday. Only the weekly rollups of that range
+        are read, one row per habit and week."""
+        # numpy is only needed by the bulk analytics, keep it out of the CLI startup
+        from trends import HEATMAP_WEEKS, WINDOWS, compute_trends, first_week
+        today = today or date.today()
+        windows, weeks = windows or WINDOWS, weeks or HEATMAP_WEEKS
+        rollups = self.repo.get_week_rollup_columns(since=first_week(today, windows, weeks), until=today)
+        return compute_trends(self.repo.get_all_habits(), rollups, today, windows, weeks)
+
+    def list_habit_trends(self, windows=None, weeks: int = None):
+        """List the completion rates, heatmaps and weekday distributions of all habits."""
+        trends = self.habit_trends(windows, weeks)
+        self.renderer.trends(trends)
+        return trends
+
+    def lowest_completion_rate(self, days: int = 30, today: date = None):
+        """Return the HabitTrends of the habit with the lowest completion rate over the last days, a struggle
+        measure that only looks at recent history, or None if no habit has a schedule. Ties go to the habit that
+        was added first."""
+        trends = [trend for trend in self.habit_trends((days,), today=today) if trend.rates[days] is not None]
+        return min(trends, key=lambda trend: trend.rates[days], default=None)
+
+    def parallel_report(self, workers: int = None, shards: int = None, k: int = 10, today: date = None):
+        """Rebuild the top streaks, top struggles and overdue habits from the events of all habits, split into
+        shards that are analyzed by a pool of worker processes. Returns an AnalyticsReport."""
+        # numpy and the process pool are only needed by the nightly report, keep them out of the CLI startup
+        from parallel_analytics import parallel_report
+        return parallel_report(self.repo.pool.name, self.repo.user_id, workers=workers, shards=shards, k=k,
+                               today=today)
 
     def close(self):
-        """Close the repository’s database connection if it exists."""
-        if self.repo and hasattr(self.repo, "db") and self.repo.db:
-            self.repo.db.close()
-            self.repo.db = None
-
+        """Close the repository’s database connections if it exists."""
+        if self.repo:
+            self.repo.close()
@@ -0,0 +1,169 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from connection_pool import DEFAULT_READERS
+from database import DEFAULT_USER
+from habit_repository import HabitRepository
+
+# Largest number of queued habit events written in one group commit
+MAX_GROUP_COMMIT = 1000
+
+class AsyncHabitRepository:
+    """Asyncio facade of HabitRepository for service deployments. The SQLite work runs on a dedicated thread pool,
+    so the event loop is never blocked. Habit events are queued and written by a single writer task: all events that
+    arrive while a commit is in flight are written together in the next one, so many concurrent check-ins share one
+    transaction and one fsync instead of paying for one each."""
+
+    def __init__(self, db_name="main.db", profile="default", readers=DEFAULT_READERS,
+                 max_group_commit=MAX_GROUP_COMMIT, user_id=DEFAULT_USER):
+        """Open the underlying repository for the habits of user_id, and a thread pool with one thread per read
+        connection plus one writer."""
+        self.repo = HabitRepository(db_name, profile, readers, user_id=user_id)
+        self.max_group_commit = max_group_commit
+        self._executor = ThreadPoolExecutor(max_workers=readers + 1, thread_name_prefix="habit-db")
+        # The queue and the writer task belong to the event loop of the first add_habit_event call
+        self._queue = None
+        self._writer = None
+        # Number of group commits and of events they wrote, to see how well check-ins coalesce
+        self.commit_count = 0
+        self.committed_events = 0
+
+    async def _run(self, method, *args, **kwargs):
+        """Run a blocking repository method on the thread pool and return its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+
+    async def add_habit(self, name, description, periodicity, streak=0):
+        """Add a new habit to the database."""
+        return await self._run(self.repo.add_habit, name, description, periodicity, streak)
+
+    async def rename_habit(self, name, new_name):
+        """Rename a habit."""
+        return await self._run(self.repo.rename_habit, name, new_name)
+
+    async def delete_habit(self, name):
+        """Delete a habit and its events from the database."""
+        return await self._run(self.repo.delete_habit, name)
+
+    async def clear_database(self):
+        """Clear all habits and events from the database."""
+        return await self._run(self.repo.clear_database)
+
+    async def get_one_habit(self, name):
+        """Retrieve data for a specific habit."""
+        return await self._run(self.repo.get_one_habit, name)
+
+    async def get_all_habits(self):
+        """Retrieve data for all habits."""
+        return await self._run(self.repo.get_all_habits)
+
+    async def has_habits(self):
+        """Check if there is at least one habit in the database."""
+        return await self._run(self.repo.has_habits)
+
+    async def get_one_habit_events(self, name):
+        """Retrieve all events for a specific habit."""
+        return await self._run(self.repo.get_one_habit_events, name)
+
+    async def get_all_habit_events(self):
+        """Retrieve all habit events."""
+        return await self._run(self.repo.get_all_habit_events)
+
+    async def get_event_batch(self, habit=None, since=None, until=None, shard=None):
+        """Retrieve habit events as a columnar EventBatch, optionally only of one shard of the habits."""
+        return await self._run(self.repo.get_event_batch, habit, since, until, shard)
+
+    async def get_last_event_date(self, name):
+        """Get the date of the last event for a specific habit."""
+        return await self._run(self.repo.get_last_event_date, name)
+
+    async def get_overdue_habits(self, today=None):
+        """Retrieve all habits that are overdue on the given day (default: today)."""
+        return await self._run(self.repo.get_overdue_habits, today)
+
+    async def get_due_habits(self, since=None, until=None):
+        """Retrieve the analytics of all habits whose next due date lies between since and until (default: today)."""
+        return await self._run(self.repo.get_due_habits, since, until)
+
+    async def get_stats(self, habit_ids=None):
+        """Retrieve the analytics of all habits, or of the habits with the given ids."""
+        return await self._run(self.repo.get_stats, habit_ids)
+
+    async def reset_streaks(self, habit_ids):
+        """Reset the current streak of the habits with the given ids to 0. Returns the number of habits reset."""
+        return await self._run(self.repo.reset_streaks, habit_ids)
+
+    async def get_leaderboard(self, k=10, by="streak", periodicity=None):
+        """Retrieve the analytics of the top k habits."""
+        return await self._run(self.repo.get_leaderboard, k, by, periodicity)
+
+    async def get_week_rollups(self, habit=None, since=None, until=None):
+        """Retrieve the weekly completion rollups of the habits as WeekRollup objects."""
+        return await self._run(self.repo.get_week_rollups, habit, since, until)
+
+    async def get_audit_trail(self, name=None, after=0):
+        """Retrieve the log entries of the user, or of one habit, after the given seq."""
+        return await self._run(self.repo.get_audit_trail, name, after)
+
+    async def add_habit_events_bulk(self, events):
+        """Add many events at once in a single transaction. Returns a BulkIngestReport."""
+        return await self._run(self.repo.add_habit_events_bulk, events)
+
+    async def add_habit_event(self, name, event_date=""):
+        """Add an event for a specific habit. The event is queued and written with the other pending events in the
+        next group commit, the call returns once it is committed. Returns an Outcome, with the checks and the codes
+        of HabitRepository.add_habit_event."""
+        if self._writer is None:
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.get_running_loop().create_task(self._write_events())
+
+        committed = asyncio.get_running_loop().create_future()
+        await self._queue.put((name, event_date, committed))
+        return await committed
+
+    async def _write_events(self):
+        """Writer task: take all queued events, up to max_group_commit, and write them in one transaction.
+        A None in the queue stops the task once the events queued before it are written."""
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            pending = []
+            while item is not None:
+                pending.append(item)
+                if len(pending) >= self.max_group_commit or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            stopping = item is None
+            if not pending:
+                continue
+
+            try:
+                results = await self._run(self.repo.add_habit_events,
+                                          [(name, event_date) for name, event_date, _ in pending])
+            except Exception as error:
+                # Fail the callers of this group, the writer keeps serving later events
+                for *_, committed in pending:
+                    if not committed.done():
+                        committed.set_exception(error)
+                continue
+
+            self.commit_count += 1
+            self.committed_events += sum(result.ok for result in results)
+            for result, (*_, committed) in zip(results, pending):
+                if not committed.done():
+                    committed.set_result(result)
+
+    async def close(self):
+        """Write the events still queued, then shut down the thread pool and close all database connections."""
+        if self._writer is not None:
+            await self._queue.put(None)
+            await self._writer
+            self._writer = None
+        await self._run(self.repo.close)
+        self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,64 @@
+"""Measure read throughput of one shared HabitRepository with 1, 2, 4 and 8 threads under WAL.
+
+Run from the project root: python benchmarks/read_scaling.py [habits] [events_per_habit] [seconds]
+Each read is a leaderboard lookup plus a full event scan; sqlite3 releases the GIL while SQLite runs the scan, so
+throughput grows with threads up to the number of cores, while a single shared connection would stay flat.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from habit_repository import HabitRepository  # noqa: E402
+
+THREAD_COUNTS = (1, 2, 4, 8)
+
+def populate(repo, habits, events_per_habit):
+    """Fill the repository with daily habits, each completed on the last events_per_habit days."""
+    today = date.today()
+    names = [f"Habit {number}" for number in range(habits)]
+    for name in names:
+        repo.add_habit(name, "Benchmark", "Daily")
+    repo.add_habit_events_bulk((name, today - timedelta(days=days_ago))
+                               for name in names for days_ago in range(events_per_habit, -1, -1))
+    return names
+
+def run_reads(repo, stop):
+    """Run read queries until stop is set and return how many were done."""
+    operations = 0
+    while not stop.is_set():
+        repo.get_leaderboard(10)
+        repo.get_event_batch()
+        operations += 1
+    return operations
+
+def measure(repo, threads, seconds):
+    """Return the read operations per second of the given number of threads sharing repo."""
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(run_reads, repo, stop) for _ in range(threads)]
+        time.sleep(seconds)
+        stop.set()
+        return sum(future.result() for future in futures) / seconds
+
+def main(habits=500, events_per_habit=60, seconds=2.0):
+    with tempfile.TemporaryDirectory() as directory:
+        repo = HabitRepository(os.path.join(directory, "bench.db"), readers=max(THREAD_COUNTS))
+        populate(repo, habits, events_per_habit)
+        baseline = None
+        print(f"{habits} habits, {habits * (events_per_habit + 1)} events, WAL, {os.cpu_count()} cores,"
+              f" {seconds:.0f}s per run")
+        for threads in THREAD_COUNTS:
+            ops = measure(repo, threads, seconds)
+            baseline = baseline or ops
+            print(f"{threads} thread(s): {ops:10.0f} reads/s  ({ops / baseline:.2f}x)")
+        repo.close()
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    main(*(cast(value) for cast, value in zip((int, int, float), arguments)))
@@ -0,0 +1,142 @@
+"""Time the repository and analyzer operations on synthetic databases of several sizes.
+
+Run from the project root: python benchmarks/suite.py [--scales small,medium] [--save]
+Every operation reports ops/s, p50 and p99 latency and the peak memory of one call. With --save the results become
+the baseline in benchmarks/baseline.json, otherwise they are compared with it and the run fails if the p50 latency
+of an operation grew by more than the threshold. Baselines are only comparable on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzer import HabitAnalyzer  # noqa: E402
+from habit_repository import HabitRepository  # noqa: E402
+from streaks import recompute_all  # noqa: E402
+from synthetic import generate  # noqa: E402
+
+# Number of habits and events of every scale
+SCALES = {"small": (100, 10_000), "medium": (1_000, 100_000), "large": (10_000, 1_000_000)}
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Largest accepted growth of the p50 latency against the baseline
+REGRESSION_THRESHOLD = 1.5
+
+def operations(repo, analyzer, names, writes):
+    """Return the benchmarked operations by name. Each takes the number of the call, so calls can spread over the
+    habits. add_habit_event completes one of the habits in writes per call, which have no events yet."""
+    return {
+        "add_habit_event": lambda call: repo.add_habit_event(writes[call]),
+        "get_one_habit": lambda call: repo.get_one_habit(names[call % len(names)]),
+        "get_all_habits": lambda call: repo.get_all_habits(),
+        "get_last_event_date": lambda call: repo.get_last_event_date(names[call % len(names)]),
+        "completion_state": lambda call: analyzer.completion_state(names[call % len(names)]),
+        "list_all_overdue_habits": lambda call: analyzer.list_all_overdue_habits(),
+        "get_leaderboard": lambda call: repo.get_leaderboard(10),
+        "get_due_habits": lambda call: repo.get_due_habits(),
+        "get_week_rollups": lambda call: repo.get_week_rollups(since=date.today() - timedelta(days=364)),
+        "habit_trends": lambda call: analyzer.habit_trends(),
+        "get_event_batch": lambda call: repo.get_event_batch(),
+        "iter_events": lambda call: sum(1 for _ in repo.iter_events()),
+        "recompute_all": lambda call: recompute_all(repo),
+    }
+
+def measure(operation, iterations, seconds):
+    """Call an operation up to iterations times, stopping early once seconds have passed, and return its ops/s,
+    p50 and p99 latency in milliseconds and the peak memory of one traced call in KiB."""
+    operation(0)
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while len(latencies) < iterations and (len(latencies) < 5 or time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        operation(len(latencies) + 1)
+        latencies.append((time.perf_counter_ns() - start) / 1e6)
+
+    # tracemalloc slows every allocation down, so memory is measured in a separate call
+    tracemalloc.start()
+    operation(len(latencies) + 1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"ops_per_sec": round(len(latencies) / (sum(latencies) / 1000), 1), "p50_ms": round(percentiles[49], 4),
+            "p99_ms": round(percentiles[98], 4), "peak_kib": round(peak / 1024, 1), "iterations": len(latencies)}
+
+def run_scale(scale, selected=None, iterations=200, seconds=1.0, seed=0):
+    """Generate a database of the given scale and measure the selected operations (default: all) on it.
+    Returns the results by operation name."""
+    habits, events = SCALES[scale]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        repo = HabitRepository(os.path.join(directory, f"{scale}.db"))
+        names = generate(repo, habits, events, seed)
+        # Habits for add_habit_event, one per call including the warm-up and the traced call
+        writes = [f"Write {number}" for number in range(iterations + 2)]
+        repo.add_habits_bulk((name, "Benchmark writes", "Daily") for name in writes)
+
+        analyzer = HabitAnalyzer(repo)
+        for name, operation in operations(repo, analyzer, names, writes).items():
+            if selected is None or name in selected:
+                results[name] = measure(operation, iterations, seconds)
+        repo.close()
+    return results
+
+def regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return (scale, operation, baseline p50, p50) for every operation whose p50 latency grew by more than the
+    threshold against the baseline. Operations without a baseline are skipped."""
+    slower = []
+    for scale, measured in results.items():
+        for name, result in measured.items():
+            before = baseline.get(scale, {}).get(name)
+            if before and result["p50_ms"] > before["p50_ms"] * threshold:
+                slower.append((scale, name, before["p50_ms"], result["p50_ms"]))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the habit tracker on synthetic data.")
+    parser.add_argument("--scales", default="small,medium", help=f"comma separated, of {', '.join(SCALES)}")
+    parser.add_argument("--operations", help="comma separated operation names (default: all)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=1.0, help="time budget per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+    selected = set(args.operations.split(",")) if args.operations else None
+
+    results = {}
+    for scale in args.scales.split(","):
+        habits, events = SCALES[scale]
+        print(f"{scale}: {habits} habits, {events} events")
+        results[scale] = run_scale(scale, selected, args.iterations, args.seconds, args.seed)
+        for name, result in results[scale].items():
+            print(f"  {name:<24} {result['ops_per_sec']:>12,.1f} ops/s  p50 {result['p50_ms']:>9.3f} ms"
+                  f"  p99 {result['p99_ms']:>9.3f} ms  peak {result['peak_kib']:>10,.1f} KiB")
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                       "results": results}, file, indent=2)
+        print(f"Saved baseline to {args.baseline}.")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as file:
+        slower = regressions(results, json.load(file)["results"], args.threshold)
+    for scale, name, before, after in slower:
+        print(f"Regression: {scale}/{name} p50 {before:.3f} ms -> {after:.3f} ms ({after / before:.2f}x)")
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
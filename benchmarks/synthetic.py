@@ -0,0 +1,77 @@
+"""Reproducible synthetic habit data for benchmarks.
+
+Run from the project root: python benchmarks/synthetic.py db_name [habits] [events] [seed]
+The same habits, events and seed always give the same database content, for a fixed day to generate up to.
+"""
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from habit_repository import HabitRepository  # noqa: E402
+
+# Periodicities of the generated habits, how often each is picked, and the fewest days between two of its events
+PERIODICITIES = (("Daily", 60, 1), ("Weekly", 20, 7), ("Every 3 days", 10, 3), ("ISO weekly", 6, 7),
+                 ("Monthly", 4, 31))
+
+# Number of events handed to the bulk ingestion at a time
+CHUNK_SIZE = 100_000
+
+def habit_plans(habits, events, seed=0):
+    """Return (name, periodicity, least gap in days, number of events, adherence) for every habit. The events are
+    spread unevenly over the habits, like in real use where a few habits get most check-ins."""
+    rng = random.Random(seed)
+    names, weights, gaps = zip(*PERIODICITIES)
+    picks = rng.choices(range(len(PERIODICITIES)), weights=weights, k=habits)
+    shares = [rng.paretovariate(1.5) for _ in range(habits)]
+    total = sum(shares)
+    return [(f"Habit {number}", names[pick], gaps[pick], round(events * share / total), rng.uniform(0.5, 0.98))
+            for number, (pick, share) in enumerate(zip(picks, shares))]
+
+def habit_events(plan, today, rng):
+    """Yield the (name, date) events of one habit in chronological order, ending at most at today. Each gap is the
+    least gap of the periodicity plus a number of missed periods, which grows as adherence drops. The same goes for
+    the time since the last event, so some habits end up overdue."""
+    name, _, gap, count, adherence = plan
+
+    def missed_periods():
+        missed = 0
+        while rng.random() > adherence and missed < 30:
+            missed += 1
+        return missed
+
+    if count == 0:
+        return
+    steps = [gap * (1 + missed_periods()) for _ in range(count - 1)]
+    day = today - timedelta(days=gap * missed_periods() + sum(steps))
+    for step in steps + [0]:
+        yield name, day
+        day += timedelta(days=step)
+
+def generate(repo, habits=1_000, events=100_000, seed=0, today=None):
+    """Fill the repository with reproducible synthetic habits and events, through the bulk ingestion.
+    Returns the names of the habits."""
+    today = today or date.today()
+    plans = habit_plans(habits, events, seed)
+    repo.add_habits_bulk((name, "Synthetic habit", periodicity) for name, periodicity, *_ in plans)
+
+    rng = random.Random(seed + 1)
+    chunk = []
+    for plan in plans:
+        chunk.extend(habit_events(plan, today, rng))
+        if len(chunk) >= CHUNK_SIZE:
+            repo.add_habit_events_bulk(chunk)
+            chunk = []
+    repo.add_habit_events_bulk(chunk)
+    return [plan[0] for plan in plans]
+
+if __name__ == "__main__":
+    db_name, *arguments = sys.argv[1:]
+    defaults = [1_000, 100_000, 0]
+    habit_count, event_count, seed_value = [int(value) for value in arguments] + defaults[len(arguments):]
+    repository = HabitRepository(db_name, profile="bulk")
+    generate(repository, habit_count, event_count, seed_value)
+    print(f"Generated {habit_count} habits with {len(repository.get_event_batch())} events in {db_name}.")
+    repository.close()
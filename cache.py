@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# Number of entries a cache keeps at most, and seconds an entry stays valid, unless told otherwise. The time to live
+# bounds how long a change made to the same database file by another process can go unnoticed.
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 30.0
+
+# Returned by TTLCache.get for keys that are not cached, as None is a valid cached value
+MISSING = object()
+
+@dataclass(frozen=True)
+class CacheStats:
+    """A data class to represent the counters of a TTLCache since it was created or its stats were last reset."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    size: int = 0
+    max_size: int = 0
+
+    @property
+    def hit_rate(self):
+        """Share of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+class TTLCache:
+    """A thread-safe least recently used cache whose entries expire ttl seconds after they were stored (never if ttl
+    is None). A max_size of 0 disables it. Every invalidation starts a new generation: a value loaded before that is
+    not stored anymore, so a read racing a write cannot bring back what the write changed."""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, time it was stored), least recently used first
+        self._entries = OrderedDict()
+        self.generation = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Set all counters back to 0."""
+        self._hits = self._misses = self._evictions = self._expirations = self._invalidations = 0
+
+    def get(self, key, default=MISSING):
+        """Return the value cached for key and mark it as recently used, or default if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and self._clock() - entry[1] >= self.ttl:
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value, generation=None):
+        """Cache a value, evicting the least recently used entry if the cache is full. If the generation the value
+        was loaded in is given and something was invalidated since, the value may be stale and is not stored."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, *keys):
+        """Drop the entries of the given keys."""
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._invalidations += 1
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self.generation += 1
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """Return the current counters as a CacheStats object."""
+        with self._lock:
+            return CacheStats(hits=self._hits, misses=self._misses, evictions=self._evictions,
+                              expirations=self._expirations, invalidations=self._invalidations,
+                              size=len(self._entries), max_size=self.max_size)
@@ -0,0 +1,14 @@
+import pytest
+from habit_repository import HabitRepository
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Fixture to provide the path of a fresh test db in tmp_path."""
+    return str(tmp_path / "test.db")
+
+@pytest.fixture
+def repo(db_path):
+    """Fixture to create a HabitRepository instance with a db connection to a fresh test db in tmp_path."""
+    repo = HabitRepository(db_name=db_path)
+    yield repo
+    repo.close()
@@ -0,0 +1,87 @@
+import queue
+import threading
+from contextlib import contextmanager
+from database import get_connection
+from instrumentation import metrics
+
+# Number of read connections a pool opens at most, unless told otherwise
+DEFAULT_READERS = 4
+
+def is_memory_database(name):
+    """Check if a database name refers to a private in-memory database, which cannot be shared by connections."""
+    return name in ("", ":memory:") or (name.startswith("file:") and "mode=memory" in name)
+
+class ConnectionPool:
+    """A pool of read connections plus one serialized write connection to the same SQLite database.
+    Any thread may borrow a connection: readers are handed out one thread at a time, the writer is guarded by a lock
+    so writes and the checks they depend on never interleave. In WAL mode readers keep reading while a write commits.
+    In-memory databases get no readers, reads then go through the writer as well."""
+
+    def __init__(self, name="main.db", profile="default", readers=DEFAULT_READERS):
+        self.name = name
+        self.profile = profile
+        # The writer is opened first, so the schema is migrated before any reader connects
+        self.writer_connection = metrics.instrument(get_connection(name, profile, check_same_thread=False))
+        self._write_lock = threading.RLock()
+        self._writer_owner = threading.local()
+        self._max_readers = 0 if is_memory_database(name) else readers
+        self._idle_readers = queue.LifoQueue()
+        self._all_readers = []
+        self._readers_lock = threading.Lock()
+        self.closed = False
+
+    def _open_reader(self):
+        """Open another read connection if the pool has room for it, otherwise return None."""
+        with self._readers_lock:
+            if len(self._all_readers) >= self._max_readers:
+                return None
+            db = metrics.instrument(get_connection(self.name, self.profile, check_same_thread=False))
+            # Guard against writes through a read connection, they would bypass the write lock
+            db.execute("PRAGMA query_only = ON")
+            self._all_readers.append(db)
+            return db
+
+    def holds_writer(self):
+        """Check if the current thread holds the write connection."""
+        return getattr(self._writer_owner, "depth", 0) > 0
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read connection for the duration of a with block."""
+        # In-memory databases, and threads that hold the writer, read through the writer so they see their own writes
+        if self._max_readers == 0 or self.holds_writer():
+            with self.writer() as db:
+                yield db
+            return
+
+        try:
+            db = self._idle_readers.get_nowait()
+        except queue.Empty:
+            # Open a new reader while below the limit, otherwise wait for one to be returned
+            db = self._open_reader() or self._idle_readers.get()
+        try:
+            yield db
+        finally:
+            self._idle_readers.put(db)
+
+    @contextmanager
+    def writer(self):
+        """Hold the write connection exclusively for the duration of a with block. Re-entrant within a thread."""
+        with self._write_lock:
+            self._writer_owner.depth = getattr(self._writer_owner, "depth", 0) + 1
+            try:
+                yield self.writer_connection
+            finally:
+                self._writer_owner.depth -= 1
+
+    def close(self):
+        """Close the writer and all read connections."""
+        if self.closed:
+            return
+        self.closed = True
+        with self._readers_lock:
+            for db in self._all_readers:
+                db.close()
+            self._all_readers.clear()
+        with self._write_lock:
+            self.writer_connection.close()
@@ -1,8 +1,14 @@
 import sqlite3
+from dataclasses import dataclass
 
-def create_tables(db):
-    """Create the necessary tables in the SQLite database."""
-    cur = db.cursor()
+# Current version of the database schema. Bump this and add a migration below whenever the schema changes.
+SCHEMA_VERSION = 10
+
+# Tenant owning the habits of databases created before habits were scoped by user
+DEFAULT_USER = "default"
+
+def _migrate_v1(cur):
+    """Create the original habits and habit_tracker tables."""
 
     # Create habit table with all relevant fields for the habits
     cur.execute("""CREATE TABLE IF NOT EXISTS habits (
@@ -18,13 +24,310 @@ def create_tables(db):
         habitName TEXT,
         FOREIGN KEY (habitName) REFERENCES habits(name))""")
 
-    db.commit()
+def _migrate_v2(cur):
+    """Rebuild habit_tracker with an integer key, a DATE column and a (habitName, date) index."""
 
-def get_connection(name = "main.db"):
-    """Establish a connection to the SQLite database."""
-    db = sqlite3.connect(name)
-    create_tables(db)
-    return db
+    # SQLite cannot alter column types or add a primary key in place, so copy the events into a new table.
+    # date() normalizes stored values to YYYY-MM-DD, values it cannot parse are kept as they are.
+    cur.execute("""CREATE TABLE habit_tracker_v2 (
+        id INTEGER PRIMARY KEY,
+        date DATE NOT NULL,
+        habitName TEXT NOT NULL,
+        FOREIGN KEY (habitName) REFERENCES habits(name))""")
+    cur.execute("""INSERT INTO habit_tracker_v2 (date, habitName)
+        SELECT COALESCE(date(date), date), habitName FROM habit_tracker
+        WHERE date IS NOT NULL AND habitName IS NOT NULL ORDER BY rowid""")
+    cur.execute("DROP TABLE habit_tracker")
+    cur.execute("ALTER TABLE habit_tracker_v2 RENAME TO habit_tracker")
+
+    # Composite index serving per-habit event lookups and the last event date of a habit
+    cur.execute("CREATE INDEX idx_habit_tracker_habit_date ON habit_tracker (habitName, date)")
 
+def _migrate_v3(cur):
+    """Add the longest ever streak of a habit, seeded with its current streak."""
+    cur.execute("ALTER TABLE habits ADD COLUMN longest_streak INTEGER DEFAULT 0")
+    cur.execute("UPDATE habits SET longest_streak = COALESCE(streak, 0)")
 
+def _migrate_v4(cur):
+    """Add the habit_stats table holding materialized analytics per habit, and fill it from the existing data."""
+    cur.execute("""CREATE TABLE habit_stats (
+        habitName TEXT PRIMARY KEY,
+        periodicity TEXT,
+        streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        event_count INTEGER NOT NULL DEFAULT 0,
+        struggle REAL,
+        last_event DATE,
+        next_due DATE,
+        FOREIGN KEY (habitName) REFERENCES habits(name))""")
+
+    # Indexes answering the analyzer's questions without scanning: top streak, top struggle, due and never done
+    cur.execute("CREATE INDEX idx_habit_stats_streak ON habit_stats (streak)")
+    cur.execute("CREATE INDEX idx_habit_stats_struggle ON habit_stats (struggle)")
+    cur.execute("CREATE INDEX idx_habit_stats_next_due ON habit_stats (next_due)")
+    cur.execute("CREATE INDEX idx_habit_stats_never_done ON habit_stats (habitName) WHERE last_event IS NULL")
 
+    cur.execute("""INSERT INTO habit_stats
+        (habitName, periodicity, streak, longest_streak, event_count, struggle, last_event, next_due)
+        SELECT name, periodicity, streak, longest_streak, event_count,
+               CASE WHEN event_count > 0 AND event_count != streak
+                    THEN (event_count - streak) * 1.0 / event_count END,
+               last_event,
+               CASE lower(periodicity) WHEN 'daily' THEN date(last_event, '+1 day')
+                                       WHEN 'weekly' THEN date(last_event, '+7 days') END
+        FROM (SELECT h.name, h.periodicity, COALESCE(h.streak, 0) AS streak,
+                     COALESCE(h.longest_streak, 0) AS longest_streak, COALESCE(h.event_count, 0) AS event_count,
+                     (SELECT MAX(t.date) FROM habit_tracker t WHERE t.habitName = h.name) AS last_event
+              FROM habits h)""")
+
+def _migrate_v5(cur):
+    """Replace the single column habit_stats indexes with leaderboard indexes, overall and per periodicity.
+    The habit name breaks ties, so the top K rows are read straight from an index in a stable order."""
+    cur.execute("DROP INDEX idx_habit_stats_streak")
+    cur.execute("DROP INDEX idx_habit_stats_struggle")
+    for column in ("streak", "longest_streak", "struggle"):
+        cur.execute(f"CREATE INDEX idx_habit_stats_top_{column} ON habit_stats ({column} DESC, habitName)")
+        cur.execute(f"CREATE INDEX idx_habit_stats_top_{column}_by_periodicity"
+                    f" ON habit_stats (periodicity COLLATE NOCASE, {column} DESC, habitName)")
+
+def _migrate_v6(cur):
+    """Give habits a surrogate integer id and make habit_tracker and habit_stats reference it instead of the name.
+    Events and analytics are removed together with their habit through ON DELETE CASCADE."""
+    cur.execute("""CREATE TABLE habits_v6 (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        periodicity TEXT,
+        streak INTEGER DEFAULT 0,
+        event_count INTEGER DEFAULT 0,
+        longest_streak INTEGER DEFAULT 0)""")
+    cur.execute("""INSERT INTO habits_v6 (name, description, periodicity, streak, event_count, longest_streak)
+        SELECT name, description, periodicity, streak, event_count, longest_streak FROM habits
+        WHERE name IS NOT NULL ORDER BY rowid""")
+
+    # Events of habits that no longer exist cannot reference an id and are dropped
+    cur.execute("""CREATE TABLE habit_tracker_v6 (
+        id INTEGER PRIMARY KEY,
+        habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+        date DATE NOT NULL)""")
+    cur.execute("""INSERT INTO habit_tracker_v6 (id, habit_id, date)
+        SELECT t.id, h.id, t.date FROM habit_tracker t JOIN habits_v6 h ON h.name = t.habitName ORDER BY t.id""")
+
+    cur.execute("""CREATE TABLE habit_stats_v6 (
+        habit_id INTEGER PRIMARY KEY REFERENCES habits(id) ON DELETE CASCADE,
+        periodicity TEXT,
+        streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        event_count INTEGER NOT NULL DEFAULT 0,
+        struggle REAL,
+        last_event DATE,
+        next_due DATE)""")
+    cur.execute("""INSERT INTO habit_stats_v6
+        (habit_id, periodicity, streak, longest_streak, event_count, struggle, last_event, next_due)
+        SELECT h.id, s.periodicity, s.streak, s.longest_streak, s.event_count, s.struggle, s.last_event, s.next_due
+        FROM habit_stats s JOIN habits_v6 h ON h.name = s.habitName""")
+
+    # Dropping the old tables drops their indexes as well
+    for table in ("habit_stats", "habit_tracker", "habits"):
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_v6 RENAME TO {table}")
+
+    cur.execute("CREATE INDEX idx_habit_tracker_habit_date ON habit_tracker (habit_id, date)")
+    cur.execute("CREATE INDEX idx_habit_stats_next_due ON habit_stats (next_due)")
+    cur.execute("CREATE INDEX idx_habit_stats_never_done ON habit_stats (habit_id) WHERE last_event IS NULL")
+    for column in ("streak", "longest_streak", "struggle"):
+        cur.execute(f"CREATE INDEX idx_habit_stats_top_{column} ON habit_stats ({column} DESC, habit_id)")
+        cur.execute(f"CREATE INDEX idx_habit_stats_top_{column}_by_periodicity"
+                    f" ON habit_stats (periodicity COLLATE NOCASE, {column} DESC, habit_id)")
+
+def _migrate_v7(cur):
+    """Scope habits by user: a habit name only has to be unique per user. habit_stats carries the user as well, and
+    all of its indexes lead with it, so every analytics query of one user only reads that user's index range."""
+    cur.execute(f"""CREATE TABLE habits_v7 (
+        id INTEGER PRIMARY KEY,
+        user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}',
+        name TEXT NOT NULL,
+        description TEXT,
+        periodicity TEXT,
+        streak INTEGER DEFAULT 0,
+        event_count INTEGER DEFAULT 0,
+        longest_streak INTEGER DEFAULT 0,
+        UNIQUE (user_id, name))""")
+    cur.execute("""INSERT INTO habits_v7 (id, name, description, periodicity, streak, event_count, longest_streak)
+        SELECT id, name, description, periodicity, streak, event_count, longest_streak FROM habits ORDER BY id""")
+
+    # Foreign keys are off while migrating, so the events and analytics keep referencing the same ids
+    cur.execute("DROP TABLE habits")
+    cur.execute("ALTER TABLE habits_v7 RENAME TO habits")
+
+    cur.execute(f"ALTER TABLE habit_stats ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}'")
+    cur.execute("DROP INDEX idx_habit_stats_next_due")
+    cur.execute("DROP INDEX idx_habit_stats_never_done")
+    cur.execute("CREATE INDEX idx_habit_stats_next_due ON habit_stats (user_id, next_due)")
+    cur.execute("CREATE INDEX idx_habit_stats_never_done ON habit_stats (user_id, habit_id) WHERE last_event IS NULL")
+    for column in ("streak", "longest_streak", "struggle"):
+        cur.execute(f"DROP INDEX idx_habit_stats_top_{column}")
+        cur.execute(f"DROP INDEX idx_habit_stats_top_{column}_by_periodicity")
+        cur.execute(f"CREATE INDEX idx_habit_stats_top_{column} ON habit_stats (user_id, {column} DESC, habit_id)")
+        cur.execute(f"CREATE INDEX idx_habit_stats_top_{column}_by_periodicity"
+                    f" ON habit_stats (user_id, periodicity COLLATE NOCASE, {column} DESC, habit_id)")
+
+def _migrate_v8(cur):
+    """Add the habit_week_rollup table holding the completions of every habit per ISO week: a bitmap of the weekdays
+    it was completed on (bit 0 is Monday) and the number of events. Range analytics read one row per week instead of
+    every event. Filled from the existing events, dates that are not valid are left out."""
+    cur.execute("""CREATE TABLE habit_week_rollup (
+        habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+        week_start DATE NOT NULL,
+        days INTEGER NOT NULL DEFAULT 0,
+        completions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (habit_id, week_start)) WITHOUT ROWID""")
+    # Every weekday has its own bit, so the sum of the distinct bits of a week is their bitwise or
+    cur.execute("""INSERT INTO habit_week_rollup (habit_id, week_start, days, completions)
+        SELECT habit_id, date(date, '-' || weekday || ' days'), SUM(DISTINCT 1 << weekday), COUNT(*)
+        FROM (SELECT habit_id, date, (strftime('%w', date) + 6) % 7 AS weekday FROM habit_tracker
+              WHERE date(date) IS NOT NULL)
+        GROUP BY 1, 2""")
+
+def _migrate_v9(cur):
+    """Add the append-only event_log of all writes, numbered by seq, and snapshots of the state of every habit at a
+    position of the log. Log entries and snapshots outlive the habits they describe. The existing habits become
+    snapshot 0, so replaying the log always starts from a snapshot."""
+    cur.execute("""CREATE TABLE event_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        habit_id INTEGER,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        logged_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)""")
+    cur.execute("CREATE INDEX idx_event_log_user ON event_log (user_id, seq)")
+    cur.execute("""CREATE TABLE log_snapshots (
+        seq INTEGER PRIMARY KEY,
+        taken_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)""")
+    cur.execute("""CREATE TABLE habit_snapshots (
+        snapshot_seq INTEGER NOT NULL REFERENCES log_snapshots(seq) ON DELETE CASCADE,
+        habit_id INTEGER NOT NULL,
+        user_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        periodicity TEXT,
+        streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        event_count INTEGER NOT NULL DEFAULT 0,
+        last_event DATE,
+        PRIMARY KEY (snapshot_seq, habit_id)) WITHOUT ROWID""")
+    cur.execute("INSERT INTO log_snapshots (seq) VALUES (0)")
+    cur.execute("""INSERT INTO habit_snapshots (snapshot_seq, habit_id, user_id, name, description, periodicity, streak,
+                                                longest_streak, event_count, last_event)
+        SELECT 0, h.id, h.user_id, h.name, h.description, h.periodicity, COALESCE(h.streak, 0),
+               COALESCE(h.longest_streak, 0), COALESCE(h.event_count, 0),
+               (SELECT MAX(t.date) FROM habit_tracker t WHERE t.habit_id = h.id)
+        FROM habits h""")
+
+def _migrate_v10(cur):
+    """Record in habit_stats the due date each habit was last reminded of, so a reminder is only sent once, also over
+    separate runs of the scheduler."""
+    cur.execute("ALTER TABLE habit_stats ADD COLUMN reminded_due DATE")
+
+# Migrations by the schema version they upgrade to, applied in order
+MIGRATIONS = {
+    1: _migrate_v1,
+    2: _migrate_v2,
+    3: _migrate_v3,
+    4: _migrate_v4,
+    5: _migrate_v5,
+    6: _migrate_v6,
+    7: _migrate_v7,
+    8: _migrate_v8,
+    9: _migrate_v9,
+    10: _migrate_v10,
+}
+
+def get_schema_version(db):
+    """Return the schema version recorded in the database."""
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db):
+    """Upgrade the database schema in place to SCHEMA_VERSION. Each migration runs in its own transaction."""
+    version = get_schema_version(db)
+
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than supported version {SCHEMA_VERSION}.")
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        cur = db.cursor()
+        cur.execute("BEGIN")
+        try:
+            MIGRATIONS[target](cur)
+            # PRAGMA does not accept bound parameters, target is always an int from MIGRATIONS
+            cur.execute(f"PRAGMA user_version = {int(target)}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+def create_tables(db):
+    """Create the necessary tables in the SQLite database, or upgrade them to the current schema."""
+    migrate(db)
+
+@dataclass(frozen=True)
+class ConnectionProfile:
+    """A data class to represent the SQLite settings a connection is opened with."""
+    # Write-ahead logging lets readers keep reading while a writer commits
+    journal_mode: str = "WAL"
+    # NORMAL is safe in WAL mode and only syncs at checkpoints instead of on every commit
+    synchronous: str = "NORMAL"
+    # Page cache size, negative values are in KiB
+    cache_size: int = -64000
+    # Bytes of the database file read through memory mapping instead of read() calls
+    mmap_size: int = 256 * 1024 * 1024
+    # Seconds to wait for a lock held by another connection before raising "database is locked"
+    busy_timeout: float = 5.0
+    # Number of prepared statements kept per connection by the sqlite3 module
+    cached_statements: int = 256
+
+# Named connection profiles, selectable by the repository and the CLI
+PROFILES = {
+    # Concurrent dashboards and ingestion
+    "default": ConnectionProfile(),
+    # Sync every commit to disk, for machines that may lose power
+    "durable": ConnectionProfile(synchronous="FULL"),
+    # One-off imports and recomputes, trades durability of the last commits for speed
+    "bulk": ConnectionProfile(synchronous="OFF", cache_size=-256000),
+    # Plain SQLite defaults, a rollback journal and no tuning
+    "compat": ConnectionProfile(journal_mode="DELETE", synchronous="FULL", cache_size=-2000, mmap_size=0,
+                                cached_statements=128),
+}
+
+def get_profile(profile):
+    """Return the ConnectionProfile for a profile name, or the profile itself if one is passed in."""
+    if isinstance(profile, ConnectionProfile):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown connection profile '{profile}', expected one of {', '.join(PROFILES)}.")
+    return PROFILES[profile]
+
+def configure_connection(db, profile):
+    """Apply the settings of a ConnectionProfile to an open connection."""
+    # PRAGMA does not accept bound parameters, the values come from a ConnectionProfile and not from user input
+    db.execute(f"PRAGMA journal_mode = {profile.journal_mode}")
+    db.execute(f"PRAGMA synchronous = {profile.synchronous}")
+    db.execute(f"PRAGMA cache_size = {int(profile.cache_size)}")
+    db.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+    db.execute(f"PRAGMA busy_timeout = {int(profile.busy_timeout * 1000)}")
+
+def get_connection(name = "main.db", profile = "default", check_same_thread = True):
+    """Establish a connection to the SQLite database, tuned with the given connection profile."""
+    profile = get_profile(profile)
+    db = sqlite3.connect(name, timeout=profile.busy_timeout, cached_statements=profile.cached_statements,
+                         check_same_thread=check_same_thread)
+    configure_connection(db, profile)
+
+    # Only run the migrations if the schema is not current, the common case costs a single PRAGMA read
+    if get_schema_version(db) != SCHEMA_VERSION:
+        create_tables(db)
+
+    # Enforce the foreign keys, so deleting a habit cascades to its events and analytics.
+    # This is a no-op inside a transaction, so it is switched on after the migrations.
+    db.execute("PRAGMA foreign_keys = ON")
+    return db
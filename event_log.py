@@ -0,0 +1,209 @@
+import json
+import sys
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Optional
+from habit_stats import rebuild_stats
+from results import HABIT_ADDED, HABIT_RENAMED, HABIT_DELETED, DATABASE_CLEARED, EVENT_ADDED
+
+# Kinds of log entries besides the outcome codes of the writes they record
+STREAK_RESET = "streak_reset"
+STREAKS_RECOMPUTED = "streaks_recomputed"
+
+# Number of log entries after the latest snapshot from which checkpoint() takes a new one
+SNAPSHOT_INTERVAL = 10_000
+
+# Number of snapshots compact() keeps. The log entries after the oldest kept snapshot stay as the audit trail.
+KEEP_SNAPSHOTS = 2
+
+# Columns of the event_log table, in the order entry_from_row expects them
+LOG_COLUMNS = "seq, user_id, habit_id, kind, payload, logged_at"
+
+# Columns of the habit_snapshots table holding the state of a habit, in the order of HabitState
+SNAPSHOT_COLUMNS = "habit_id, user_id, name, description, periodicity, streak, longest_streak, event_count, last_event"
+
+# Counters of a habit that entries recording events and recomputes carry as they were after the write
+COUNTERS = ("streak", "longest_streak", "event_count")
+
+@dataclass(frozen=True)
+class LogEntry:
+    """A data class to represent one write recorded in the event_log table. Entries of writes to one habit carry its
+    habit_id; the payload holds what the write changed, as it was after the write."""
+    __slots__ = ("seq", "user_id", "habit_id", "kind", "payload", "logged_at")
+    seq: int
+    user_id: str
+    habit_id: Optional[int]
+    kind: str
+    payload: dict
+    logged_at: str
+
+@dataclass
+class HabitState:
+    """A data class to represent a habit as the event log knows it, parallel to the habit_snapshots table in the db."""
+    habit_id: int
+    user_id: str
+    name: str
+    description: Optional[str]
+    periodicity: Optional[str]
+    streak: int = 0
+    longest_streak: int = 0
+    event_count: int = 0
+    last_event: Optional[date] = None
+
+@dataclass
+class Replay:
+    """A data class to represent the state of all habits after replaying the log: the snapshot it started from, the
+    number of entries replayed after it, the seq of the last one and the HabitState of every habit by id."""
+    snapshot_seq: int
+    entries: int
+    seq: int
+    habits: Dict[int, HabitState]
+
+def counters(habit):
+    """Return the counters of a HabitTracker object as a log entry payload."""
+    return {counter: getattr(habit, counter) for counter in COUNTERS}
+
+def append(db, entries):
+    """Append (user_id, habit_id, kind, payload) entries to the log. Runs inside the caller's transaction, so every
+    entry is committed or rolled back together with the write it records."""
+    db.executemany("INSERT INTO event_log (user_id, habit_id, kind, payload) VALUES (?, ?, ?, ?)",
+                   [(user_id, habit_id, kind, json.dumps(payload, separators=(",", ":")))
+                    for user_id, habit_id, kind, payload in entries])
+
+def entry_from_row(row):
+    """Build a LogEntry object from a row selected with LOG_COLUMNS."""
+    return LogEntry(seq=row[0], user_id=row[1], habit_id=row[2], kind=row[3], payload=json.loads(row[4]),
+                    logged_at=row[5])
+
+def apply(habits, entry):
+    """Apply a LogEntry to the HabitState objects by habit id."""
+    payload = entry.payload
+    if entry.kind == HABIT_ADDED:
+        habits[entry.habit_id] = HabitState(entry.habit_id, entry.user_id, payload["name"], payload["description"],
+                                            payload["periodicity"], payload["streak"], payload["streak"])
+    elif entry.kind == DATABASE_CLEARED:
+        for habit_id in [habit_id for habit_id, state in habits.items() if state.user_id == entry.user_id]:
+            del habits[habit_id]
+    elif entry.habit_id in habits:
+        state = habits[entry.habit_id]
+        if entry.kind == HABIT_RENAMED:
+            state.name = payload["name"]
+        elif entry.kind == HABIT_DELETED:
+            del habits[entry.habit_id]
+        elif entry.kind == STREAK_RESET:
+            state.streak = 0
+        elif entry.kind in (EVENT_ADDED, STREAKS_RECOMPUTED):
+            for counter in COUNTERS:
+                setattr(state, counter, payload[counter])
+            if entry.kind == EVENT_ADDED:
+                # Habits without a schedule accept backdated events, the last event is the latest date
+                latest = date.fromisoformat(max(payload["dates"]))
+                state.last_event = max(state.last_event, latest) if state.last_event else latest
+
+def latest_snapshot(db):
+    """Return the seq of the latest snapshot."""
+    return db.execute("SELECT MAX(seq) FROM log_snapshots").fetchone()[0]
+
+def replay(db, user_id=None):
+    """Rebuild the state of all habits, or of the habits of one user, from the latest snapshot and the log entries
+    after it. The cost depends on the entries since the snapshot, not on the whole history. Returns a Replay."""
+    scope, params = (" AND user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    snapshot_seq = latest_snapshot(db)
+    habits = {}
+    for row in db.execute(f"SELECT {SNAPSHOT_COLUMNS} FROM habit_snapshots WHERE snapshot_seq = ?{scope}",
+                          (snapshot_seq, *params)):
+        habits[row[0]] = HabitState(*row[:8], last_event=date.fromisoformat(row[8]) if row[8] else None)
+
+    # The cursor streams the entries, so memory only grows with the number of habits
+    replayed = Replay(snapshot_seq, 0, snapshot_seq, habits)
+    for row in db.execute(f"SELECT {LOG_COLUMNS} FROM event_log WHERE seq > ?{scope} ORDER BY seq",
+                          (snapshot_seq, *params)):
+        entry = entry_from_row(row)
+        apply(habits, entry)
+        replayed.entries += 1
+        replayed.seq = entry.seq
+    return replayed
+
+def take_snapshot(repo):
+    """Replay the log of all users from the latest snapshot and store the result as a snapshot at the last entry, so
+    later replays start from there. Nothing is stored if no entry was added since. Returns the Replay."""
+    with repo.pool.writer() as db:
+        replayed = replay(db)
+        if replayed.entries:
+            with db:
+                db.execute("INSERT INTO log_snapshots (seq) VALUES (?)", (replayed.seq,))
+                db.executemany(f"INSERT INTO habit_snapshots (snapshot_seq, {SNAPSHOT_COLUMNS})"
+                               f" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               [(replayed.seq, state.habit_id, state.user_id, state.name, state.description,
+                                 state.periodicity, state.streak, state.longest_streak, state.event_count,
+                                 state.last_event.isoformat() if state.last_event else None)
+                                for state in replayed.habits.values()])
+    return replayed
+
+def compact(repo, keep_snapshots=KEEP_SNAPSHOTS):
+    """Drop all but the latest keep_snapshots snapshots, and the log entries up to the oldest snapshot kept, which no
+    replay needs anymore. Returns the number of log entries dropped."""
+    if keep_snapshots < 1:
+        raise ValueError("At least the latest snapshot has to be kept.")
+    with repo.pool.writer() as db:
+        with db:
+            oldest = db.execute("SELECT MIN(seq) FROM (SELECT seq FROM log_snapshots ORDER BY seq DESC LIMIT ?)",
+                                (keep_snapshots,)).fetchone()[0]
+            dropped = db.execute("DELETE FROM event_log WHERE seq <= ?", (oldest,)).rowcount
+            # The habit rows of the dropped snapshots go with them through ON DELETE CASCADE
+            db.execute("DELETE FROM log_snapshots WHERE seq < ?", (oldest,))
+    return dropped
+
+def checkpoint(repo, interval=SNAPSHOT_INTERVAL, keep_snapshots=KEEP_SNAPSHOTS):
+    """Take a snapshot and compact the log once interval entries were added since the latest snapshot, e.g. nightly
+    from cron. Returns the Replay of the new snapshot, or None if none was due."""
+    with repo.pool.writer() as db:
+        pending = db.execute("SELECT COUNT(*) FROM event_log WHERE seq > (SELECT MAX(seq) FROM log_snapshots)")\
+            .fetchone()[0]
+    if pending < interval:
+        return None
+    replayed = take_snapshot(repo)
+    compact(repo, keep_snapshots)
+    return replayed
+
+def recover(repo, dry_run=False):
+    """Replay the log of the repository's user from the latest snapshot and write the result back to the habits
+    table and its analytics. Counters that went wrong are repaired and lost habit rows come back; events are not
+    touched. Returns the names of the habits whose row differed from the log, with dry_run without writing."""
+    with repo.pool.writer() as db:
+        replayed = replay(db, repo.user_id)
+        current = {habit.habit_id: (habit.name, habit.description, habit.periodicity, habit.streak,
+                                    habit.longest_streak, habit.event_count) for habit in repo.get_all_habits()}
+        rows = [(state.habit_id, state.user_id, state.name, state.description, state.periodicity, state.streak,
+                 state.longest_streak, state.event_count) for state in replayed.habits.values()]
+        diverged = [row for row in rows if current.get(row[0]) != row[2:]]
+        if diverged and not dry_run:
+            with db:
+                db.executemany("""INSERT INTO habits (id, user_id, name, description, periodicity, streak,
+                                                      longest_streak, event_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET name = excluded.name, description = excluded.description,
+                        periodicity = excluded.periodicity, streak = excluded.streak,
+                        longest_streak = excluded.longest_streak, event_count = excluded.event_count""", diverged)
+                rebuild_stats(db, repo.user_id)
+            repo.cache.clear()
+    return [row[2] for row in diverged]
+
+if __name__ == "__main__":
+    # Maintain the event log from the command line, e.g. nightly from cron:
+    # python event_log.py checkpoint|snapshot|compact|recover|verify [db_name] [user_id]
+    from database import DEFAULT_USER
+    from habit_repository import HabitRepository
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "checkpoint"
+    repository = HabitRepository(sys.argv[2] if len(sys.argv) > 2 else "main.db",
+                                 user_id=sys.argv[3] if len(sys.argv) > 3 else DEFAULT_USER)
+    if command in ("checkpoint", "snapshot"):
+        snapshot = checkpoint(repository) if command == "checkpoint" else take_snapshot(repository)
+        print(f"Snapshot at {snapshot.seq} after replaying {snapshot.entries} log entries." if snapshot
+              else "No snapshot due.")
+    elif command == "compact":
+        print(f"Dropped {compact(repository)} log entries.")
+    else:
+        names = recover(repository, dry_run=command == "verify")
+        print(f"{'Repaired' if command == 'recover' else 'Diverged from the log'}: {', '.join(names) or 'none'}.")
+    repository.close()
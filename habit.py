@@ -1,19 +1,27 @@
-from datetime import date, datetime, timedelta
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+from periodicity import parse_periodicity
 
 class HabitTracker:
     """Class to track habits with periodicity, streaks, and event counts. A data class with local logic representing
     habits in the habit_tracker table in the db."""
+    __slots__ = ("name", "description", "periodicity", "streak", "event_count", "longest_streak", "habit_id")
 
-    def __init__(self, name: str, description: str, periodicity: str = "daily", streak: int = 0, event_count: int = 0):
+    def __init__(self, name: str, description: str, periodicity: str = "daily", streak: int = 0, event_count: int = 0,
+                 longest_streak: int = 0, habit_id: int = None):
+        self.habit_id = habit_id
         self.name = name
         self.description = description
         self.periodicity = periodicity
         self.streak = streak
         self.event_count = event_count
+        self.longest_streak = max(longest_streak, streak)
 
     def increment_streak(self):
-        """Increment the streak count for the habit."""
+        """Increment the streak count for the habit and keep track of the longest streak."""
         self.streak += 1
+        self.longest_streak = max(self.longest_streak, self.streak)
 
     def increment_event(self):
         """Increment the event count for the habit."""
@@ -23,28 +31,36 @@ class HabitTracker:
         """Reset the streak count for the habit."""
         self.streak = 0
 
-    def should_reset_streak(self, last_event_date: date):
+    @property
+    def schedule(self):
+        """The Periodicity the habit follows, parsed from its periodicity text."""
+        return parse_periodicity(self.periodicity)
+
+    def should_reset_streak(self, last_event_date: date, today: date = None):
         """Check if the streak should be reset based on periodicity and last event date.
-           Returns True if the streak should be reset, False otherwise.
+           Returns True if the streak should be reset, False otherwise. today defaults to the current date,
+           bulk ingestion passes the date of the event being replayed instead.
         """
-        today = datetime.now().date()
+        today = today or datetime.now().date()
 
-        # Check if there is an event date to compare against
-        if last_event_date:
-            if self.periodicity.lower() == "daily":
-                return (today - last_event_date) > timedelta(days=1)
-            elif self.periodicity.lower() == "weekly":
-                return (today - last_event_date) > timedelta(weeks=1)
-        return False
+        # Check if a whole period was missed since the last event
+        return self.schedule.breaks_streak(last_event_date, today)
 
     def event_too_soon(self, last_event_date, event_date: date):
         """Check if the user is trying to add another habit event too soon."""
+        return self.schedule.event_too_soon(last_event_date, event_date)
+
 
-        # Calculate the difference in days between the last event date and the new event date
-        delta = (event_date - last_event_date).days
+@dataclass(frozen=True)
+class OverdueHabit:
+    """A data class to represent a habit that is overdue, together with the date it was last completed."""
+    __slots__ = ("name", "periodicity", "last_event_date")
+    name: str
+    periodicity: str
+    last_event_date: Optional[date]
 
-        if self.periodicity.lower() == "daily":
-            return delta < 1
-        elif self.periodicity.lower() == "weekly":
-            return delta < 7
-        return False
+    def days_since_last_event(self, today: date):
+        """Return the number of days since the last completion, or None if the habit was never completed."""
+        if self.last_event_date is None:
+            return None
+        return (today - self.last_event_date).days
@@ -1,7 +1,84 @@
-from datetime import datetime
+from array import array
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List
 
+@dataclass(frozen=True)
 class HabitEvent:
     """A data class to represent habit events parallel to the habit_tracker table in the db"""
-    def __init__(self, completed_at: datetime, habit_name: str):
-        self.completed_at = completed_at
-        self.habit_name = habit_name
+    __slots__ = ("completed_at", "habit_name")
+    completed_at: date
+    habit_name: str
+
+class EventBatch:
+    """A columnar batch of habit events. Day ordinals (date.toordinal()) and habit ids are kept in array('i'),
+    every habit name is stored once and events refer to it by its id, the index into habit_names.
+    Costs 8 bytes per event instead of a HabitEvent object and needs no date parsing."""
+    __slots__ = ("habit_names", "habit_ids", "ordinals", "_ids_by_name")
+
+    def __init__(self):
+        self.habit_names = []
+        self.habit_ids = array("i")
+        self.ordinals = array("i")
+        self._ids_by_name = {}
+
+    def habit_id(self, habit_name: str):
+        """Return the id of a habit name in this batch, interning the name the first time it is seen."""
+        habit_id = self._ids_by_name.get(habit_name)
+        if habit_id is None:
+            habit_id = self._ids_by_name[habit_name] = len(self.habit_names)
+            self.habit_names.append(habit_name)
+        return habit_id
+
+    def append(self, habit_name: str, completed_at: date):
+        """Add a single event to the batch."""
+        self.habit_ids.append(self.habit_id(habit_name))
+        self.ordinals.append(completed_at.toordinal())
+
+    def extend(self, habit_name: str, ordinals):
+        """Add many events of one habit, given as an iterable or array of day ordinals."""
+        ordinals = ordinals if isinstance(ordinals, array) and ordinals.typecode == "i" else array("i", ordinals)
+        self.ordinals.extend(ordinals)
+        self.habit_ids.extend(array("i", [self.habit_id(habit_name)]) * len(ordinals))
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __iter__(self):
+        """Iterate over the events of the batch as HabitEvent objects."""
+        for habit_id, ordinal in zip(self.habit_ids, self.ordinals):
+            yield HabitEvent(completed_at=date.fromordinal(ordinal), habit_name=self.habit_names[habit_id])
+
+# Reasons a habit event can be rejected by the bulk ingestion
+REJECT_UNKNOWN_HABIT = "unknown_habit"
+REJECT_INVALID_DATE = "invalid_date"
+REJECT_FUTURE_DATE = "future_date"
+REJECT_TOO_SOON = "too_soon"
+
+@dataclass(frozen=True)
+class RejectedEvent:
+    """A data class to represent an input row the bulk ingestion did not accept, and why."""
+    __slots__ = ("index", "habit_name", "event_date", "reason")
+    index: int
+    habit_name: str
+    event_date: object
+    reason: str
+
+@dataclass
+class BulkIngestReport:
+    """A data class to represent the outcome of a bulk event ingestion. Every input row is either counted as
+    accepted or listed in rejected with its position in the input."""
+    accepted: int = 0
+    rejected: List[RejectedEvent] = field(default_factory=list)
+    streak_resets: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def total(self):
+        """Number of input rows processed."""
+        return self.accepted + len(self.rejected)
+
+    @property
+    def rows_per_second(self):
+        """Ingestion throughput over all processed rows."""
+        return self.total / self.elapsed if self.elapsed else 0.0
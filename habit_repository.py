@@ -1,9 +1,24 @@
+import copy
+from array import array
 from datetime import date
-from database import get_connection
-import rich
-from habit_event import HabitEvent
-from habit import HabitTracker
-from datetime import datetime, timedelta
+from functools import wraps
+from cache import TTLCache, MISSING, DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL
+from connection_pool import ConnectionPool, DEFAULT_READERS
+from database import DEFAULT_USER
+from event_log import LOG_COLUMNS, STREAK_RESET, append, counters, entry_from_row
+from habit_event import (HabitEvent, EventBatch, BulkIngestReport, RejectedEvent, REJECT_UNKNOWN_HABIT,
+                         REJECT_INVALID_DATE, REJECT_FUTURE_DATE, REJECT_TOO_SOON)
+from habit import HabitTracker, OverdueHabit
+from instrumentation import metrics, timed
+from habit_stats import STATS_SELECT, stats_from_row, write_stats
+from rollups import ROLLUP_SELECT, add_to_rollups, rollup_from_row, week_start
+from periodicity import check_periodicity
+from renderers import get_renderer
+from results import (outcome, HABIT_ADDED, HABIT_RENAMED, HABIT_DELETED, DATABASE_CLEARED, EVENT_ADDED,
+                     HABIT_NOT_FOUND, HABIT_EXISTS, EMPTY_NAME, INVALID_PERIODICITY, INVALID_DATE, FUTURE_DATE,
+                     TOO_SOON)
+from datetime import datetime
+import time
 
 def get_valid_date(event_date):
     """Validate the event date format. If the date is empty, return today's date."""
@@ -12,156 +27,309 @@ def get_valid_date(event_date):
     if not event_date or not event_date.strip():
         return date.today()
     try:
+        # Canonical YYYY-MM-DD strings take the fast C parser, anything else the lenient strptime format
+        if len(event_date) == 10 and event_date[4] == "-" and event_date[7] == "-":
+            return date.fromisoformat(event_date)
+        metrics.count("get_valid_date.strptime")
         return datetime.strptime(event_date, "%Y-%m-%d").date()
     except ValueError:
         return None
 
+def parse_stored_date(value):
+    """Turn a date stored in the db into a date object. Values that are not valid dates are returned unchanged."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+
+# Columns of the habits table in the order habit_from_row expects them
+HABIT_COLUMNS = "id, name, description, periodicity, streak, event_count, longest_streak"
+
+def habit_from_row(row):
+    """Build a HabitTracker object from a habits row selected with HABIT_COLUMNS."""
+    return HabitTracker(habit_id=row[0], name=row[1], description=row[2], periodicity=row[3], streak=row[4],
+                        event_count=row[5], longest_streak=row[6])
+
+# Subquery turning user and habit name parameters into the habit id, the event and analytics tables reference habits
+# by id. Served by the unique (user_id, name) index.
+HABIT_ID_BY_NAME = "(SELECT id FROM habits WHERE user_id = ? AND name = ?)"
+
+# Leaderboards offered by get_leaderboard and the habit_stats column each one is ranked by
+LEADERBOARD_COLUMNS = {"streak": "streak", "longest_streak": "longest_streak", "struggle": "struggle"}
+
+# Number of rows fetched per round trip when streaming habit events
+EVENT_BATCH_SIZE = 1000
+
+# Number of habit ids looked up per statement by get_stats
+STATS_CHUNK_SIZE = 500
+
+# julianday() of 0001-01-01 minus one, turns SQLite dates into date.toordinal() day numbers
+JULIANDAY_ORDINAL_OFFSET = 1721424.5
+
+def shard_filter(shard):
+    """Build the condition and parameters selecting one shard (index, count) of the habits aliased h, if any."""
+    if shard is None:
+        return "", ()
+    index, count = shard
+    return " AND h.id % ? = ?", (count, index)
+
+def serialized_write(method):
+    """Decorator holding the write connection for the whole repository method, so the checks a write depends on
+    and the write itself are never interleaved with another thread's write."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.pool.writer():
+            try:
+                return method(self, *args, **kwargs)
+            except BaseException:
+                # Reads through the writer may have cached changes the failed write rolled back
+                self.cache.clear()
+                raise
+    return wrapper
+
 class HabitRepository:
     """The most important class of this project. Repository class to manage habits and their events in the database.
     get initialized with a database connection and provides methods to add, delete, and list habits and their events."""
 
-    def __init__(self, db_name="main.db"):
-        """Initialize the repository with a database connection."""
-        self.db = get_connection(db_name)
+    def __init__(self, db_name="main.db", profile="default", readers=DEFAULT_READERS, renderer="quiet",
+                 user_id=DEFAULT_USER, cache_size=DEFAULT_CACHE_SIZE, cache_ttl=DEFAULT_CACHE_TTL):
+        """Initialize the repository with a pool of database connections, opened with the given connection profile
+        (a name from database.PROFILES or a ConnectionProfile). The repository can be shared by several threads.
+        Outcomes of writes and the list_* views go to the renderer (a name from renderers.RENDERERS or a Renderer),
+        by default nothing is rendered. All habits read and written belong to the user user_id.
+        Habit lookups by name and last event dates are cached, up to cache_size entries for cache_ttl seconds each
+        (see cache.TTLCache); a cache_size of 0 turns the cache off."""
+        self.pool = ConnectionPool(db_name, profile, readers)
+        self.renderer = get_renderer(renderer)
+        self.user_id = user_id
+        self.cache = TTLCache(cache_size, cache_ttl)
+
+    def for_user(self, user_id):
+        """Return a repository for the habits of another user of the same database. It shares the connection pool,
+        the cache and the renderer of this repository, so it is cheap to create per request and must not be closed on
+        its own."""
+        scoped = copy.copy(self)
+        scoped.user_id = user_id
+        return scoped
+
+    @property
+    def db(self):
+        """The write connection. Hold pool.writer() when using it directly while other threads use the repository."""
+        return self.pool.writer_connection
+
+    def _query(self, sql, params=()):
+        """Run a read query on a pooled read connection and return all rows."""
+        with self.pool.reader() as db:
+            if not metrics.enabled:
+                return db.execute(sql, params).fetchall()
+            start = time.perf_counter()
+            rows = db.execute(sql, params).fetchall()
+            metrics.observe_query(sql, time.perf_counter() - start, len(rows))
+            return rows
+
+    def _cached(self, kind, name, load):
+        """Return the cached value of kind ("habit" or "last_event") for a habit of the user, or load and cache it.
+        Writes check against fresh values, another process may have changed the database since they were cached."""
+        key = (kind, self.user_id, name)
+        value = self.cache.get(key) if not self.pool.holds_writer() else MISSING
+        if value is MISSING:
+            generation = self.cache.generation
+            value = load()
+            self.cache.put(key, value, generation)
+        return value
+
+    def _invalidate(self, *names):
+        """Drop the cached lookups of habits of the user once a committed write changed them."""
+        self.cache.invalidate(*[(kind, self.user_id, name) for name in names for kind in ("habit", "last_event")])
+
+    def _report(self, result):
+        """Hand the Outcome of a write to the renderer and return it."""
+        self.renderer.outcome(result)
+        return result
+
+    def _query_one(self, sql, params=()):
+        """Run a read query on a pooled read connection and return the first row, or None."""
+        with self.pool.reader() as db:
+            if not metrics.enabled:
+                return db.execute(sql, params).fetchone()
+            start = time.perf_counter()
+            row = db.execute(sql, params).fetchone()
+            metrics.observe_query(sql, time.perf_counter() - start, 0 if row is None else 1)
+            return row
+
+    @serialized_write
+    def rename_habit(self, name, new_name):
+        """Rename a habit. Events and analytics reference the habit by id, so they follow without being rewritten.
+        Returns an Outcome."""
+        cur = self.db.cursor()
+
+        # If the habit does not exist, report an error
+        habits = self.get_one_habit(name)
+        if not habits:
+            return self._report(outcome("rename_habit", HABIT_NOT_FOUND, name))
+
+        # The new name must be valid and free
+        if new_name is None or new_name.strip() == "":
+            return self._report(outcome("rename_habit", EMPTY_NAME, name))
+        if self.get_one_habit(new_name):
+            return self._report(outcome("rename_habit", HABIT_EXISTS, name, new_name=new_name))
 
+        cur.execute("UPDATE habits SET name = ? WHERE user_id = ? AND name = ?", (new_name, self.user_id, name))
+        append(self.db, [(self.user_id, habits[0].habit_id, HABIT_RENAMED, {"name": new_name})])
+        self.db.commit()
+        self._invalidate(name, new_name)
+        return self._report(outcome("rename_habit", HABIT_RENAMED, name, new_name=new_name))
+
+    @serialized_write
     def add_habit(self, name, description, periodicity, streak=0):
-        """Add a new habit to the database."""
+        """Add a new habit to the database. Returns an Outcome."""
         cur = self.db.cursor()
 
         # Check if the habit already exists
         if self.get_one_habit(name):
-            rich.print(f"[red]Habit '{name}' already exists. Please choose a different name.[/red]")
-            return
+            return self._report(outcome("add_habit", HABIT_EXISTS, name))
+
+        # A periodicity that looks like a schedule but is none would silently leave the habit without one
+        try:
+            check_periodicity(periodicity)
+        except ValueError:
+            return self._report(outcome("add_habit", INVALID_PERIODICITY, name, periodicity=periodicity))
 
-        # If the habit name is empty, print an error message
+        # If the habit name is empty, report an error
         if name is None or name.strip() == "":
-            rich.print("[red]Habit name cannot be empty. Please provide a valid name.[/red]")
-            return
+            return self._report(outcome("add_habit", EMPTY_NAME, name))
 
         # If habit does not exist, insert it into the database
         else:
-            cur.execute("INSERT INTO habits (name, description, periodicity, streak) VALUES (?, ?, ?, ?)",
-            (name, description, periodicity, streak))
+            cur.execute("INSERT INTO habits (user_id, name, description, periodicity, streak, longest_streak)"
+                        " VALUES (?, ?, ?, ?, ?, ?)", (self.user_id, name, description, periodicity, streak, streak))
+            habit_id = cur.lastrowid
+            write_stats(self.db, [HabitTracker(name, description, periodicity, streak, habit_id=habit_id)], {},
+                        self.user_id)
+            append(self.db, [(self.user_id, habit_id, HABIT_ADDED,
+                              {"name": name, "description": description, "periodicity": periodicity,
+                               "streak": streak})])
             self.db.commit()
-            rich.print(f"[green]Habit '{name}' added successfully.[/green]")
-
+            self._invalidate(name)
+            return self._report(outcome("add_habit", HABIT_ADDED, name, periodicity=periodicity))
+
+    @timed()
+    @serialized_write
+    def add_habits_bulk(self, habits):
+        """Add many habits at once from an iterable of (name, description, periodicity) tuples, e.g. an export, in a
+        single transaction. Habits that already exist and habits without a name are skipped.
+        Returns the number of habits added."""
+        rows = {}
+        for name, description, periodicity in habits:
+            if name is not None and name.strip() != "":
+                rows.setdefault(name, (self.user_id, name, description, periodicity))
+
+        with self.db:
+            existing = {habit.name for habit in self.get_all_habits()}
+            rows = [row for name, row in rows.items() if name not in existing]
+            self.db.executemany("INSERT INTO habits (user_id, name, description, periodicity) VALUES (?, ?, ?, ?)",
+                                rows)
+            added = [habit for habit in self.get_all_habits() if habit.name not in existing]
+            write_stats(self.db, added, {}, self.user_id)
+            append(self.db, [(self.user_id, habit.habit_id, HABIT_ADDED,
+                              {"name": habit.name, "description": habit.description,
+                               "periodicity": habit.periodicity, "streak": 0}) for habit in added])
+        self._invalidate(*(habit.name for habit in added))
+        return len(added)
+
+    @serialized_write
     def delete_habit(self, name):
-        """Delete a habit from the database."""
+        """Delete a habit from the database. Returns an Outcome."""
         cur = self.db.cursor()
 
-        # If the habit does not exist, print an error message
-        if not self.get_one_habit(name):
-            rich.print(f"[red]Habit '{name}' not found. Please select an existing habit to delete.[/red]")
-            return
-
-        # If the habit exists, delete it from the habits table
-        cur.execute("DELETE FROM habits WHERE name = ?", (name,))
-
-        # Also delete all events associated with the habit
-        events = self.get_one_habit_events(name)
+        # If the habit does not exist, report an error
+        habits = self.get_one_habit(name)
+        if not habits:
+            return self._report(outcome("delete_habit", HABIT_NOT_FOUND, name))
 
-        if events:
-            cur.execute("DELETE FROM habit_tracker WHERE habitName = ?", (name,))
-            rich.print(f"[dark_orange]All events for habit '{name}' have been deleted.[/dark_orange]")
-        else:
-            rich.print(f"[red]No events found for habit '{name}'.[/red]")
+        # Checking for a single event is enough to tell whether the habit has events
+        has_events = next(self.iter_events(habit=name, batch_size=1), None) is not None
 
+        # If the habit exists, delete it from the habits table. Its events, analytics and rollups are deleted with
+        # it by the ON DELETE CASCADE foreign keys, the event log keeps its history.
+        cur.execute("DELETE FROM habits WHERE user_id = ? AND name = ?", (self.user_id, name))
+        append(self.db, [(self.user_id, habits[0].habit_id, HABIT_DELETED, {"name": name})])
         self.db.commit()
-        rich.print(f"[dark_orange]Habit '{name}' deleted successfully.[/dark_orange]")
+        self._invalidate(name)
+        return self._report(outcome("delete_habit", HABIT_DELETED, name, had_events=has_events))
 
+    @serialized_write
     def clear_database(self):
-        """Clear all habits and events from the database."""
+        """Clear all habits and events of the user from the database. Returns an Outcome."""
         cur = self.db.cursor()
-        cur.execute("DELETE FROM habits")
-        cur.execute("DELETE FROM habit_tracker")
+        # Empty the referencing tables first, which is much cheaper than cascading the delete row by row
+        cur.execute("DELETE FROM habit_tracker WHERE habit_id IN (SELECT id FROM habits WHERE user_id = ?)",
+                    (self.user_id,))
+        cur.execute("DELETE FROM habit_stats WHERE user_id = ?", (self.user_id,))
+        cur.execute("DELETE FROM habit_week_rollup WHERE habit_id IN (SELECT id FROM habits WHERE user_id = ?)",
+                    (self.user_id,))
+        cur.execute("DELETE FROM habits WHERE user_id = ?", (self.user_id,))
+        append(self.db, [(self.user_id, None, DATABASE_CLEARED, {})])
         self.db.commit()
-        rich.print("[green]All habits and events have been cleared from the database.[/green]")
+        self.cache.clear()
+        return self._report(outcome("clear_database", DATABASE_CLEARED))
 
+    @timed()
     def get_one_habit(self, name):
         """Retrieve data for a specific habit."""
-        cur = self.db.cursor()
-        # Fetch the habit from db by name
-        cur.execute("SELECT * FROM habits WHERE name = ?", (name,))
-        rows = cur.fetchall()
+        # Fetch the habit from the cache, or from db by name. The cache holds the rows, so every caller gets
+        # HabitTracker objects of its own to change.
+        rows = self._cached("habit", name, lambda: tuple(self._query(
+            f"SELECT {HABIT_COLUMNS} FROM habits WHERE user_id = ? AND name = ?", (self.user_id, name))))
 
         # If the habit exists, return it as a HabitTracker object
         if rows:
-            return [
-                HabitTracker(name=row[0], description=row[1], periodicity=row[2], streak=row[3], event_count=row[4])
-                for row in rows
-            ]
+            return [habit_from_row(row) for row in rows]
         else:
             return []
 
     def list_one_habit(self, name):
         """List a specific habit in a readable format."""
 
-        # Fetch the habit by name from the db
+        # Fetch the habit by name from the db and render its details, or that it does not exist
         habits = self.get_one_habit(name)
+        self.renderer.habit(name, habits[0] if habits else None)
 
-        # If the habit exists, print its details
-        if habits:
-            habit = habits[0]
-            rich.print(
-                f"Habit name: [bold purple]{habit.name}[/bold purple]\n"
-                f" description: {habit.description}\n"
-                f" periodicity: {habit.periodicity}\n"
-                f" streak: {habit.streak}\n"
-                f" number of events: {habit.event_count}\n\n"
-            )
-        # If the habit does not exist, print an error message
-        else:
-            rich.print(f"[red]Habit '{name}' not found. Please select an existing habit,"
-                       f" or add it to your list![/red]")
-
-    def get_all_habits(self):
-        """Retrieve data for all habits."""
-        cur = self.db.cursor()
+    @timed()
+    def get_all_habits(self, shard=None):
+        """Retrieve data for all habits, or with shard=(index, count) only for the habits whose id modulo count is
+        index, so separate workers can each take a share of the habits."""
         # Fetch all habits from the db
-        cur.execute("SELECT * FROM habits")
-        rows = cur.fetchall()
+        shard_condition, shard_params = shard_filter(shard)
+        rows = self._query(f"SELECT {HABIT_COLUMNS} FROM habits h WHERE user_id = ?{shard_condition} ORDER BY id",
+                           (self.user_id, *shard_params))
 
-        # If habits exist, return them as a list of HabitTracker objects
-        if rows:
-            return [
-                HabitTracker(name=row[0], description=row[1], periodicity=row[2], streak=row[3], event_count=row[4])
-                for row in rows
-            ]
-        else:
-            rich.print("[red]No habits found.[/red]")
-            return []
+        # Return them as a list of HabitTracker objects
+        return [habit_from_row(row) for row in rows]
 
+    def has_habits(self):
+        """Check if there is at least one habit in the database."""
+        return self._query_one("SELECT 1 FROM habits WHERE user_id = ? LIMIT 1", (self.user_id,)) is not None
 
     def list_all_habits(self):
         """List all habits in a readable format."""
 
-        # Fetch all habits from the db
-        habits = self.get_all_habits()
-
-        # If habits exist, print their details
-        if habits:
-            for habit in habits:
-                rich.print(
-                    f"Habit name: [bold purple]{habit.name}[/bold purple]\n"
-                    f" description: {habit.description}\n"
-                    f" periodicity: {habit.periodicity}\n"
-                    f" streak: {habit.streak}\n"
-                    f" number of events: {habit.event_count}\n"
-                )
-        else:
-            rich.print("[red]No habits found.[/red]")
+        # Fetch all habits from the db and render their details
+        self.renderer.habits(self.get_all_habits())
 
+    @timed()
+    @serialized_write
     def add_habit_event(self, name, event_date = ""):
-        """Add an event for a specific habit."""
+        """Add an event for a specific habit. Returns an Outcome."""
 
         # If no event date is provided, use today's date
         if event_date == "":
             event_date = date.today()
 
-        # If the habit does not exist, print an error message
-        if not self.get_one_habit(name):
-            rich.print(f"[red]Habit '{name}' not found. Please add the habit before trying to complete an event![/red]")
-            return
+        # If the habit does not exist, report an error
+        habits = self.get_one_habit(name)
+        if not habits:
+            return self._report(outcome("add_habit_event", HABIT_NOT_FOUND, name))
 
         # If the event date is not in the correct format, print an error message
         # if get_valid_date(event_date) is None:
@@ -169,7 +337,7 @@ class HabitRepository:
         #     return
 
         # Save the habit data to a variable
-        habit = self.get_one_habit(name)[0]
+        habit = habits[0]
 
         # Get the last event date for the habit
         last_event_date = self.get_last_event_date(name)
@@ -177,37 +345,25 @@ class HabitRepository:
         # Validate the event date
         valid_date = get_valid_date(event_date)
         if not valid_date:
-            rich.print("[red]Invalid format! Please use YYYY-MM-DD (e.g., 2025-06-01).[/red]")
-            return
+            return self._report(outcome("add_habit_event", INVALID_DATE, name))
         event_date = valid_date
 
         # Check if the event date is in the future
         if event_date > date.today():
-            rich.print(f"[red]You cannot add an event for habit [bold purple]{name}[/bold purple]"
-                       f" that's the future![/red]")
-            return
+            return self._report(outcome("add_habit_event", FUTURE_DATE, name, event_date=event_date))
 
-        # If the habit exists, check if the user is trying to add an event too soon. Differentiate between daily
-        # and weekly habits.
+        # If the habit exists, check if the user is trying to add an event before the habit's schedule makes it
+        # due again. Habits that are due tomorrow get no number of days to wait.
         if habit:
-            if last_event_date:
-                if habit.periodicity.lower() == "daily" and habit.event_too_soon(last_event_date, event_date):
-                    rich.print(f"[red]You cannot add another event for this daily habit"
-                               f" [bold purple]{name}[/bold purple] today. "
-                               f"Please wait until [bold purple]tomorrow[/bold purple]"
-                               f" before adding another event.[/red]")
-                    return
-
-                elif habit.periodicity.lower() == "weekly" and habit.event_too_soon(last_event_date, event_date):
-                    time_until_next_event = (last_event_date + timedelta(weeks=1) - date.today()).days
-                    rich.print(f"[red]You cannot add another event for habit [bold purple]{name}[/bold purple] so soon."
-                               f" Please wait another [bold purple]{time_until_next_event} days[/bold purple]"
-                               f" before adding another event.[/red]")
-                    return
+            if last_event_date and habit.event_too_soon(last_event_date, event_date):
+                time_until_next_event = (habit.schedule.next_due(last_event_date) - date.today()).days
+                return self._report(outcome("add_habit_event", TOO_SOON, name, event_date=event_date,
+                                            periodicity=habit.periodicity,
+                                            wait_days=time_until_next_event if time_until_next_event > 1 else None))
 
             # Check if the habit's streak should be reset based on the last event date.
-            if habit.should_reset_streak(last_event_date):
-                rich.print(f"[dark_orange]Streak for habit '{name}' has been reset due to inactivity.[/dark_orange]")
+            streak_reset = habit.should_reset_streak(last_event_date)
+            if streak_reset:
                 habit.reset_streak()
 
             # If all checks pass, insert the event into the habit_tracker table and update the habit's streak and event count
@@ -216,106 +372,458 @@ class HabitRepository:
             if not event_date:
                 event_date = str(date.today())
 
-            cur.execute("INSERT INTO habit_tracker (date, habitName) VALUES (?, ?)", (event_date.isoformat(), name))
+            cur.execute("INSERT INTO habit_tracker (habit_id, date) VALUES (?, ?)",
+                        (habit.habit_id, event_date.isoformat()))
             habit.increment_streak()
             habit.increment_event()
-            cur.execute("UPDATE habits SET streak = ?, event_count = ? WHERE name = ?",
-                        (habit.streak, habit.event_count, name))
+            cur.execute("UPDATE habits SET streak = ?, event_count = ?, longest_streak = ? WHERE id = ?",
+                        (habit.streak, habit.event_count, habit.longest_streak, habit.habit_id))
+            # Habits without a schedule accept backdated events, which do not move the last event back
+            write_stats(self.db, [habit], {name: max(last_event_date, event_date) if last_event_date else event_date},
+                        self.user_id)
+            add_to_rollups(self.db, [(habit.habit_id, event_date)])
+            append(self.db, [(self.user_id, habit.habit_id, EVENT_ADDED,
+                              {"dates": [event_date.isoformat()], **counters(habit)})])
 
             self.db.commit()
+            self._invalidate(name)
+
+            return self._report(outcome("add_habit_event", EVENT_ADDED, name, event_date=event_date,
+                                        periodicity=habit.periodicity, streak_reset=streak_reset))
+
+    @timed()
+    @serialized_write
+    def add_habit_events_bulk(self, events):
+        """Add many events at once from an iterable of (name, event_date) pairs, e.g. an export.
+        The same checks as add_habit_event are applied in memory per habit, events of a habit are expected in
+        chronological order. Unlike there, a missing date is rejected as invalid instead of taken as today.
+        All accepted events are written in a single transaction. Returns a BulkIngestReport."""
+        start = time.perf_counter()
+        today = date.today()
+        report = BulkIngestReport()
+
+        # Per habit state, loaded from the db the first time a habit shows up in the input
+        habits = {}
+        last_event_dates = {}
+        rows = []
+
+        for index, (name, event_date) in enumerate(events):
+            if name not in habits:
+                found = self.get_one_habit(name)
+                habits[name] = found[0] if found else None
+                last_event_dates[name] = self.get_last_event_date(name) if found else None
+
+            # The habit has to exist
+            habit = habits[name]
+            if habit is None:
+                report.rejected.append(RejectedEvent(index, name, event_date, REJECT_UNKNOWN_HABIT))
+                continue
+
+            # The event date has to be given and valid and must not be in the future
+            valid_date = get_valid_date(event_date) if event_date and str(event_date).strip() else None
+            if not valid_date:
+                report.rejected.append(RejectedEvent(index, name, event_date, REJECT_INVALID_DATE))
+                continue
+            if valid_date > today:
+                report.rejected.append(RejectedEvent(index, name, event_date, REJECT_FUTURE_DATE))
+                continue
+
+            # The event must not follow the previous one too soon
+            last_event_date = last_event_dates[name]
+            if last_event_date and habit.event_too_soon(last_event_date, valid_date):
+                report.rejected.append(RejectedEvent(index, name, event_date, REJECT_TOO_SOON))
+                continue
+
+            # Reset the streak if the gap to the previous event broke it, as seen from the day of this event
+            if habit.should_reset_streak(last_event_date, today=valid_date):
+                habit.reset_streak()
+                report.streak_resets += 1
 
-            rich.print(f"[green]Event added for habit '{name}' on {event_date}.[/green]")
-
+            rows.append((habit.habit_id, valid_date))
+            habit.increment_streak()
+            habit.increment_event()
+            last_event_dates[name] = max(last_event_date, valid_date) if last_event_date else valid_date
+            report.accepted += 1
+
+        self._write_events([habit for habit in habits.values() if habit is not None], rows, last_event_dates)
+
+        report.elapsed = time.perf_counter() - start
+        self.renderer.bulk_report(report)
+        return report
+
+    @timed()
+    @serialized_write
+    def add_habit_events(self, events):
+        """Add the events of many add_habit_event calls from an iterable of (name, event_date) pairs, e.g. a group
+        commit of concurrent check-ins. Every event is checked like add_habit_event, in the given order and with the
+        streak reset as seen from today, and all accepted events are written in a single transaction.
+        Returns an Outcome per event."""
+        today = date.today()
+        habits = {}
+        last_event_dates = {}
+        rows = []
+        results = []
+
+        for name, event_date in events:
+            if name not in habits:
+                found = self.get_one_habit(name)
+                habits[name] = found[0] if found else None
+                last_event_dates[name] = self.get_last_event_date(name) if found else None
+
+            habit = habits[name]
+            if habit is None:
+                results.append(outcome("add_habit_event", HABIT_NOT_FOUND, name))
+                continue
+            valid_date = get_valid_date(event_date)
+            if not valid_date:
+                results.append(outcome("add_habit_event", INVALID_DATE, name))
+                continue
+            if valid_date > today:
+                results.append(outcome("add_habit_event", FUTURE_DATE, name, event_date=valid_date))
+                continue
+            last_event_date = last_event_dates[name]
+            if last_event_date and habit.event_too_soon(last_event_date, valid_date):
+                wait_days = (habit.schedule.next_due(last_event_date) - today).days
+                results.append(outcome("add_habit_event", TOO_SOON, name, event_date=valid_date,
+                                       periodicity=habit.periodicity, wait_days=wait_days if wait_days > 1 else None))
+                continue
+
+            streak_reset = habit.should_reset_streak(last_event_date, today=today)
+            if streak_reset:
+                habit.reset_streak()
+            rows.append((habit.habit_id, valid_date))
+            habit.increment_streak()
+            habit.increment_event()
+            last_event_dates[name] = max(last_event_date, valid_date) if last_event_date else valid_date
+            results.append(outcome("add_habit_event", EVENT_ADDED, name, event_date=valid_date,
+                                   periodicity=habit.periodicity, streak_reset=streak_reset))
+
+        self._write_events([habit for habit in habits.values() if habit is not None], rows, last_event_dates)
+        return [self._report(result) for result in results]
+
+    def _write_events(self, touched, rows, last_event_dates):
+        """Write accepted events, given as (habit_id, date) pairs, and the final counters of every touched habit in
+        one transaction, with one log entry per habit."""
+        with self.db:
+            self.db.executemany("INSERT INTO habit_tracker (habit_id, date) VALUES (?, ?)",
+                                [(habit_id, event_date.isoformat()) for habit_id, event_date in rows])
+            add_to_rollups(self.db, rows)
+            self.db.executemany("UPDATE habits SET streak = ?, event_count = ?, longest_streak = ? WHERE id = ?",
+                                [(habit.streak, habit.event_count, habit.longest_streak, habit.habit_id)
+                                 for habit in touched])
+            write_stats(self.db, touched, last_event_dates, self.user_id)
+            # One log entry per habit, with all of its new events
+            dates = {}
+            for habit_id, event_date in rows:
+                dates.setdefault(habit_id, []).append(event_date.isoformat())
+            append(self.db, [(self.user_id, habit.habit_id, EVENT_ADDED, {"dates": dates[habit.habit_id],
+                                                                         **counters(habit)})
+                             for habit in touched if habit.habit_id in dates])
+        self._invalidate(*(habit.name for habit in touched))
+
+
+    def _date_filter(self, since, until):
+        """Build the date conditions and parameters shared by the event queries, each condition prefixed by AND."""
+        conditions, params = "", []
+        if since is not None:
+            conditions += " AND t.date >= ?"
+            params.append(get_valid_date(since).isoformat())
+        if until is not None:
+            conditions += " AND t.date <= ?"
+            params.append(get_valid_date(until).isoformat())
+        return conditions, params
+
+    def iter_events(self, habit=None, since=None, until=None, batch_size=EVENT_BATCH_SIZE):
+        """Iterate over habit events of the user ordered by habit and date, optionally only for one habit and/or
+        between two dates (inclusive). Events are fetched batch_size rows at a time with keyset pagination on
+        (habit_id, date, id), so memory stays bounded no matter how large the habit_tracker table is."""
+        for rows in self.iter_event_rows(habit, since, until, batch_size):
+            for name, event_date in rows:
+                yield HabitEvent(completed_at = parse_stored_date(event_date), habit_name = name)
+
+    def iter_event_rows(self, habit=None, since=None, until=None, batch_size=EVENT_BATCH_SIZE):
+        """Like iter_events, but yield every batch as a list of (habit name, date as stored) tuples, for exports
+        that pass the rows on without looking at them."""
+        date_conditions, date_params = self._date_filter(since, until)
+        select = "SELECT t.id, t.date, t.habit_id, h.name FROM habit_tracker t JOIN habits h ON h.id = t.habit_id"
+
+        last_key = None
+        while True:
+            # A read connection is only borrowed while a batch is fetched, not while the caller consumes it.
+            # Both queries are range scans of the (habit_id, date) index, which ends in the event id.
+            rows = []
+            if last_key:
+                # Continue right after the last row of the previous batch, within the habit it stopped in
+                rows = self._query(f"{select} WHERE t.habit_id = ? AND (t.date, t.id) > (?, ?){date_conditions}"
+                                   f" ORDER BY t.date, t.id LIMIT ?", (*last_key, *date_params, batch_size))
+            if len(rows) < batch_size and habit is None:
+                # Then go on with the following habits of the user
+                rows += self._query(f"{select} WHERE t.habit_id IN (SELECT id FROM habits WHERE user_id = ? AND id > ?)"
+                                    f"{date_conditions} ORDER BY t.habit_id, t.date, t.id LIMIT ?",
+                                    (self.user_id, last_key[0] if last_key else 0, *date_params,
+                                     batch_size - len(rows)))
+            elif last_key is None:
+                rows = self._query(f"{select} WHERE t.habit_id = {HABIT_ID_BY_NAME}{date_conditions}"
+                                   f" ORDER BY t.date, t.id LIMIT ?", (self.user_id, habit, *date_params, batch_size))
+
+            if rows:
+                yield [(row[3], row[1]) for row in rows]
+
+            if len(rows) < batch_size:
+                return
+            last_key = (rows[-1][2], rows[-1][1], rows[-1][0])
+
+    @timed()
+    def get_event_batch(self, habit=None, since=None, until=None, shard=None):
+        """Retrieve habit events of the user as a columnar EventBatch, optionally only for one habit, one shard of
+        the habits (see get_all_habits) and/or between two dates (inclusive). SQLite converts the dates to day
+        ordinals and hands them over as one string per habit, which numpy parses in C, so no Python object or date
+        parsing is needed per event. Events of a habit are in date order, as they are read along the (habit_id, date)
+        index."""
+        # numpy is only needed by bulk analytics, import it on first use to keep it out of the CLI startup
+        import numpy as np
+
+        date_conditions, date_params = self._date_filter(since, until)
+        habit_condition, habit_params = (" AND h.name = ?", [habit]) if habit is not None else ("", [])
+        shard_condition, shard_params = shard_filter(shard)
+
+        # The habits of the user are found through the (user_id, name) index, their events through the
+        # (habit_id, date) index. Dates julianday() cannot parse become NULL, which group_concat leaves out.
+        rows = self._query(f"""SELECT h.name, (
+                            SELECT group_concat(CAST(julianday(t.date) - {JULIANDAY_ORDINAL_OFFSET} AS INTEGER))
+                            FROM habit_tracker t WHERE t.habit_id = h.id{date_conditions})
+                        FROM habits h WHERE h.user_id = ?{habit_condition}{shard_condition} ORDER BY h.id""",
+                           (*date_params, self.user_id, *habit_params, *shard_params))
+
+        batch = EventBatch()
+        for name, joined in rows:
+            if not joined:
+                continue
+            ordinals = array("i")
+            ordinals.frombytes(np.fromstring(joined, dtype=np.int32, sep=",").tobytes())
+            batch.extend(name, ordinals)
+        return batch
 
     def get_all_habit_events(self):
         """Retrieve all habit events."""
 
-        # Fetch all habit events from the db
-        cur = self.db.cursor()
-        cur.execute("SELECT * FROM habit_tracker")
-        rows = cur.fetchall()
-
-        # If habit events exist, return them as a list of HabitEvent objects, otherwise print an error message
-        if rows:
-            rich.print(f"[green]Retrieved {len(rows)} habit events.[/green]")
-            return [
-                HabitEvent(completed_at = row[0], habit_name = row[1])
-                for row in rows
-            ]
-        else:
-            rich.print("[red]No habit events found.[/red]")
-            return []
-
+        # Fetch all habit events from the db as a list of HabitEvent objects
+        return list(self.iter_events())
 
     def get_one_habit_events(self, name):
         """Retrieve all events for a specific habit."""
 
-        # Fetch all events for a specific habit from the db
-        cur = self.db.cursor()
-        cur.execute("SELECT * FROM habit_tracker WHERE habitName = ?", (name,))
-        rows = cur.fetchall()
-
-        # If events exist for the habit, return them as a list of HabitEvent objects, otherwise print an error message
-        if rows:
-            rich.print(f"[green]Retrieved {len(rows)} events for habit '{name}'.[/green]")
-            return [
-                HabitEvent(completed_at = row[0], habit_name = row[1])
-                for row in rows
-            ]
-        else:
-            # rich.print(f"[red]No events found for habit '{name}'.[/red]")
-            return []
+        # Fetch all events for a specific habit from the db as a list of HabitEvent objects
+        return list(self.iter_events(habit=name))
 
     def list_one_habit_events(self, name):
         """List all events for a specific habit in a readable format."""
 
-        # Fetch all events for the specific habit
-        events = self.get_one_habit_events(name)
-
-        # If events exist, print their details, otherwise print an error message
-        if events:
-            for event in events:
-                rich.print(
-                    f"Event date: [bold purple]{event.completed_at}[/bold purple]\n"
-                    f" Habit name: {event.habit_name}\n"
-                )
-        else:
-            rich.print(f"[red]No events found for habit '{name}'.[/red]")
+        # Stream the events of the specific habit to the renderer
+        self.renderer.events(self.iter_events(habit=name), habit_name=name)
 
     def list_all_habit_events(self):
         """List all habit events in a readable format."""
 
-        # Fetch all habit events
-        events = self.get_all_habit_events()
-
-        # If events exist, print their details, otherwise print an error message
-        if events:
-            for event in events:
-                rich.print(
-                    f"Event date: [bold purple]{event.completed_at}[/bold purple]\n"
-                    f" Habit name: {event.habit_name}\n"
-                )
-        else:
-            rich.print("[red]No habit events found.[/red]")
+        # Stream all habit events to the renderer
+        self.renderer.events(self.iter_events())
 
+    @timed()
     def get_last_event_date(self, name):
         """Get the date of the last event for a specific habit."""
 
-        # Fetch the last event date for the specific habit from the db
-        cur = self.db.cursor()
-        cur.execute("SELECT date FROM habit_tracker WHERE habitName = ? ORDER BY date DESC LIMIT 1", (name,))
-        row = cur.fetchone()
+        # Fetch the last event date for the specific habit from the cache, or from the db
+        row = self._cached("last_event", name, lambda: self._query_one(
+            f"SELECT date FROM habit_tracker WHERE habit_id = {HABIT_ID_BY_NAME} ORDER BY date DESC LIMIT 1",
+            (self.user_id, name)))
 
         # If an event is found, return the date as a datetime object, and strip time to return only the date
         # otherwise return None
         if row:
-            return datetime.strptime(row[0], "%Y-%m-%d").date()
+            return date.fromisoformat(row[0])
         else:
             return None
 
+    @timed()
+    def get_week_rollups(self, habit=None, since=None, until=None):
+        """Retrieve the completions of the user's habits per ISO week as WeekRollup objects, ordered by habit and
+        week, optionally only for one habit and/or for the weeks overlapping two dates (inclusive). Every week is one
+        row of the (habit_id, week_start) primary key, so a year of history reads 52 rows per habit."""
+        conditions, params = ["h.user_id = ?"], [self.user_id]
+        if habit is not None:
+            conditions.append("h.name = ?")
+            params.append(habit)
+        if since is not None:
+            conditions.append("r.week_start >= ?")
+            params.append(week_start(get_valid_date(since)).isoformat())
+        if until is not None:
+            conditions.append("r.week_start <= ?")
+            params.append(get_valid_date(until).isoformat())
+        rows = self._query(f"SELECT {ROLLUP_SELECT} WHERE {' AND '.join(conditions)} ORDER BY r.habit_id, r.week_start",
+                           params)
+        return [rollup_from_row(row) for row in rows]
+
+    @timed()
+    def get_week_rollup_columns(self, since=None, until=None):
+        """Retrieve the weekly rollups of the user's habits like get_week_rollups, but columnar for the bulk
+        analytics: a list of (habit name, week start day ordinals, weekday bitmaps) with one numpy array pair per
+        habit, habits without rollups in the range left out. Like get_event_batch, SQLite hands the rows of a habit
+        over as one string that numpy parses in C."""
+        # numpy is only needed by bulk analytics, import it on first use to keep it out of the CLI startup
+        import numpy as np
+
+        conditions, params = "", []
+        if since is not None:
+            conditions += " AND r.week_start >= ?"
+            params.append(week_start(get_valid_date(since)).isoformat())
+        if until is not None:
+            conditions += " AND r.week_start <= ?"
+            params.append(get_valid_date(until).isoformat())
+        rows = self._query(f"""SELECT h.name, (
+                            SELECT group_concat(CAST(julianday(r.week_start) - {JULIANDAY_ORDINAL_OFFSET} AS INTEGER)
+                                                || ',' || r.days)
+                            FROM habit_week_rollup r WHERE r.habit_id = h.id{conditions})
+                        FROM habits h WHERE h.user_id = ? ORDER BY h.id""", (*params, self.user_id))
+
+        columns = []
+        for name, joined in rows:
+            if joined:
+                values = np.fromstring(joined, dtype=np.int64, sep=",")
+                columns.append((name, values[0::2], values[1::2]))
+        return columns
+
+    def get_audit_trail(self, name=None, after=0):
+        """Retrieve the log entries of the user's writes after the seq after, oldest first, optionally only those of
+        one existing habit, as LogEntry objects. Entries before the oldest kept snapshot are dropped by compaction."""
+        habit_condition, habit_params = (f" AND habit_id = {HABIT_ID_BY_NAME}", (self.user_id, name)) \
+            if name is not None else ("", ())
+        rows = self._query(f"SELECT {LOG_COLUMNS} FROM event_log WHERE user_id = ? AND seq > ?{habit_condition}"
+                           f" ORDER BY seq", (self.user_id, after, *habit_params))
+        return [entry_from_row(row) for row in rows]
+
+    @timed()
+    def get_overdue_habits(self, today=None):
+        """Retrieve all habits that are overdue on the given day (default: today) from the materialized analytics.
+        A habit is overdue if it was never completed, or if its next due date has been reached."""
+        today = today or date.today()
+
+        # Both halves are range lookups on an index of habit_stats, so the cost depends on the number of overdue
+        # habits and not on the number of habits or events. The planner would take a leaderboard index on user_id
+        # for the never completed habits and scan all habits of the user, so it is told to use the partial index.
+        rows = self._query("""
+            SELECT h.name, s.periodicity, s.last_event FROM habit_stats s JOIN habits h ON h.id = s.habit_id
+            WHERE s.user_id = ? AND s.next_due <= ?
+            UNION ALL
+            SELECT h.name, s.periodicity, s.last_event
+            FROM habit_stats s INDEXED BY idx_habit_stats_never_done JOIN habits h ON h.id = s.habit_id
+            WHERE s.user_id = ? AND s.last_event IS NULL
+            ORDER BY 1""", (self.user_id, today.isoformat(), self.user_id))
+
+        return [
+            OverdueHabit(name=row[0], periodicity=row[1],
+                         last_event_date=date.fromisoformat(row[2]) if row[2] else None)
+            for row in rows
+        ]
+
+    @timed()
+    def get_due_habits(self, since=None, until=None):
+        """Retrieve the analytics of all habits whose next due date lies between since and until, both included
+        (default: today). The due dates follow the schedule of every habit and are stored in habit_stats, so this is
+        a range lookup on the (user_id, next_due) index. Habits that were never completed have no due date."""
+        since = since or date.today()
+        until = until or since
+        rows = self._query(f"SELECT {STATS_SELECT} WHERE s.user_id = ? AND s.next_due BETWEEN ? AND ?"
+                           f" ORDER BY s.next_due, s.habit_id", (self.user_id, since.isoformat(), until.isoformat()))
+        return [stats_from_row(row) for row in rows]
+
+    @timed()
+    def get_pending_deadlines(self, today=None):
+        """Retrieve the analytics of all habits that reached a deadline by the given day (default: today): habits
+        whose next due date passed and that were not reminded of it yet, or that still have a streak, which expires
+        after the due date. This is a range lookup on the (user_id, next_due) index, for one-shot scheduler runs."""
+        today = today or date.today()
+        rows = self._query(f"SELECT {STATS_SELECT} WHERE s.user_id = ? AND s.next_due <= ?"
+                           f" AND (s.reminded_due IS NOT s.next_due OR s.streak > 0) ORDER BY s.next_due, s.habit_id",
+                           (self.user_id, today.isoformat()))
+        return [stats_from_row(row) for row in rows]
+
+    @serialized_write
+    def mark_reminded(self, habit_ids):
+        """Record that the habits with the given ids were reminded of their current next due date. Returns the ids
+        of the habits that had not been reminded of it before, in the given order."""
+        habit_ids = list(habit_ids)
+        pending = set()
+        with self.db:
+            for start in range(0, len(habit_ids), STATS_CHUNK_SIZE):
+                chunk = habit_ids[start:start + STATS_CHUNK_SIZE]
+                pending.update(row[0] for row in self.db.execute(
+                    f"SELECT habit_id FROM habit_stats WHERE user_id = ? AND reminded_due IS NOT next_due"
+                    f" AND habit_id IN ({', '.join('?' * len(chunk))})", (self.user_id, *chunk)))
+            self.db.executemany("UPDATE habit_stats SET reminded_due = next_due WHERE user_id = ? AND habit_id = ?",
+                                [(self.user_id, habit_id) for habit_id in pending])
+        return [habit_id for habit_id in habit_ids if habit_id in pending]
+
+    @timed()
+    def get_stats(self, habit_ids=None):
+        """Retrieve the analytics of all habits, or of the habits with the given ids, as HabitStats objects."""
+        if habit_ids is None:
+            return [stats_from_row(row) for row in
+                    self._query(f"SELECT {STATS_SELECT} WHERE s.user_id = ? ORDER BY s.habit_id", (self.user_id,))]
+
+        # Look the habits up in chunks, to stay below SQLite's limit of parameters per statement
+        habit_ids = list(habit_ids)
+        stats = []
+        for start in range(0, len(habit_ids), STATS_CHUNK_SIZE):
+            chunk = habit_ids[start:start + STATS_CHUNK_SIZE]
+            rows = self._query(f"SELECT {STATS_SELECT} WHERE s.user_id = ? AND s.habit_id IN"
+                               f" ({', '.join('?' * len(chunk))}) ORDER BY s.habit_id", (self.user_id, *chunk))
+            stats += [stats_from_row(row) for row in rows]
+        return stats
+
+    @timed()
+    @serialized_write
+    def reset_streaks(self, habit_ids):
+        """Reset the current streak of the habits with the given ids to 0, e.g. once their streak expired.
+        Returns the number of habits whose streak was reset."""
+        rows = [(self.user_id, habit_id) for habit_id in habit_ids]
+        with self.db:
+            # Only the habits that still have a streak are logged and reset
+            self.db.executemany(f"INSERT INTO event_log (user_id, habit_id, kind) SELECT user_id, id, '{STREAK_RESET}'"
+                                f" FROM habits WHERE user_id = ? AND id = ? AND streak > 0", rows)
+            reset = self.db.executemany("UPDATE habits SET streak = 0 WHERE user_id = ? AND id = ? AND streak > 0",
+                                        rows).rowcount
+            # Without a streak, every event counts against the struggle score, see habit_stats.struggle_score
+            self.db.executemany("UPDATE habit_stats SET streak = 0,"
+                                " struggle = CASE WHEN event_count > 0 THEN 1.0 END"
+                                " WHERE user_id = ? AND habit_id = ?", rows)
+        # Cached habits are looked up by name, not by id
+        self.cache.clear()
+        return reset
+
+    @timed()
+    def get_leaderboard(self, k=10, by="streak", periodicity=None):
+        """Retrieve the analytics of the top k habits by current streak, longest streak or struggle score,
+        optionally only for one periodicity. Ties go to the habit that was added first. Habits without a struggle
+        score are left out of the struggle leaderboard."""
+        if by not in LEADERBOARD_COLUMNS:
+            raise ValueError(f"Unknown leaderboard '{by}', expected one of {', '.join(LEADERBOARD_COLUMNS)}.")
+        column = LEADERBOARD_COLUMNS[by]
+
+        # Every combination is served by a (user_id, periodicity, column DESC, habit_id) or
+        # (user_id, column DESC, habit_id) index, so only k index entries are read and k names are looked up
+        conditions, params = ["s.user_id = ?"], [self.user_id]
+        if by == "struggle":
+            conditions.append("s.struggle IS NOT NULL")
+        if periodicity:
+            conditions.append("s.periodicity = ? COLLATE NOCASE")
+            params.append(periodicity)
+        where = f"WHERE {' AND '.join(conditions)}"
+
+        rows = self._query(f"SELECT {STATS_SELECT} {where} ORDER BY s.{column} DESC, s.habit_id LIMIT ?", (*params, k))
+        return [stats_from_row(row) for row in rows]
+
     def close(self):
-        """Close the database connection."""
-        if self.db:
-            self.db.close()
+        """Close all database connections."""
+        self.pool.close()
 
 
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+from periodicity import parse_periodicity
+
+# Columns of the habit_stats table, in the order write_stats fills them
+STATS_COLUMNS = "habit_id, user_id, periodicity, streak, longest_streak, event_count, struggle, last_event, next_due"
+
+# Select list and tables to read habit_stats together with the habit name, in the order stats_from_row expects them
+STATS_SELECT = ("s.habit_id, h.name, s.periodicity, s.streak, s.longest_streak, s.event_count, s.struggle,"
+                " s.last_event, s.next_due FROM habit_stats s JOIN habits h ON h.id = s.habit_id")
+
+@dataclass(frozen=True)
+class HabitStats:
+    """A data class to represent the materialized analytics of a habit, parallel to the habit_stats table in the db."""
+    __slots__ = ("habit_id", "name", "periodicity", "streak", "longest_streak", "event_count", "struggle", "last_event",
+                 "next_due")
+    habit_id: int
+    name: str
+    periodicity: str
+    streak: int
+    longest_streak: int
+    event_count: int
+    struggle: Optional[float]
+    last_event: Optional[date]
+    next_due: Optional[date]
+
+def struggle_score(streak: int, event_count: int):
+    """Return the struggle score of a habit, or None if there is nothing to struggle with yet.
+    The score is the share of events that are not part of the current streak."""
+    if event_count == 0 or event_count == streak:
+        return None
+    return (event_count - streak) / event_count
+
+def next_due_date(periodicity: str, last_event: Optional[date]):
+    """Return the day a habit is due again after its last event, or None if that does not apply.
+    Habits without a known schedule are only due while they have never been completed."""
+    return parse_periodicity(periodicity).next_due(last_event)
+
+def stats_from_row(row):
+    """Build a HabitStats object from a row selected with STATS_SELECT."""
+    return HabitStats(habit_id=row[0], name=row[1], periodicity=row[2], streak=row[3], longest_streak=row[4],
+                      event_count=row[5], struggle=row[6],
+                      last_event=date.fromisoformat(row[7]) if row[7] else None,
+                      next_due=date.fromisoformat(row[8]) if row[8] else None)
+
+def _stats_row(habit, last_event: Optional[date], user_id: str):
+    """Build the habit_stats row of a HabitTracker object, in the order of STATS_COLUMNS."""
+    next_due = next_due_date(habit.periodicity, last_event)
+    return (habit.habit_id, user_id, habit.periodicity, habit.streak, habit.longest_streak, habit.event_count,
+            struggle_score(habit.streak, habit.event_count),
+            last_event.isoformat() if last_event else None,
+            next_due.isoformat() if next_due else None)
+
+def write_stats(db, habits, last_events, user_id):
+    """Insert or update the analytics of the given HabitTracker objects of one user, which need their habit_id.
+    last_events maps habit names to the date of their last event. Runs inside the caller's transaction."""
+    # The due date a habit was last reminded of is kept, it only applies again if next_due did not move
+    db.executemany(f"""INSERT INTO habit_stats ({STATS_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (habit_id) DO UPDATE SET user_id = excluded.user_id, periodicity = excluded.periodicity,
+            streak = excluded.streak, longest_streak = excluded.longest_streak, event_count = excluded.event_count,
+            struggle = excluded.struggle, last_event = excluded.last_event, next_due = excluded.next_due""",
+                   [_stats_row(habit, last_events.get(habit.name), user_id) for habit in habits])
+
+def rebuild_stats(db, user_id=None):
+    """Rebuild the analytics of all habits, or of all habits of one user, from the habits and habit_tracker tables,
+    e.g. after a recompute of all streaks. Runs inside the caller's transaction."""
+    # Next due dates depend on the schedule of each periodicity, so they are filled in after the insert
+    scope, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    reminded = db.execute(f"SELECT reminded_due, habit_id FROM habit_stats WHERE reminded_due IS NOT NULL"
+                          f" {scope.replace('WHERE', 'AND')}", params).fetchall()
+    db.execute(f"DELETE FROM habit_stats {scope}", params)
+    db.execute(f"""INSERT INTO habit_stats ({STATS_COLUMNS})
+        SELECT id, user_id, periodicity, streak, longest_streak, event_count,
+               CASE WHEN event_count > 0 AND event_count != streak
+                    THEN (event_count - streak) * 1.0 / event_count END,
+               last_event, NULL
+        FROM (SELECT h.id, h.user_id, h.periodicity, COALESCE(h.streak, 0) AS streak,
+                     COALESCE(h.longest_streak, 0) AS longest_streak, COALESCE(h.event_count, 0) AS event_count,
+                     (SELECT MAX(t.date) FROM habit_tracker t WHERE t.habit_id = h.id) AS last_event
+              FROM habits h {scope})""", params)
+    rows = db.execute(f"SELECT habit_id, periodicity, last_event FROM habit_stats WHERE last_event IS NOT NULL"
+                      f" {scope.replace('WHERE', 'AND')}", params).fetchall()
+    due_dates = [(next_due_date(periodicity, date.fromisoformat(last_event)), habit_id)
+                 for habit_id, periodicity, last_event in rows]
+    db.executemany("UPDATE habit_stats SET next_due = ? WHERE habit_id = ?",
+                   [(due.isoformat(), habit_id) for due, habit_id in due_dates if due is not None])
+    db.executemany("UPDATE habit_stats SET reminded_due = ? WHERE habit_id = ?", reminded)
@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+# Number of distinct SQL statements the trace keeps apart, later ones are counted under OTHER_STATEMENTS
+MAX_TRACED_STATEMENTS = 1000
+OTHER_STATEMENTS = "(other)"
+
+# String and number literals, replaced by ? so statements that only differ in their values are counted together
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+class Metrics:
+    """Collects per-method timers, counters and SQL statistics of the process. Disabled by default: every hook then
+    costs a single attribute check. Enable it with the HABIT_METRICS environment variable or enable(), before the
+    repository is opened if SQL statements should be traced as well."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Forget everything collected so far."""
+        with self._lock:
+            # name -> [calls, total seconds, slowest call in seconds]
+            self.timers = {}
+            self.counters = {}
+            # SQL text of a repository query -> [calls, total seconds, rows returned]
+            self.queries = {}
+            # SQL statement run by any connection, literals replaced by ? -> number of times it ran
+            self.statements = {}
+
+    def observe(self, name, seconds):
+        """Record one timed call."""
+        with self._lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def count(self, name, amount=1):
+        """Add to a counter, if enabled."""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe_query(self, sql, seconds, rows):
+        """Record one run of a repository query and the number of rows it returned."""
+        with self._lock:
+            query = self.queries.setdefault(" ".join(sql.split()), [0, 0.0, 0])
+            query[0] += 1
+            query[1] += seconds
+            query[2] += rows
+
+    def trace(self, statement):
+        """Trace callback for sqlite3 connections, see Connection.set_trace_callback. Counts every statement SQLite
+        runs, including those of writes, commits and migrations."""
+        statement = " ".join(LITERALS.sub("?", statement).split())
+        with self._lock:
+            if statement not in self.statements and len(self.statements) >= MAX_TRACED_STATEMENTS:
+                statement = OTHER_STATEMENTS
+            self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    def instrument(self, db):
+        """Trace the statements of a connection, if enabled."""
+        if self.enabled:
+            db.set_trace_callback(self.trace)
+        return db
+
+    def snapshot(self):
+        """Return a copy of everything collected, as plain dicts and numbers."""
+        with self._lock:
+            return {
+                "timers": {name: {"calls": calls, "seconds": seconds, "max_seconds": slowest}
+                           for name, (calls, seconds, slowest) in self.timers.items()},
+                "counters": dict(self.counters),
+                "queries": {sql: {"calls": calls, "seconds": seconds, "rows": rows}
+                            for sql, (calls, seconds, rows) in self.queries.items()},
+                "statements": dict(self.statements),
+            }
+
+    def to_prometheus(self):
+        """Return the collected metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{{{label}=\"{_escape(key)}\"}} {value}" for label, key, value in samples)
+
+        timers, queries = snapshot["timers"].items(), snapshot["queries"].items()
+        family("habit_method_calls_total", "counter", "Calls of instrumented methods.",
+               [("method", name, timer["calls"]) for name, timer in timers])
+        family("habit_method_seconds_total", "counter", "Time spent in instrumented methods.",
+               [("method", name, timer["seconds"]) for name, timer in timers])
+        family("habit_method_seconds_max", "gauge", "Slowest call of instrumented methods.",
+               [("method", name, timer["max_seconds"]) for name, timer in timers])
+        family("habit_events_total", "counter", "Counted events.",
+               [("name", name, value) for name, value in snapshot["counters"].items()])
+        family("habit_query_calls_total", "counter", "Runs of repository queries.",
+               [("sql", sql, query["calls"]) for sql, query in queries])
+        family("habit_query_seconds_total", "counter", "Time spent in repository queries, fetching included.",
+               [("sql", sql, query["seconds"]) for sql, query in queries])
+        family("habit_query_rows_total", "counter", "Rows returned by repository queries.",
+               [("sql", sql, query["rows"]) for sql, query in queries])
+        family("habit_sql_statements_total", "counter", "SQL statements run by SQLite.",
+               [("sql", sql, count) for sql, count in snapshot["statements"].items()])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the metrics to a file for the textfile collector of the Prometheus node exporter. The file is
+        replaced at once, so the collector never reads half of it."""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+def _escape(value):
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+# The metrics of the process, shared by all repositories
+metrics = Metrics(enabled=os.environ.get("HABIT_METRICS", "") not in ("", "0"))
+
+def timed(name=None):
+    """Decorator timing every call of a function under name, by default its qualified name, while metrics are
+    enabled. Exceptions are timed as well."""
+    def decorator(function):
+        label = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.observe(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -1,11 +1,32 @@
-from habit_repository import HabitRepository
-from rich import print
-from analyzer import HabitAnalyzer
-import questionary
+import os
+import sys
 
-# Initialize the HabitRepository and HabitAnalyzer Objects
-repo = HabitRepository()
-habit_analyzer = HabitAnalyzer(repo)
+# The CLI imports what a command needs when it runs and opens the database on first use, so one-shot commands start
+# fast. The database file can be chosen with the HABIT_DB environment variable, the connection profile with
+# HABIT_DB_PROFILE, see database.PROFILES, the output with HABIT_OUTPUT (rich, json or quiet) and the user whose
+# habits are tracked with HABIT_USER.
+_repo = None
+_analyzer = None
+
+def repository():
+    """Return the HabitRepository of the CLI, opening the database on first use."""
+    global _repo
+    if _repo is None:
+        from database import DEFAULT_USER
+        from habit_repository import HabitRepository
+        _repo = HabitRepository(os.environ.get("HABIT_DB", "main.db"),
+                                profile=os.environ.get("HABIT_DB_PROFILE", "default"),
+                                renderer=os.environ.get("HABIT_OUTPUT", "rich"),
+                                user_id=os.environ.get("HABIT_USER", DEFAULT_USER))
+    return _repo
+
+def analyzer():
+    """Return the HabitAnalyzer of the CLI, opening the database on first use."""
+    global _analyzer
+    if _analyzer is None:
+        from analyzer import HabitAnalyzer
+        _analyzer = HabitAnalyzer(repository())
+    return _analyzer
 
 # Add some default habits for the User to interact with
 # repo.add_habit("meditate", "meditate for 10 minutes", "weekly")
@@ -16,6 +37,9 @@ habit_analyzer = HabitAnalyzer(repo)
 
 def cli():
     """Command Line Interface for Habit Tracker. Main menu for user interaction."""
+    import questionary
+    from rich import print
+    repo = repository()
 
     # Initialize the main loop control variable
     should_continue = True
@@ -29,6 +53,7 @@ def cli():
             choices = [
                 "Create new habit",
                 "Delete existing habit",
+                "Rename existing habit",
                 "Clear all habits and events",
                 "Complete a habit task",
                 "View habit details",
@@ -43,14 +68,39 @@ def cli():
             periodicity = questionary.select(
                 "Select the periodicity of the habit:",
                 choices=["Daily",
-                         "Weekly",]
+                         "Weekly",
+                         "Every N days",
+                         "ISO weekly",
+                         "Monthly",
+                         "Weekdays",]
             ).ask()
+            if periodicity == "Every N days":
+                # Anything but a positive number of days would leave the habit without a schedule
+                days = questionary.text(
+                    "Every how many days is the habit due?",
+                    validate=lambda text: (text.isdigit() and int(text) > 0) or "Enter a whole number of days from 1."
+                ).ask()
+                if days is None:
+                    continue
+                periodicity = f"Every {days} days"
+            elif periodicity == "Weekdays":
+                weekdays = questionary.checkbox(
+                    "Select the weekdays of the habit (none for Monday to Friday):",
+                    choices=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+                ).ask()
+                if weekdays:
+                    periodicity = "Weekdays: " + ", ".join(weekdays)
             repo.add_habit(name, description, periodicity)
 
         elif choice == "Delete existing habit":
             name = questionary.text("Enter the name of the habit to delete:").ask()
             repo.delete_habit(name)
 
+        elif choice == "Rename existing habit":
+            name = questionary.text("Enter the name of the habit to rename:").ask()
+            new_name = questionary.text("Enter the new name of the habit:").ask()
+            repo.rename_habit(name, new_name)
+
         elif choice == "Clear all habits and events":
             confirm = questionary.confirm("Are you sure you want to clear all habits and events?").ask()
             if confirm:
@@ -73,6 +123,8 @@ def cli():
 
 def view_menu():
             """Display the menu for viewing habits. Sub menu of the main menu."""
+            import questionary
+            repo = repository()
             choice = questionary.select(
                 "View Menu: What would you like to do?",
                 choices=["List one specific habit",
@@ -102,25 +154,36 @@ def view_menu():
 
 def analytics_menu():
             """Display the menu for analyzing habits. Sub menu of the main menu."""
+            import questionary
+            from rich import print
+            from results import outcome, HABIT_NOT_FOUND, NO_SCHEDULE
+            from scheduler import DueScheduler
+            from streaks import recompute_all
+            repo, habit_analyzer = repository(), analyzer()
             choice = questionary.select(
                 "Analytics Menu: What would you like to do?",
                 choices=["Display completion state of a specific habit (both daily/weekly)",
                          "Display most difficult to maintain habit",
                          "Display the habit with the longest overall streak",
+                         "Display the top 10 habits leaderboard",
                          "List all overdue habits",
+                         "Display completion rates over the last 7/30/90 days",
+                         "Recompute streaks from event history",
+                         "Process reminders and expired streaks",
                          "Back to main menu",
                          ]
             ).ask()
 
             if choice == "Display completion state of a specific habit (both daily/weekly)":
                 name = questionary.text("Enter the name of the habit:").ask()
-                if repo.get_one_habit(name):
-                    if repo.get_one_habit(name)[0].periodicity.lower() == "daily":
-                        habit_analyzer.daily_habit_completed(name)
-                    elif repo.get_one_habit(name)[0].periodicity.lower() == "weekly":
-                        habit_analyzer.weekly_habit_completed(name)
+                state = habit_analyzer.completion_state(name)
+                if state:
+                    repo.renderer.completion(state)
+                elif not repo.get_one_habit(name):
+                    repo.renderer.outcome(outcome("completion_state", HABIT_NOT_FOUND, name))
                 else:
-                    print(f"[red]Habit '{name}' not found.[/red]")
+                    repo.renderer.outcome(outcome("completion_state", NO_SCHEDULE, name,
+                                                  periodicity=repo.get_one_habit(name)[0].periodicity))
 
             elif choice == "Display most difficult to maintain habit":
                 habit_analyzer.biggest_struggle()
@@ -128,12 +191,121 @@ def analytics_menu():
             elif choice == "Display the habit with the longest overall streak":
                 habit_analyzer.longest_overall_streak()
 
+            elif choice == "Display the top 10 habits leaderboard":
+                ranking = questionary.select(
+                    "Rank habits by:",
+                    choices=["streak", "longest_streak", "struggle"]
+                ).ask()
+                # A cancelled prompt returns to the menu
+                if ranking is not None:
+                    habit_analyzer.list_top_habits(10, by=ranking)
+
             elif choice == "List all overdue habits":
                 habit_analyzer.list_all_overdue_habits()#
 
+            elif choice == "Display completion rates over the last 7/30/90 days":
+                habit_analyzer.list_habit_trends()
+
+            elif choice == "Recompute streaks from event history":
+                summaries = recompute_all(repo)
+                print(f"[green]Recomputed streaks of {len(summaries)} habits from their events.[/green]")
+
+            elif choice == "Process reminders and expired streaks":
+                DueScheduler(repo).load_due().run()
+
             elif choice == "Back to main menu":
                 return
 
 
+# Exit status of the status command for a habit without a schedule, which has no completion state to check
+NO_SCHEDULE_STATUS = 2
+
+def exit_status(result):
+    """Return the exit status of a command that made a write: 0 if it went through, 1 otherwise."""
+    return 0 if result.ok else 1
+
+def run_command(argv):
+    """Run one non-interactive command, e.g. python main.py done Read, and return its exit status: 0 on success, 1
+    if the write was rejected or the habit was not found, NO_SCHEDULE_STATUS if status has nothing to check."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="main.py", description="Habit Tracker. Without a command the interactive"
+                                                                 " menu starts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="add a habit")
+    add.add_argument("name")
+    add.add_argument("--periodicity", default="Daily", help="e.g. Daily, Weekly, 'Every 3 days', Monthly")
+    add.add_argument("--description", default="")
+    done = commands.add_parser("done", help="complete a habit")
+    done.add_argument("name")
+    done.add_argument("--date", default="", help="YYYY-MM-DD (default: today)")
+    commands.add_parser("delete", help="delete a habit and its events").add_argument("name")
+    rename = commands.add_parser("rename", help="rename a habit")
+    rename.add_argument("name")
+    rename.add_argument("new_name")
+    commands.add_parser("list", help="list all habits, or one").add_argument("name", nargs="?")
+    commands.add_parser("events", help="list all habit events, or those of one habit").add_argument("name", nargs="?")
+    commands.add_parser("status", help="show whether a habit is completed for its period").add_argument("name")
+    commands.add_parser("overdue", help="list the overdue habits")
+    top = commands.add_parser("top", help="show the habits leaderboard")
+    top.add_argument("--by", default="streak", choices=["streak", "longest_streak", "struggle"])
+    top.add_argument("-k", type=int, default=10)
+    trends = commands.add_parser("trends", help="show completion rates, weekly heatmaps and busiest weekdays")
+    trends.add_argument("--windows", default="7,30,90", help="comma separated window lengths in days")
+    trends.add_argument("--weeks", type=int, default=12, help="number of weeks in the heatmap")
+    commands.add_parser("remind", help="emit reminders and reset expired streaks")
+    args = parser.parse_args(argv)
+
+    repo = repository()
+    if args.command == "add":
+        return exit_status(repo.add_habit(args.name, args.description, args.periodicity))
+    if args.command == "done":
+        return exit_status(repo.add_habit_event(args.name, args.date))
+    if args.command == "delete":
+        return exit_status(repo.delete_habit(args.name))
+    if args.command == "rename":
+        return exit_status(repo.rename_habit(args.name, args.new_name))
+    if args.command == "list":
+        if args.name is None:
+            repo.list_all_habits()
+            return 0
+        repo.list_one_habit(args.name)
+        return 0 if repo.get_one_habit(args.name) else 1
+    if args.command == "events":
+        if args.name is None:
+            repo.list_all_habit_events()
+            return 0
+        repo.list_one_habit_events(args.name)
+        return 0 if repo.get_one_habit(args.name) else 1
+    if args.command == "status":
+        state = analyzer().completion_state(args.name)
+        if state:
+            repo.renderer.completion(state)
+            return 0
+        from results import outcome, HABIT_NOT_FOUND, NO_SCHEDULE
+        habits = repo.get_one_habit(args.name)
+        if not habits:
+            repo.renderer.outcome(outcome("completion_state", HABIT_NOT_FOUND, args.name))
+            return 1
+        repo.renderer.outcome(outcome("completion_state", NO_SCHEDULE, args.name, periodicity=habits[0].periodicity))
+        return NO_SCHEDULE_STATUS
+    if args.command == "overdue":
+        analyzer().list_all_overdue_habits()
+    elif args.command == "top":
+        analyzer().list_top_habits(args.k, by=args.by)
+    elif args.command == "trends":
+        analyzer().list_habit_trends(tuple(int(days) for days in args.windows.split(",")), args.weeks)
+    elif args.command == "remind":
+        from scheduler import DueScheduler
+        DueScheduler(repo).load_due().run()
+    return 0
+
 if __name__ =="__main__":
-    cli()
\ No newline at end of file
+    status = run_command(sys.argv[1:]) if len(sys.argv) > 1 else cli()
+    # With HABIT_METRICS=1 the metrics of the session are left in a Prometheus text file
+    if _repo is not None:
+        from instrumentation import metrics
+        if metrics.enabled:
+            metrics.write_prometheus(os.environ.get("HABIT_METRICS_FILE", "habit_metrics.prom"))
+        _repo.close()
+    sys.exit(status)
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List
+import numpy as np
+from connection_pool import is_memory_database
+from database import DEFAULT_USER
+from habit import OverdueHabit
+from habit_repository import HabitRepository
+from habit_stats import HabitStats, stats_from_row
+from streaks import batch_to_codes, compute_streaks, schedule_periods
+
+@dataclass
+class AnalyticsReport:
+    """A data class to represent the analytics of all habits of a user, rebuilt from their events: the top k habits
+    by current streak and by struggle score, and every overdue habit."""
+    habit_count: int = 0
+    event_count: int = 0
+    top_streaks: List[HabitStats] = field(default_factory=list)
+    top_struggles: List[HabitStats] = field(default_factory=list)
+    overdue: List[OverdueHabit] = field(default_factory=list)
+    shards: int = 0
+    workers: int = 0
+    elapsed: float = 0.0
+
+def _stats_rows(indexes, habits, streaks, longest, event_counts, struggles, last_events, next_due):
+    """Build rows in the order of habit_stats.STATS_SELECT for the habits at the given indexes. Workers hand back
+    plain tuples, which are cheap to send between processes."""
+    def day(ordinal):
+        return date.fromordinal(int(ordinal)).isoformat() if ordinal > 0 else None
+
+    return [(habits[i].habit_id, habits[i].name, habits[i].periodicity, int(streaks[i]), int(longest[i]),
+             int(event_counts[i]), None if np.isnan(struggles[i]) else float(struggles[i]),
+             day(last_events[i]), day(next_due[i])) for i in indexes]
+
+def analyze_shard(db_name, user_id, shard, shard_count, today_ordinal, k):
+    """Compute the analytics of one shard of a user's habits from their events, in a worker process.
+    Returns (habit_count, event_count, top streak rows, top struggle rows, overdue rows)."""
+    # One connection per worker is enough, reads go through the writer when there are no readers
+    repo = HabitRepository(db_name, readers=0, user_id=user_id)
+    try:
+        habits = repo.get_all_habits(shard=(shard, shard_count))
+        batch = repo.get_event_batch(shard=(shard, shard_count))
+    finally:
+        repo.close()
+
+    habit_codes, ordinals = batch_to_codes(batch, [habit.name for habit in habits])
+    periods, max_gaps, today_periods = schedule_periods(habits, habit_codes, ordinals, date.fromordinal(today_ordinal))
+    streaks, longest, event_counts = compute_streaks(habit_codes, periods, max_gaps, today_periods)
+
+    # Last event and next due day per habit, 0 where there is none
+    last_events = np.zeros(len(habits), dtype=np.int64)
+    np.maximum.at(last_events, habit_codes, ordinals)
+    due_dates = [habit.schedule.next_due(date.fromordinal(int(last))) if last > 0 else None
+                 for habit, last in zip(habits, last_events)]
+    next_due = np.array([due.toordinal() if due else 0 for due in due_dates], dtype=np.int64)
+
+    # Share of events outside the current streak, NaN where habit_stats.struggle_score gives no score
+    with np.errstate(divide="ignore", invalid="ignore"):
+        struggles = np.where((event_counts > 0) & (event_counts != streaks),
+                             (event_counts - streaks) / event_counts, np.nan)
+
+    # Ties go to the habit that was added first, like in the leaderboard
+    habit_ids = np.array([habit.habit_id for habit in habits], dtype=np.int64)
+    top_streaks = np.lexsort((habit_ids, -streaks))[:k]
+    scored = np.flatnonzero(~np.isnan(struggles))
+    top_struggles = scored[np.lexsort((habit_ids[scored], -struggles[scored]))][:k]
+    overdue = np.flatnonzero((last_events == 0) | ((next_due > 0) & (next_due <= today_ordinal)))
+
+    columns = (habits, streaks, longest, event_counts, struggles, last_events, next_due)
+    return (len(habits), int(len(ordinals)), _stats_rows(top_streaks, *columns), _stats_rows(top_struggles, *columns),
+            _stats_rows(overdue, *columns))
+
+def merge_shards(results, k):
+    """Merge the results of analyze_shard into one AnalyticsReport."""
+    report = AnalyticsReport()
+    streak_rows, struggle_rows, overdue_rows = [], [], []
+    for habit_count, event_count, top_streaks, top_struggles, overdue in results:
+        report.habit_count += habit_count
+        report.event_count += event_count
+        streak_rows += top_streaks
+        struggle_rows += top_struggles
+        overdue_rows += overdue
+
+    # Every shard sent its own top k, so the overall top k is among them
+    report.top_streaks = [stats_from_row(row) for row in sorted(streak_rows, key=lambda row: (-row[3], row[0]))[:k]]
+    report.top_struggles = [stats_from_row(row) for row in sorted(struggle_rows, key=lambda row: (-row[6], row[0]))[:k]]
+    report.overdue = [OverdueHabit(name=row[1], periodicity=row[2],
+                                   last_event_date=date.fromisoformat(row[7]) if row[7] else None)
+                      for row in sorted(overdue_rows, key=lambda row: row[1])]
+    return report
+
+def parallel_report(db_name="main.db", user_id=DEFAULT_USER, workers=None, shards=None, k=10, today=None):
+    """Rebuild the analytics of all habits of a user from their events, split into shards of habits that are
+    analyzed by a pool of worker processes, and merge them into one AnalyticsReport. workers defaults to the number
+    of cores and shards to the number of workers. With a single worker the shards are analyzed in this process."""
+    if is_memory_database(db_name):
+        raise ValueError("Parallel analytics need a database file that the worker processes can open.")
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers
+    today = today or date.today()
+
+    tasks = [(db_name, user_id, shard, shards, today.toordinal(), k) for shard in range(shards)]
+    if workers == 1:
+        results = [analyze_shard(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(analyze_shard, *zip(*tasks)))
+
+    report = merge_shards(results, k)
+    report.shards = shards
+    report.workers = workers
+    report.elapsed = time.perf_counter() - start
+    return report
+
+if __name__ == "__main__":
+    # Nightly report from the command line: python parallel_analytics.py [db_name] [workers] [user_id]
+    arguments = sys.argv[1:]
+    result = parallel_report(arguments[0] if arguments else "main.db",
+                             user_id=arguments[2] if len(arguments) > 2 else DEFAULT_USER,
+                             workers=int(arguments[1]) if len(arguments) > 1 else None)
+    print(f"{result.habit_count} habits, {result.event_count} events, {result.shards} shards on {result.workers}"
+          f" workers in {result.elapsed:.2f}s")
+    for rank, habit in enumerate(result.top_streaks, start=1):
+        print(f"{rank}. {habit.name} ({habit.periodicity}) - streak {habit.streak}")
+    print(f"{len(result.overdue)} habits overdue")
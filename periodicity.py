@@ -0,0 +1,152 @@
+import re
+from datetime import date
+from functools import lru_cache
+
+# Day ordinal of 1970-01-01, the epoch of numpy datetime64 values
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Weekday abbreviations in date.weekday() order
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+class Periodicity:
+    """Base class of the schedules a habit can follow. A schedule numbers the periods a habit is done in: every day
+    falls into the period period_index(day), and a habit is done once per gap periods. From that follow all rules:
+    an event too soon after the last one, a streak broken by a missed period and the next due date.
+    Schedules are immutable and shared, get them with parse_periodicity."""
+    # Number of periods between two completions, None if the habit has no schedule
+    gap = None
+
+    def period_index(self, day: date) -> int:
+        """Return the number of the period a day falls in."""
+        return day.toordinal()
+
+    def period_indexes(self, ordinals):
+        """Return the period numbers of a numpy int64 array of day ordinals, like period_index does for one day."""
+        return ordinals
+
+    def period_start(self, index: int) -> date:
+        """Return the first day of a period."""
+        return date.fromordinal(index)
+
+    def event_too_soon(self, last_event_date: date, event_date: date):
+        """Check if an event follows the last one before the habit is due again."""
+        if self.gap is None:
+            return False
+        return self.period_index(event_date) - self.period_index(last_event_date) < self.gap
+
+    def breaks_streak(self, last_event_date: date, today: date):
+        """Check if a whole period was missed between the last event and today."""
+        if self.gap is None or last_event_date is None:
+            return False
+        return self.period_index(today) - self.period_index(last_event_date) > self.gap
+
+    def next_due(self, last_event_date):
+        """Return the first day the habit is due again after its last event, or None if that does not apply."""
+        if self.gap is None or last_event_date is None:
+            return None
+        return self.period_start(self.period_index(last_event_date) + self.gap)
+
+    def streak_expires(self, last_event_date):
+        """Return the first day on which the streak is broken if no event follows the last one, or None if the
+        streak never breaks. This is the start of the period after the one the habit is next due in."""
+        if self.gap is None or last_event_date is None:
+            return None
+        return self.period_start(self.period_index(last_event_date) + self.gap + 1)
+
+class Unscheduled(Periodicity):
+    """A habit without a known schedule: it is never due and never loses its streak."""
+
+class EveryNDays(Periodicity):
+    """Rolling schedule: due again n days after the last event, no matter on which weekday. Daily and Weekly habits
+    follow it with n = 1 and n = 7."""
+
+    def __init__(self, days: int):
+        if days < 1:
+            raise ValueError("A habit has to be done at most once a day.")
+        self.gap = days
+
+class IsoWeekly(Periodicity):
+    """Once per ISO calendar week, from Monday to Sunday."""
+    gap = 1
+
+    def period_index(self, day):
+        # Day ordinal 1 is a Monday, so weeks start at the ordinals 1, 8, 15, ...
+        return (day.toordinal() - 1) // 7
+
+    def period_indexes(self, ordinals):
+        return (ordinals - 1) // 7
+
+    def period_start(self, index):
+        return date.fromordinal(index * 7 + 1)
+
+class Monthly(Periodicity):
+    """Once per calendar month."""
+    gap = 1
+
+    def period_index(self, day):
+        return (day.year - 1970) * 12 + day.month - 1
+
+    def period_indexes(self, ordinals):
+        days = (ordinals - EPOCH_ORDINAL).astype("datetime64[D]")
+        return days.astype("datetime64[M]").astype("int64")
+
+    def period_start(self, index):
+        return date(1970 + index // 12, index % 12 + 1, 1)
+
+class OnWeekdays(Periodicity):
+    """On specific weekdays, e.g. Monday, Wednesday and Friday. Every scheduled day opens a period that lasts until
+    the next scheduled day, so a late completion still counts for the day it was due."""
+    gap = 1
+
+    def __init__(self, weekdays):
+        self.weekdays = tuple(sorted(set(weekdays)))
+        if not self.weekdays or not all(0 <= weekday <= 6 for weekday in self.weekdays):
+            raise ValueError("Specific weekday habits need at least one weekday from 0 (Monday) to 6 (Sunday).")
+        # Number of scheduled days in a week up to and including each weekday
+        self._scheduled_until = tuple(sum(1 for scheduled in self.weekdays if scheduled <= weekday)
+                                      for weekday in range(7))
+
+    def period_index(self, day):
+        week, weekday = divmod(day.toordinal() - 1, 7)
+        return week * len(self.weekdays) + self._scheduled_until[weekday]
+
+    def period_indexes(self, ordinals):
+        # Only bulk analytics pass arrays, numpy stays out of the CLI startup
+        import numpy as np
+        weeks, weekdays = np.divmod(ordinals - 1, 7)
+        return weeks * len(self.weekdays) + np.array(self._scheduled_until, dtype=np.int64)[weekdays]
+
+    def period_start(self, index):
+        week, slot = divmod(index - 1, len(self.weekdays))
+        return date.fromordinal(week * 7 + self.weekdays[slot] + 1)
+
+@lru_cache(maxsize=None)
+def parse_periodicity(text):
+    """Return the schedule of a periodicity as stored in the habits table. Understood are "Daily", "Weekly",
+    "every N days", "ISO weekly", "Monthly", "Weekdays" (Monday to Friday) and "Weekdays: mon, wed, fri", in any
+    case. Anything else is Unscheduled. Results are cached, so this is cheap enough to call for every check."""
+    spec = (text or "").strip().lower()
+    if spec == "daily":
+        return EveryNDays(1)
+    if spec == "weekly":
+        return EveryNDays(7)
+    if spec in ("iso weekly", "iso-weekly"):
+        return IsoWeekly()
+    if spec == "monthly":
+        return Monthly()
+    every = re.fullmatch(r"every\s+(\d+)\s+days?", spec)
+    if every and int(every.group(1)) >= 1:
+        return EveryNDays(int(every.group(1)))
+    weekdays = re.fullmatch(r"weekdays(?:\s*:\s*(.+))?", spec)
+    if weekdays:
+        names = re.split(r"[\s,]+", weekdays.group(1).strip()) if weekdays.group(1) else WEEKDAY_NAMES[:5]
+        if all(name[:3] in WEEKDAY_NAMES for name in names):
+            return OnWeekdays(WEEKDAY_NAMES.index(name[:3]) for name in names)
+    return Unscheduled()
+
+def check_periodicity(text):
+    """Raise a ValueError if a periodicity starts like "every N days" or "Weekdays" but cannot be followed, e.g.
+    "Every 0 days" or "Weekdays: Funday", which parse_periodicity takes as Unscheduled. Other texts are fine."""
+    if re.match(r"(every\s|weekdays\b)", (text or "").strip().lower()) \
+            and isinstance(parse_periodicity(text), Unscheduled):
+        raise ValueError(f"'{text}' is no schedule, expected e.g. 'Every 3 days' or 'Weekdays: mon, wed, fri'.")
@@ -0,0 +1,331 @@
+import json
+import sys
+from dataclasses import fields, is_dataclass
+from datetime import date
+from instrumentation import timed
+from results import (HABIT_ADDED, HABIT_RENAMED, HABIT_DELETED, DATABASE_CLEARED, EVENT_ADDED, HABIT_NOT_FOUND,
+                     HABIT_EXISTS, EMPTY_NAME, INVALID_PERIODICITY, NO_SCHEDULE, INVALID_DATE, FUTURE_DATE,
+                     TOO_SOON)
+
+class Renderer:
+    """Base class of the output layer. The repository and the analyzer hand their results to a renderer instead of
+    printing them. This base class renders nothing, so callers that only want the data pay no formatting or
+    terminal I/O cost."""
+
+    def outcome(self, outcome):
+        """Render the Outcome of a repository write."""
+
+    def bulk_report(self, report):
+        """Render the BulkIngestReport of a bulk event ingestion."""
+
+    def habit(self, name, habit):
+        """Render a single HabitTracker object, or that the habit with the given name was not found (habit is None)."""
+
+    def habits(self, habits):
+        """Render a list of HabitTracker objects."""
+
+    def events(self, events, habit_name=None):
+        """Render an iterable of HabitEvent objects, of one habit if habit_name is given, consuming it as it goes."""
+
+    def leaderboard(self, leaders, by):
+        """Render a leaderboard of HabitStats objects ranked by the given column."""
+
+    def completion(self, state):
+        """Render the CompletionState of a habit."""
+
+    def overdue(self, habits):
+        """Render a list of OverdueHabit objects."""
+
+    def trends(self, trends):
+        """Render a list of HabitTrends: completion rates per window, heatmaps and weekday distributions."""
+
+    def scheduler_run(self, run):
+        """Render the SchedulerRun of the DueScheduler: the reminders it emitted and the streaks it reset."""
+
+    def longest_streak(self, leader, has_habits):
+        """Render the HabitStats of the habit with the longest streak, None if no habit has a streak."""
+
+    def struggle(self, leader, has_habits):
+        """Render the HabitStats of the habit with the biggest struggle, None if no habit struggles."""
+
+class QuietRenderer(Renderer):
+    """Renderer for batch jobs and programmatic callers: renders nothing."""
+
+def longest_streak_message(leader, has_habits):
+    """Return the message about the habit with the longest streak, or None for periodicities it does not cover."""
+    if leader is None:
+        return "No habits with a streak were found." if has_habits else "No habits found."
+    if leader.periodicity.lower() == "daily":
+        return (f"The longest overall streak is [bold purple]{leader.streak} days[/bold purple] for the daily"
+                f" habit [bold purple]{leader.name}[/bold purple].")
+    if leader.periodicity.lower() == "weekly":
+        return (f"The longest overall streak is [bold purple]{leader.streak} week/s[/bold purple] for the weekly"
+                f" habit [bold purple]{leader.name}[/bold purple].")
+    return None
+
+# Messages of failed writes by operation, for failures whose message depends on what was attempted
+NOT_FOUND_HINTS = {
+    "rename_habit": "Please select an existing habit to rename.",
+    "delete_habit": "Please select an existing habit to delete.",
+    "add_habit_event": "Please add the habit before trying to complete an event!",
+}
+
+# Weekday names, and the characters of a heatmap week with 0, 1, 2, 3 and 4 or more completions
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+HEATMAP_SHADES = "·░▒▓█"
+
+class RichRenderer(Renderer):
+    """Renderer for the interactive CLI: prints colored messages to the terminal with rich."""
+
+    def __init__(self):
+        # Importing rich is the most expensive part of the output layer, only pay for it when it is used
+        import rich
+        self.print = timed("RichRenderer.print")(rich.print)
+
+    def outcome(self, outcome):
+        name = outcome.habit_name
+        if outcome.code == HABIT_ADDED:
+            self.print(f"[green]Habit '{name}' added successfully.[/green]")
+        elif outcome.code == HABIT_RENAMED:
+            self.print(f"[green]Habit '{name}' renamed to '{outcome.new_name}'.[/green]")
+        elif outcome.code == HABIT_DELETED:
+            if outcome.had_events:
+                self.print(f"[dark_orange]All events for habit '{name}' have been deleted.[/dark_orange]")
+            else:
+                self.print(f"[red]No events found for habit '{name}'.[/red]")
+            self.print(f"[dark_orange]Habit '{name}' deleted successfully.[/dark_orange]")
+        elif outcome.code == DATABASE_CLEARED:
+            self.print("[green]All habits and events have been cleared from the database.[/green]")
+        elif outcome.code == EVENT_ADDED:
+            if outcome.streak_reset:
+                self.print(f"[dark_orange]Streak for habit '{name}' has been reset due to inactivity.[/dark_orange]")
+            self.print(f"[green]Event added for habit '{name}' on {outcome.event_date}.[/green]")
+        elif outcome.code == HABIT_NOT_FOUND:
+            hint = NOT_FOUND_HINTS.get(outcome.operation, "")
+            self.print(f"[red]Habit '{name}' not found.{' ' + hint if hint else ''}[/red]")
+        elif outcome.code == HABIT_EXISTS:
+            self.print(f"[red]Habit '{outcome.new_name or name}' already exists."
+                       f" Please choose a different name.[/red]")
+        elif outcome.code == EMPTY_NAME:
+            self.print("[red]Habit name cannot be empty. Please provide a valid name.[/red]")
+        elif outcome.code == INVALID_PERIODICITY:
+            self.print(f"[red]'{outcome.periodicity}' is no schedule. Please use e.g. 'Every 3 days' or"
+                       f" 'Weekdays: mon, wed, fri'.[/red]")
+        elif outcome.code == NO_SCHEDULE:
+            self.print(f"[dark_orange]Habit [bold purple]{name}[/bold purple] has no schedule"
+                       f" ({outcome.periodicity}), so it is never due and has no completion state.[/dark_orange]")
+        elif outcome.code == INVALID_DATE:
+            self.print("[red]Invalid format! Please use YYYY-MM-DD (e.g., 2025-06-01).[/red]")
+        elif outcome.code == FUTURE_DATE:
+            self.print(f"[red]You cannot add an event for habit [bold purple]{name}[/bold purple]"
+                       f" that's the future![/red]")
+        elif outcome.code == TOO_SOON and outcome.wait_days is None:
+            self.print(f"[red]You cannot add another event for this {outcome.periodicity.lower()} habit"
+                       f" [bold purple]{name}[/bold purple] today. "
+                       f"Please wait until [bold purple]tomorrow[/bold purple]"
+                       f" before adding another event.[/red]")
+        elif outcome.code == TOO_SOON:
+            self.print(f"[red]You cannot add another event for habit [bold purple]{name}[/bold purple] so soon."
+                       f" Please wait another [bold purple]{outcome.wait_days} days[/bold purple]"
+                       f" before adding another event.[/red]")
+
+    def bulk_report(self, report):
+        self.print(f"[green]Added {report.accepted} events, rejected {len(report.rejected)}"
+                   f" ({report.rows_per_second:,.0f} rows/s).[/green]")
+
+    def _print_habit(self, habit, end="\n"):
+        """Print the details of a HabitTracker object."""
+        self.print(
+            f"Habit name: [bold purple]{habit.name}[/bold purple]\n"
+            f" description: {habit.description}\n"
+            f" periodicity: {habit.periodicity}\n"
+            f" streak: {habit.streak}\n"
+            f" number of events: {habit.event_count}\n{end}"
+        )
+
+    def habit(self, name, habit):
+        if habit is None:
+            self.print(f"[red]Habit '{name}' not found. Please select an existing habit,"
+                       f" or add it to your list![/red]")
+            return
+        self._print_habit(habit, end="\n")
+
+    def habits(self, habits):
+        if not habits:
+            self.print("[red]No habits found.[/red]")
+        for habit in habits:
+            self._print_habit(habit, end="")
+
+    def events(self, events, habit_name=None):
+        count = 0
+        for event in events:
+            self.print(
+                f"Event date: [bold purple]{event.completed_at}[/bold purple]\n"
+                f" Habit name: {event.habit_name}\n"
+            )
+            count += 1
+        if count:
+            return
+        if habit_name is None:
+            self.print("[red]No habit events found.[/red]")
+        else:
+            self.print(f"[red]No events found for habit '{habit_name}'.[/red]")
+
+    def leaderboard(self, leaders, by):
+        if not leaders:
+            self.print("[red]No habits found.[/red]")
+            return
+        self.print(f"[dark_orange]Top {len(leaders)} habits by {by.replace('_', ' ')}:[/dark_orange]")
+        for rank, habit in enumerate(leaders, start=1):
+            score = f"{habit.struggle:.2f}" if by == "struggle" else getattr(habit, by)
+            self.print(f"{rank}. [bold purple]{habit.name}[/bold purple] ({habit.periodicity}) - {score}")
+
+    def completion(self, state):
+        name = state.habit_name
+        if state.periodicity.lower() == "daily":
+            if state.completed:
+                self.print(f"[green]Daily habit [bold purple]{name}[/bold purple] has already been completed"
+                           f" today![/green]")
+            else:
+                self.print(f"[red]Daily habit [bold purple]{name}[/bold purple] still to be completed today![/red]")
+        elif state.periodicity.lower() == "weekly":
+            if state.completed:
+                self.print(f"[green]Weekly habit [bold purple]{name}[/bold purple] was completed on the"
+                           f" [bold purple]{state.last_event_date}[/bold purple] of this week! Next completion due in"
+                           f" [bold purple]{state.due_in_days} days[/bold purple] on the"
+                           f" [bold purple]{state.next_due_date}[/bold purple]![/green]")
+            else:
+                self.print(f"[red]Weekly habit [bold purple]{name}[/bold purple] was not completed this week and is"
+                           f" due today![/red]")
+        elif state.completed:
+            self.print(f"[green]Habit [bold purple]{name}[/bold purple] ({state.periodicity}) was completed on the"
+                       f" [bold purple]{state.last_event_date}[/bold purple]! Next completion due in"
+                       f" [bold purple]{state.due_in_days} days[/bold purple] on the"
+                       f" [bold purple]{state.next_due_date}[/bold purple]![/green]")
+        else:
+            self.print(f"[red]Habit [bold purple]{name}[/bold purple] ({state.periodicity}) is due today![/red]")
+
+    def overdue(self, habits):
+        if not habits:
+            self.print("[green]No overdue habits found![/green]")
+            return
+        self.print("[dark_orange]Overdue habits:[/dark_orange]")
+        for habit in habits:
+            self.print(f"[bold purple]{habit.name}[/bold purple] - Last completed on:"
+                       f"[bold purple] {habit.last_event_date or 'Never'}[/bold purple]")
+
+    def trends(self, trends):
+        if not trends:
+            self.print("[red]No habits found to analyze.[/red]")
+            return
+        self.print("[dark_orange]Completion rates, weekly heatmap (oldest week first) and busiest weekday:"
+                   "[/dark_orange]")
+        for trend in trends:
+            rates = " | ".join(f"{days}d: {'-' if rate is None else f'{rate:.0%}'}"
+                               for days, rate in trend.rates.items())
+            heatmap = "".join(HEATMAP_SHADES[min(sum(week), len(HEATMAP_SHADES) - 1)] for week in trend.heatmap)
+            busiest = WEEKDAYS[trend.weekdays.index(max(trend.weekdays))] if any(trend.weekdays) else "-"
+            self.print(f"[bold purple]{trend.name}[/bold purple] ({trend.periodicity}) - {rates} - {heatmap} -"
+                       f" {busiest}")
+
+    def scheduler_run(self, run):
+        for reminder in run.reminders:
+            self.print(f"[dark_orange]Reminder: habit [bold purple]{reminder.habit_name}[/bold purple]"
+                       f" ({reminder.periodicity}) is due since [bold purple]{reminder.due_date}[/bold purple]!"
+                       f"[/dark_orange]")
+        for name in run.streak_resets:
+            self.print(f"[red]The streak of habit [bold purple]{name}[/bold purple] was reset, it was not completed"
+                       f" in time.[/red]")
+
+    def longest_streak(self, leader, has_habits):
+        message = longest_streak_message(leader, has_habits)
+        if message:
+            self.print(message)
+
+    def struggle(self, leader, has_habits):
+        if leader is None and not has_habits:
+            self.print("[red]No habits found to analyze.[/red]")
+        elif leader is None:
+            self.print("[green]You're doing great! No struggling habits found.[/green]")
+        else:
+            self.print(
+                f"[dark_orange]Your biggest struggle is the habit [bold purple]{leader.name}[/bold purple], "
+                f"with a struggle score of [bold purple]{leader.struggle:.2f}[/bold purple]. "
+                f"This is your most difficult to maintain habit currently."
+                f"\n The struggle score lives between '0' and '1', scores closer to '1' indicate a bigger struggle, "
+                f"scores closer to '0' indicate a smaller struggle :) [/dark_orange]"
+            )
+
+def to_plain(value):
+    """Turn result objects into JSON compatible values: data classes and slotted classes become dicts, dates ISO
+    strings."""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    if is_dataclass(value):
+        return {field.name: to_plain(getattr(value, field.name)) for field in fields(value)}
+    if hasattr(value, "__slots__"):
+        return {slot: to_plain(getattr(value, slot)) for slot in value.__slots__ if not slot.startswith("_")}
+    return value
+
+class JsonRenderer(Renderer):
+    """Renderer for scripts: writes one JSON object per line, with a "type" key telling what it describes."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def _write(self, kind, **payload):
+        """Write one JSON line."""
+        self.stream.write(json.dumps({"type": kind, **{key: to_plain(value) for key, value in payload.items()}}))
+        self.stream.write("\n")
+
+    def outcome(self, outcome):
+        self._write("outcome", ok=outcome.ok, **to_plain(outcome))
+
+    def bulk_report(self, report):
+        self._write("bulk_report", accepted=report.accepted, rejected=report.rejected,
+                    streak_resets=report.streak_resets, elapsed=report.elapsed)
+
+    def habit(self, name, habit):
+        self._write("habit", name=name, habit=habit)
+
+    def habits(self, habits):
+        self._write("habits", habits=habits)
+
+    def events(self, events, habit_name=None):
+        # Events are streamed, so they are written one line each instead of as one list
+        for event in events:
+            self._write("event", **to_plain(event))
+
+    def leaderboard(self, leaders, by):
+        self._write("leaderboard", by=by, habits=leaders)
+
+    def completion(self, state):
+        self._write("completion", due_in_days=state.due_in_days, **to_plain(state))
+
+    def overdue(self, habits):
+        self._write("overdue", habits=habits)
+
+    def trends(self, trends):
+        self._write("trends", habits=trends)
+
+    def scheduler_run(self, run):
+        self._write("scheduler_run", **to_plain(run))
+
+    def longest_streak(self, leader, has_habits):
+        self._write("longest_streak", habit=leader)
+
+    def struggle(self, leader, has_habits):
+        self._write("struggle", habit=leader)
+
+# Renderers selectable by name, e.g. by the CLI
+RENDERERS = {"rich": RichRenderer, "quiet": QuietRenderer, "json": JsonRenderer}
+
+def get_renderer(renderer):
+    """Return a new renderer for a renderer name, or the renderer itself if one is passed in."""
+    if isinstance(renderer, Renderer):
+        return renderer
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer '{renderer}', expected one of {', '.join(RENDERERS)}.")
+    return RENDERERS[renderer]()
@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Optional
+from habit_event import REJECT_FUTURE_DATE, REJECT_INVALID_DATE, REJECT_TOO_SOON
+
+# Codes of the outcome of a repository write. Rejected habit events share their codes with the bulk ingestion.
+HABIT_ADDED = "habit_added"
+HABIT_RENAMED = "habit_renamed"
+HABIT_DELETED = "habit_deleted"
+DATABASE_CLEARED = "database_cleared"
+EVENT_ADDED = "event_added"
+HABIT_NOT_FOUND = "habit_not_found"
+HABIT_EXISTS = "habit_exists"
+EMPTY_NAME = "empty_name"
+INVALID_PERIODICITY = "invalid_periodicity"
+NO_SCHEDULE = "no_schedule"
+INVALID_DATE = REJECT_INVALID_DATE
+FUTURE_DATE = REJECT_FUTURE_DATE
+TOO_SOON = REJECT_TOO_SOON
+
+# Codes of the outcomes of writes that went through
+SUCCESS_CODES = frozenset({HABIT_ADDED, HABIT_RENAMED, HABIT_DELETED, DATABASE_CLEARED, EVENT_ADDED})
+
+@dataclass(frozen=True)
+class Outcome:
+    """A data class to represent the result of a repository write: what was attempted, on which habit, and either
+    what changed or why nothing did. Turned into text only by a renderer."""
+    __slots__ = ("operation", "code", "habit_name", "event_date", "new_name", "periodicity", "wait_days",
+                 "streak_reset", "had_events")
+    operation: str
+    code: str
+    habit_name: Optional[str]
+    event_date: Optional[date]
+    new_name: Optional[str]
+    periodicity: Optional[str]
+    wait_days: Optional[int]
+    streak_reset: bool
+    had_events: bool
+
+    @property
+    def ok(self):
+        """True if the write went through."""
+        return self.code in SUCCESS_CODES
+
+def outcome(operation: str, code: str, habit_name: str = None, event_date: date = None, new_name: str = None,
+            periodicity: str = None, wait_days: int = None, streak_reset: bool = False, had_events: bool = False):
+    """Build an Outcome, leaving the details that do not apply to it empty."""
+    return Outcome(operation, code, habit_name, event_date, new_name, periodicity, wait_days, streak_reset,
+                   had_events)
+
+@dataclass(frozen=True)
+class CompletionState:
+    """A data class to represent whether a habit was completed in its current period, as checked on a given day."""
+    __slots__ = ("habit_name", "periodicity", "completed", "last_event_date", "next_due_date", "checked_on")
+    habit_name: str
+    periodicity: str
+    completed: bool
+    last_event_date: Optional[date]
+    next_due_date: Optional[date]
+    checked_on: date
+
+    @property
+    def due_in_days(self):
+        """Number of days from the check until the habit is due again, or None if it is due already."""
+        if self.next_due_date is None or not self.completed:
+            return None
+        return (self.next_due_date - self.checked_on).days
+
+@dataclass(frozen=True)
+class Reminder:
+    """A data class to represent a reminder that a habit has reached its next due date."""
+    __slots__ = ("habit_name", "periodicity", "due_date", "last_event_date")
+    habit_name: str
+    periodicity: str
+    due_date: date
+    last_event_date: Optional[date]
+
+@dataclass(frozen=True)
+class SchedulerRun:
+    """A data class to represent what a run of the DueScheduler did on a given day: the reminders it emitted and
+    the names of the habits whose streak it reset."""
+    __slots__ = ("reminders", "streak_resets", "checked_on")
+    reminders: List[Reminder]
+    streak_resets: List[str]
+    checked_on: date
@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+# Select list and tables to read habit_week_rollup together with the habit name, in the order rollup_from_row
+# expects them
+ROLLUP_SELECT = ("h.name, r.week_start, r.days, r.completions"
+                 " FROM habit_week_rollup r JOIN habits h ON h.id = r.habit_id")
+
+@dataclass(frozen=True)
+class WeekRollup:
+    """A data class to represent the completions of a habit in one ISO week, parallel to the habit_week_rollup table
+    in the db. Bit i of days is set if the habit was completed on weekday i, Monday being 0."""
+    __slots__ = ("habit_name", "week_start", "days", "completions")
+    habit_name: str
+    week_start: date
+    days: int
+    completions: int
+
+    def completed_on(self, weekday: int):
+        """Check if the habit was completed on a weekday of this week, Monday being 0."""
+        return bool(self.days >> weekday & 1)
+
+def week_start(day: date):
+    """Return the Monday of the ISO week of a day."""
+    return day - timedelta(days=day.weekday())
+
+def rollup_from_row(row):
+    """Build a WeekRollup object from a row selected with ROLLUP_SELECT."""
+    return WeekRollup(habit_name=row[0], week_start=date.fromisoformat(row[1]), days=row[2], completions=row[3])
+
+def add_to_rollups(db, events):
+    """Count new events, given as (habit_id, date) pairs, in the weekly rollups. Events are summed up per habit and
+    week first, so a bulk ingestion writes one row per week touched. Runs inside the caller's transaction."""
+    weeks = {}
+    for habit_id, day in events:
+        week = weeks.setdefault((habit_id, week_start(day).isoformat()), [0, 0])
+        week[0] |= 1 << day.weekday()
+        week[1] += 1
+    db.executemany("""INSERT INTO habit_week_rollup (habit_id, week_start, days, completions) VALUES (?, ?, ?, ?)
+        ON CONFLICT (habit_id, week_start)
+        DO UPDATE SET days = days | excluded.days, completions = completions + excluded.completions""",
+                   [(habit_id, week, days, completions) for (habit_id, week), (days, completions) in weeks.items()])
+
+def rebuild_rollups(db, user_id=None):
+    """Rebuild the weekly rollups of all habits, or of all habits of one user, from the habit_tracker table.
+    Runs inside the caller's transaction."""
+    scope, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    db.execute(f"DELETE FROM habit_week_rollup WHERE habit_id IN (SELECT id FROM habits {scope})", params)
+    # Every weekday has its own bit, so the sum of the distinct bits of a week is their bitwise or
+    db.execute(f"""INSERT INTO habit_week_rollup (habit_id, week_start, days, completions)
+        SELECT habit_id, date(date, '-' || weekday || ' days'), SUM(DISTINCT 1 << weekday), COUNT(*)
+        FROM (SELECT habit_id, date, (strftime('%w', date) + 6) % 7 AS weekday FROM habit_tracker
+              WHERE habit_id IN (SELECT id FROM habits {scope}) AND date(date) IS NOT NULL)
+        GROUP BY 1, 2""", params)
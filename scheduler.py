@@ -0,0 +1,129 @@
+import heapq
+import sys
+from datetime import date
+from periodicity import parse_periodicity
+from results import Reminder, SchedulerRun
+
+# Kinds of deadlines in the heap. On the same day a reminder is processed before a streak expires.
+REMIND = 0
+EXPIRE = 1
+
+def deadlines(stats):
+    """Return the day ordinals on which a habit is due (reminder) and on which its streak expires, from its
+    HabitStats. Either is None if it does not apply."""
+    expires = parse_periodicity(stats.periodicity).streak_expires(stats.last_event) if stats.streak > 0 else None
+    return (stats.next_due.toordinal() if stats.next_due else None,
+            expires.toordinal() if expires else None)
+
+class DueScheduler:
+    """Keeps the next deadlines of all habits of a repository's user in a min-heap, so processing the deadlines of a
+    day only touches the habits that reached one: O(log n) per habit instead of a scan over all habits.
+    When a habit reaches its next due date a Reminder is emitted, when its streak expires the stored streak is reset,
+    so it is no longer stale until the next event is added.
+    Deadlines that moved because events were added are detected when they come up and rescheduled. Call track() for
+    habits that got their first event, or a new streak, after load()."""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._heap = []
+        # Current (remind, expire) day ordinals per habit id. Heap entries that no longer match are left in the heap
+        # and skipped when they come up
+        self._deadlines = {}
+        # Due date each habit was last reminded of, so a reminder is emitted only once
+        self._reminded = {}
+
+    def load(self):
+        """Schedule the deadlines of all habits of the user, from their materialized analytics."""
+        self._heap = []
+        self._deadlines = {}
+        for stats in self.repo.get_stats():
+            self._schedule(stats)
+        return self
+
+    def load_due(self, today: date = None):
+        """Schedule only the deadlines reached by today, for a one-shot run(): the habits are found with a range
+        lookup on their next due date instead of a scan over all habits, see HabitRepository.get_pending_deadlines."""
+        for stats in self.repo.get_pending_deadlines(today):
+            self._schedule(stats)
+        return self
+
+    def track(self, *names):
+        """Schedule the current deadlines of the habits with the given names, e.g. after events were added."""
+        habit_ids = [habit.habit_id for name in names for habit in self.repo.get_one_habit(name)]
+        for stats in self.repo.get_stats(habit_ids):
+            self._schedule(stats)
+
+    def _schedule(self, stats):
+        """Push the deadlines of a habit that changed onto the heap."""
+        previous = self._deadlines.get(stats.habit_id, (None, None))
+        current = deadlines(stats)
+        if current[REMIND] == self._reminded.get(stats.habit_id):
+            current = (None, current[EXPIRE])
+        self._deadlines[stats.habit_id] = current
+        for kind in (REMIND, EXPIRE):
+            if current[kind] is not None and current[kind] != previous[kind]:
+                heapq.heappush(self._heap, (current[kind], stats.habit_id, kind))
+
+    def next_deadline(self):
+        """Return the day of the earliest pending deadline, or None if there is none."""
+        while self._heap:
+            day, habit_id, kind = self._heap[0]
+            if self._deadlines.get(habit_id, (None, None))[kind] == day:
+                return date.fromordinal(day)
+            heapq.heappop(self._heap)
+        return None
+
+    def run(self, today: date = None):
+        """Process all deadlines up to and including today: emit a Reminder for every habit that is due and reset
+        the streak of every habit whose streak expired, all resets in one transaction. Returns a SchedulerRun."""
+        today = today or date.today()
+        expired = []
+        while self._heap and self._heap[0][0] <= today.toordinal():
+            day, habit_id, kind = heapq.heappop(self._heap)
+            if self._deadlines.get(habit_id, (None, None))[kind] == day:
+                expired.append((day, habit_id, kind))
+
+        due, resets = [], []
+        # Hold the writer, so no event can be added between checking a deadline and resetting the streak
+        with self.repo.pool.writer():
+            current = {stats.habit_id: stats for stats in self.repo.get_stats({entry[1] for entry in expired})}
+            for day, habit_id, kind in expired:
+                stats = current.get(habit_id)
+                if stats is None:
+                    # The habit was deleted
+                    self._deadlines.pop(habit_id, None)
+                    continue
+                if deadlines(stats)[kind] != day:
+                    # Events were added since the deadline was scheduled, it moved to a later day
+                    self._schedule(stats)
+                    continue
+
+                remind, expire = self._deadlines[habit_id]
+                if kind == REMIND:
+                    due.append(stats)
+                    self._reminded[habit_id] = remind
+                    self._deadlines[habit_id] = (None, expire)
+                else:
+                    resets.append(stats)
+                    self._deadlines[habit_id] = (remind, None)
+            # The reminded due dates are stored, so another run, e.g. in another process, does not remind again
+            reminded = set(self.repo.mark_reminded([stats.habit_id for stats in due])) if due else set()
+            if resets:
+                self.repo.reset_streaks([stats.habit_id for stats in resets])
+
+        reminders = [Reminder(habit_name=stats.name, periodicity=stats.periodicity, due_date=stats.next_due,
+                              last_event_date=stats.last_event) for stats in due if stats.habit_id in reminded]
+
+        result = SchedulerRun(reminders=reminders, streak_resets=[stats.name for stats in resets], checked_on=today)
+        self.repo.renderer.scheduler_run(result)
+        return result
+
+if __name__ == "__main__":
+    # Process today's deadlines from the command line, e.g. from cron: python scheduler.py [db_name] [user_id]
+    from database import DEFAULT_USER
+    from habit_repository import HabitRepository
+
+    repository = HabitRepository(sys.argv[1] if len(sys.argv) > 1 else "main.db", renderer="rich",
+                                 user_id=sys.argv[2] if len(sys.argv) > 2 else DEFAULT_USER)
+    DueScheduler(repository).load_due().run()
+    repository.close()
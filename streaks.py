@@ -0,0 +1,132 @@
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date
+import numpy as np
+import rich
+from habit_stats import rebuild_stats
+from event_log import STREAKS_RECOMPUTED, append, counters
+from rollups import rebuild_rollups
+
+# Largest gap of habits without a schedule, they never lose their streak like in HabitTracker.should_reset_streak
+NO_GAP_LIMIT = np.iinfo(np.int64).max
+
+@dataclass(frozen=True)
+class StreakSummary:
+    """A data class to represent the streak state of a habit as rebuilt from its events."""
+    name: str
+    streak: int
+    longest_streak: int
+    event_count: int
+
+def compute_streaks(habit_codes, ordinals, max_gaps, today_ordinal):
+    """Compute current streak, longest streak and event count for many habits at once.
+    habit_codes and ordinals hold one entry per event: the index of its habit and its day ordinal, or the number of
+    its period as given by schedule_periods. max_gaps holds the largest allowed gap per habit index, in the same unit,
+    and today_ordinal today's day or period, for all habits or per habit index.
+    Returns three arrays indexed by habit."""
+    habit_count = len(max_gaps)
+    today_ordinals = np.broadcast_to(np.asarray(today_ordinal, dtype=np.int64), (habit_count,))
+    streaks = np.zeros(habit_count, dtype=np.int64)
+    longest = np.zeros(habit_count, dtype=np.int64)
+    event_counts = np.bincount(habit_codes, minlength=habit_count).astype(np.int64)
+    if len(ordinals) == 0:
+        return streaks, longest, event_counts
+
+    # Sort the events by habit and day
+    order = np.lexsort((ordinals, habit_codes))
+    habit_codes = habit_codes[order]
+    ordinals = ordinals[order]
+
+    # A run of consecutive completions starts at the first event of a habit, or after a gap that broke the streak
+    first_of_habit = np.empty(len(ordinals), dtype=bool)
+    first_of_habit[0] = True
+    first_of_habit[1:] = habit_codes[1:] != habit_codes[:-1]
+    gaps = np.diff(ordinals, prepend=ordinals[0])
+    run_starts = first_of_habit | (gaps > max_gaps[habit_codes])
+
+    # Number every run and measure its length
+    run_ids = np.cumsum(run_starts) - 1
+    run_lengths = np.bincount(run_ids)
+    np.maximum.at(longest, habit_codes[run_starts], run_lengths)
+
+    # The current streak is the last run of a habit, as long as the habit is not overdue today
+    last_of_habit = np.flatnonzero(np.append(first_of_habit[1:], True))
+    last_codes = habit_codes[last_of_habit]
+    alive = (today_ordinals[last_codes] - ordinals[last_of_habit]) <= max_gaps[last_codes]
+    streaks[last_codes] = np.where(alive, run_lengths[run_ids[last_of_habit]], 0)
+
+    return streaks, longest, event_counts
+
+def batch_to_codes(batch, names):
+    """Turn an EventBatch into numpy arrays of habit indexes (into names) and day ordinals, without copying the
+    ordinals. Events of habits that are not in names are left out."""
+    index_of = {name: index for index, name in enumerate(names)}
+    index_map = np.array([index_of.get(name, -1) for name in batch.habit_names], dtype=np.int64)
+    habit_codes = index_map[np.frombuffer(batch.habit_ids, dtype=np.int32)] if len(batch) else np.empty(0, np.int64)
+    ordinals = np.frombuffer(batch.ordinals, dtype=np.int32).astype(np.int64)
+    known = habit_codes >= 0
+    return habit_codes[known], ordinals[known]
+
+def schedule_periods(habits, habit_codes, ordinals, today: date):
+    """Translate the day ordinals of events into period numbers of the schedule of their habit, see
+    periodicity.Periodicity. Returns the period of every event, the largest allowed gap between two events and
+    today's period per habit index, ready for compute_streaks."""
+    periods = np.empty_like(ordinals)
+    max_gaps = np.empty(len(habits), dtype=np.int64)
+    today_periods = np.empty(len(habits), dtype=np.int64)
+
+    # Schedules are shared between habits with the same periodicity, convert the events of each schedule at once
+    by_schedule = {}
+    for index, habit in enumerate(habits):
+        by_schedule.setdefault(habit.schedule, []).append(index)
+    for schedule, indexes in by_schedule.items():
+        max_gaps[indexes] = schedule.gap or NO_GAP_LIMIT
+        today_periods[indexes] = schedule.period_index(today)
+        of_schedule = np.zeros(len(habits), dtype=bool)
+        of_schedule[indexes] = True
+        events = of_schedule[habit_codes]
+        periods[events] = schedule.period_indexes(ordinals[events])
+    return periods, max_gaps, today_periods
+
+def recompute_all(repo, today: date = None):
+    """Rebuild streak, longest streak and event count of every habit of the repository's user from the habit_tracker
+    table and store them, together with the analytics and weekly rollups. Returns a list of StreakSummary objects."""
+    today = today or date.today()
+
+    # Hold the writer for the whole recompute, so no event can be added between reading and writing back
+    with repo.pool.writer() as db:
+        # Load every habit and count its events in the periods of its schedule
+        habits = repo.get_all_habits()
+        names = [habit.name for habit in habits]
+        habit_codes, ordinals = batch_to_codes(repo.get_event_batch(), names)
+        periods, max_gaps, today_periods = schedule_periods(habits, habit_codes, ordinals, today)
+        streaks, longest, event_counts = compute_streaks(habit_codes, periods, max_gaps, today_periods)
+
+        # Write all habits back and rebuild their analytics in one transaction
+        summaries = [
+            StreakSummary(name=name, streak=int(streak), longest_streak=int(longest_streak), event_count=int(count))
+            for name, streak, longest_streak, count in zip(names, streaks, longest, event_counts)
+        ]
+        with db:
+            db.executemany("UPDATE habits SET streak = ?, longest_streak = ?, event_count = ? WHERE id = ?",
+                           [(summary.streak, summary.longest_streak, summary.event_count, habit.habit_id)
+                            for summary, habit in zip(summaries, habits)])
+            rebuild_stats(db, repo.user_id)
+            rebuild_rollups(db, repo.user_id)
+            append(db, [(repo.user_id, habit.habit_id, STREAKS_RECOMPUTED, counters(summary))
+                        for summary, habit in zip(summaries, habits)])
+        repo.cache.clear()
+    return summaries
+
+if __name__ == "__main__":
+    # Recompute all streaks of a database from the command line: python streaks.py [db_name]
+    from habit_repository import HabitRepository
+
+    repository = HabitRepository(sys.argv[1] if len(sys.argv) > 1 else "main.db", profile="bulk")
+    start = time.perf_counter()
+    results = recompute_all(repository)
+    rich.print(f"[green]Recomputed streaks of {len(results)} habits from"
+               f" {sum(result.event_count for result in results)} events in"
+               f" {time.perf_counter() - start:.2f}s.[/green]")
+    repository.close()
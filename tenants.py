@@ -0,0 +1,56 @@
+import os
+import threading
+import zlib
+from connection_pool import DEFAULT_READERS
+from habit_repository import HabitRepository
+from analyzer import HabitAnalyzer
+
+def shard_names(directory, shard_count):
+    """Return the database file names of shard_count shards in a directory."""
+    return [os.path.join(directory, f"habits-{shard:03d}.db") for shard in range(shard_count)]
+
+def shard_of(user_id, shard_count):
+    """Return the shard a user lives in. crc32 is stable across processes and Python versions, unlike hash()."""
+    return zlib.crc32(user_id.encode("utf-8")) % shard_count
+
+class TenantRouter:
+    """Spreads users over several SQLite files. Every user lives in exactly one shard, picked from the user id, so
+    the writes of different shards never wait for each other and every shard stays as small as its share of users.
+    The connection pool of a shard is opened the first time one of its users is served."""
+
+    def __init__(self, db_names, profile="default", readers=DEFAULT_READERS, renderer="quiet"):
+        if not db_names:
+            raise ValueError("A tenant router needs at least one database.")
+        self.db_names = list(db_names)
+        self.profile = profile
+        self.readers = readers
+        self.renderer = renderer
+        self._shards = [None] * len(self.db_names)
+        self._lock = threading.Lock()
+
+    def shard(self, index):
+        """Return the repository of a shard, opening it on first use."""
+        repo = self._shards[index]
+        if repo is None:
+            with self._lock:
+                repo = self._shards[index]
+                if repo is None:
+                    repo = self._shards[index] = HabitRepository(self.db_names[index], self.profile, self.readers,
+                                                                 self.renderer)
+        return repo
+
+    def repository(self, user_id):
+        """Return a repository for the habits of a user, backed by the user's shard."""
+        return self.shard(shard_of(user_id, len(self.db_names))).for_user(user_id)
+
+    def analyzer(self, user_id):
+        """Return an analyzer for the habits of a user."""
+        return HabitAnalyzer(self.repository(user_id))
+
+    def close(self):
+        """Close the connection pools of all opened shards."""
+        with self._lock:
+            for index, repo in enumerate(self._shards):
+                if repo is not None:
+                    repo.close()
+                    self._shards[index] = None
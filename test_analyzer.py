@@ -84,4 +84,124 @@ def test_list_all_overdue_habits(analyzer_fixture):
     repo = analyzer_fixture.repo
     repo.add_habit("LateDaily", "Missed it", "Daily")
     repo.add_habit_event("LateDaily", (date.today() - timedelta(days=2)).isoformat())
-    analyzer_fixture.list_all_overdue_habits()  # Just ensure it runs
\ No newline at end of file
+    analyzer_fixture.list_all_overdue_habits()  # Just ensure it runs
+
+def test_overdue_habits(analyzer_fixture):
+    """Test that overdue habits are returned with their last completion date."""
+    repo = analyzer_fixture.repo
+    today = date.today()
+    repo.add_habit("LateDaily", "Missed it", "Daily")
+    repo.add_habit("OnTimeWeekly", "Done this week", "Weekly")
+    repo.add_habit("Never", "Never done", "Daily")
+    repo.add_habit_event("LateDaily", (today - timedelta(days=2)).isoformat())
+    repo.add_habit_event("OnTimeWeekly", (today - timedelta(days=3)).isoformat())
+    overdue = {habit.name: habit for habit in analyzer_fixture.overdue_habits()}
+    assert set(overdue) == {"LateDaily", "Never"}
+    assert overdue["LateDaily"].last_event_date == today - timedelta(days=2)
+    assert overdue["Never"].last_event_date is None
+
+def test_analytics_follow_writes(analyzer_fixture):
+    """Test that the materialized analytics are kept current by repository writes."""
+    repo = analyzer_fixture.repo
+    today = date.today()
+    repo.add_habit("A", "Test A", "Daily", streak=3)
+    repo.add_habit("B", "Test B", "Daily", streak=5)
+    repo.add_habit("C", "Test C", "Daily")
+    assert repo.get_leaderboard(1)[0].name == "B"
+
+    # Deleting B leaves A with the longest streak
+    repo.delete_habit("B")
+    assert repo.get_leaderboard(1)[0].name == "A"
+
+    # C breaks its streak once: one of its two events is not part of the current streak
+    repo.add_habit_event("C", (today - timedelta(days=5)).isoformat())
+    repo.add_habit_event("C", (today - timedelta(days=1)).isoformat())
+    struggle = repo.get_leaderboard(1, by="struggle")[0]
+    assert struggle.name == "C"
+    assert struggle.struggle == 0.5
+    assert [habit.name for habit in analyzer_fixture.overdue_habits()] == ["A", "C"]
+
+    # Completing C today takes it off the overdue list
+    repo.add_habit_event("C")
+    assert [habit.name for habit in analyzer_fixture.overdue_habits()] == ["A"]
+
+    repo.clear_database()
+    assert repo.get_leaderboard() == []
+
+def test_top_habits(analyzer_fixture):
+    """Test the leaderboard ordering, tie breaking by insertion order and periodicity filter."""
+    repo = analyzer_fixture.repo
+    repo.add_habit("Walk", "Test", "Daily", streak=4)
+    repo.add_habit("Read", "Test", "Daily", streak=4)
+    repo.add_habit("Clean", "Test", "Weekly", streak=9)
+    repo.add_habit("Cook", "Test", "Daily", streak=1)
+    assert [habit.name for habit in analyzer_fixture.top_habits(3)] == ["Clean", "Walk", "Read"]
+    assert [habit.name for habit in analyzer_fixture.top_habits(10, periodicity="daily")] == ["Walk", "Read", "Cook"]
+    assert analyzer_fixture.top_habits(by="struggle") == []
+    with pytest.raises(ValueError):
+        analyzer_fixture.top_habits(by="name")
+
+def test_parallel_report_matches_serial(analyzer_fixture):
+    """Test that the sharded report computed by worker processes equals the one computed in a single pass"""
+    repo = analyzer_fixture.repo
+    today = date.today()
+    for number in range(12):
+        repo.add_habit(f"Habit {number}", "Test", "Daily" if number % 3 else "Weekly")
+    repo.add_habit_events_bulk([(f"Habit {number}", today - timedelta(days=days_ago)) for number in range(10)
+                                for days_ago in range(number * 2 + 1, number % 4, -1 - number % 2)])
+
+    serial = analyzer_fixture.parallel_report(workers=1, shards=1, k=5)
+    parallel = analyzer_fixture.parallel_report(workers=2, shards=3, k=5)
+    assert (parallel.habit_count, parallel.event_count) == (serial.habit_count, serial.event_count)
+    assert parallel.event_count == len(repo.get_all_habit_events())
+    assert parallel.top_streaks == serial.top_streaks
+    assert parallel.top_struggles == serial.top_struggles
+    assert parallel.overdue == serial.overdue == analyzer_fixture.overdue_habits()
+
+def test_habit_trends(analyzer_fixture):
+    """Test completion rates per window, the weekly heatmap and the weekday distribution"""
+    repo = analyzer_fixture.repo
+    today = date(2025, 6, 29)  # a Sunday
+    repo.add_habit("Read", "Daily", "Daily")
+    repo.add_habit("Plan", "Once per ISO week", "ISO weekly")
+    repo.add_habit("Someday", "No schedule", "Sometimes")
+    # Read every other day of the last 30 days, Plan on the Monday of the last 2 weeks
+    repo.add_habit_events_bulk([("Read", today - timedelta(days=days_ago)) for days_ago in range(28, -1, -2)] +
+                               [("Plan", date(2025, 6, 16)), ("Plan", date(2025, 6, 23))])
+
+    trends = {trend.name: trend for trend in analyzer_fixture.habit_trends(today=today, weeks=2)}
+    assert trends["Read"].completions == {7: 4, 30: 15, 90: 15}
+    assert trends["Read"].rates == {7: 4 / 7, 30: 0.5, 90: 15 / 90}
+    # 7 days are one ISO week, 30 days touch 5 of them
+    assert trends["Plan"].rates == {7: 1.0, 30: 0.4, 90: 2 / 13}
+    assert trends["Someday"].rates == {7: None, 30: None, 90: None}
+
+    assert trends["Plan"].heatmap == [[1, 0, 0, 0, 0, 0, 0], [1, 0, 0, 0, 0, 0, 0]]
+    assert trends["Read"].heatmap == [[0, 1, 0, 1, 0, 1, 0], [1, 0, 1, 0, 1, 0, 1]]
+    assert trends["Plan"].weekdays == [2, 0, 0, 0, 0, 0, 0]
+    assert sum(trends["Read"].weekdays) == 15
+
+    assert analyzer_fixture.lowest_completion_rate(90, today=today).name == "Plan"
+
+def test_habit_trends_of_calendar_habits_on_schedule(analyzer_fixture):
+    """Test that a due period counts as done if a completion fell in it, and that periods still running are not due
+    yet, so calendar habits on schedule get full rates"""
+    repo = analyzer_fixture.repo
+    repo.add_habit("Budget", "Once a month", "Monthly")
+    repo.add_habit("Plan", "Once per ISO week", "ISO weekly")
+    repo.add_habit_events_bulk([("Budget", date(2025, 3, 10)), ("Budget", date(2025, 4, 15)),
+                                ("Budget", date(2025, 5, 12)), ("Plan", date(2025, 6, 9)),
+                                ("Plan", date(2025, 6, 16))])
+
+    # June is due on the 30th and not done yet, so nothing is due in the last 7 days. The last 30 days hold the end
+    # of May, done before they started, the last 90 days the end of March, done before they started as well.
+    trends = {trend.name: trend for trend in analyzer_fixture.habit_trends(today=date(2025, 6, 18))}
+    assert trends["Budget"].rates == {7: None, 30: 1.0, 90: 1.0}
+    assert trends["Budget"].completions == {7: 0, 30: 0, 90: 2}
+    # Checked on a Wednesday, the week of the 23rd is still running and not done yet, the one before is done
+    trends = {trend.name: trend for trend in analyzer_fixture.habit_trends(windows=(7,), today=date(2025, 6, 25))}
+    assert trends["Plan"].rates == {7: 1.0}
+    # The week of the 30th was missed, a completion in the week still running does not make up for it
+    repo.add_habit_events_bulk([("Plan", date(2025, 6, 23)), ("Plan", date(2025, 7, 7))])
+    trends = {trend.name: trend for trend in analyzer_fixture.habit_trends(windows=(14,), today=date(2025, 7, 9))}
+    assert (trends["Plan"].rates, trends["Plan"].completions) == ({14: 0.5}, {14: 1})
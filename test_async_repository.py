@@ -0,0 +1,49 @@
+import asyncio
+from datetime import date, timedelta
+from async_repository import AsyncHabitRepository
+from results import EVENT_ADDED, HABIT_NOT_FOUND, TOO_SOON
+
+def test_concurrent_check_ins_are_group_committed(db_path):
+    """Test that concurrent habit events are all written, in fewer commits than events"""
+    names = [f"Habit {number}" for number in range(20)]
+    today = date.today()
+
+    async def scenario():
+        async with AsyncHabitRepository(db_path) as repo:
+            await asyncio.gather(*(repo.add_habit(name, "Async", "Daily") for name in names))
+            results = await asyncio.gather(*(repo.add_habit_event(name, (today - timedelta(days=days_ago)).isoformat())
+                                              for days_ago in range(9, -1, -1) for name in names))
+            habits = await repo.get_all_habits()
+            return results, habits, repo.commit_count
+
+    results, habits, commit_count = asyncio.run(scenario())
+    assert [result.code for result in results] == [EVENT_ADDED] * 200
+    assert commit_count < 200
+    assert sorted(habit.event_count for habit in habits) == [10] * 20
+
+def test_rejected_check_in_is_reported(db_path):
+    """Test that every check-in gets the Outcome of add_habit_event, rejected ones without failing the rest of their
+    group, and that streaks are reset as seen from today"""
+    today = date.today()
+
+    async def scenario():
+        async with AsyncHabitRepository(db_path) as repo:
+            # The event after Read's last one keeps the streak as seen from its own day, not as seen from today
+            await repo.add_habit("Read", "Read a book", "Daily", streak=5)
+            await repo.add_habit("Walk", "Go for a walk", "Daily", streak=5)
+            await repo.add_habit_events_bulk([("Read", today - timedelta(days=3)), ("Walk", today)])
+            results = await asyncio.gather(repo.add_habit_event("Read", (today - timedelta(days=2)).isoformat()),
+                                           repo.add_habit_event("Unknown"), repo.add_habit_event("Walk"))
+            stats = await repo.get_stats()
+            return (results, await repo.get_last_event_date("Read"), await repo.get_due_habits(today - timedelta(days=1)),
+                    [entry.kind for entry in await repo.get_audit_trail("Read")],
+                    await repo.reset_streaks([item.habit_id for item in stats]), await repo.get_week_rollups("Read"))
+
+    (accepted, unknown, too_soon), last_event_date, due, kinds, resets, rollups = asyncio.run(scenario())
+    assert (accepted.code, accepted.streak_reset, unknown.code, too_soon.code) == (EVENT_ADDED, True, HABIT_NOT_FOUND,
+                                                                                   TOO_SOON)
+    assert last_event_date == today - timedelta(days=2)
+    assert [stats.name for stats in due] == ["Read"]
+    assert kinds == ["habit_added", "event_added", "event_added"]
+    assert resets == 2
+    assert sum(rollup.completions for rollup in rollups) == 2
@@ -0,0 +1,35 @@
+from cache import TTLCache, MISSING
+
+def test_cache_evicts_least_recently_used_and_expires():
+    """Test that a full cache drops the least recently used entry and entries expire after their time to live"""
+    now = [0.0]
+    cache = TTLCache(max_size=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", None)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # evicts b, a was used more recently
+    assert cache.get("b") is MISSING
+    assert cache.get("c") == 3
+
+    now[0] = 10.0
+    assert cache.get("a") is MISSING
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.expirations, stats.size) == (2, 2, 1, 1, 1)
+    assert stats.hit_rate == 0.5
+
+def test_cache_skips_values_loaded_before_an_invalidation():
+    """Test that a value loaded before an invalidation is not stored, and that a size of 0 disables the cache"""
+    cache = TTLCache()
+    cache.put("a", 1)
+    generation = cache.generation
+    cache.invalidate("a")
+    cache.put("a", 1, generation)
+    assert cache.get("a") is MISSING
+    cache.put("a", 2, cache.generation)
+    assert cache.get("a") == 2
+    cache.clear()
+    assert cache.stats().invalidations == 2 and cache.stats().size == 0
+
+    disabled = TTLCache(max_size=0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is MISSING
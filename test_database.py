@@ -0,0 +1,88 @@
+import sqlite3
+import pytest
+import database
+from database import get_connection, get_schema_version, SCHEMA_VERSION, ConnectionProfile
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Fixture to create a db file with the original, unversioned schema and a few events."""
+    db_path = str(tmp_path / "legacy.db")
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE habits (name TEXT PRIMARY KEY, description TEXT, periodicity TEXT,"
+               " streak INTEGER DEFAULT 0, event_count INTEGER DEFAULT 0)")
+    db.execute("CREATE TABLE habit_tracker (date TEXT, habitName TEXT,"
+               " FOREIGN KEY (habitName) REFERENCES habits(name))")
+    db.execute("INSERT INTO habits VALUES ('Read', 'Read a book', 'Daily', 2, 2)")
+    db.executemany("INSERT INTO habit_tracker VALUES (?, ?)", [("2025-06-01", "Read"), ("2025-06-02", "Read")])
+    db.commit()
+    db.close()
+    return db_path
+
+def test_new_database_is_current(tmp_path):
+    """Test that a fresh database is created at the current schema version"""
+    db = get_connection(str(tmp_path / "fresh.db"))
+    assert get_schema_version(db) == SCHEMA_VERSION
+    db.close()
+
+def test_legacy_database_is_upgraded_in_place(legacy_db):
+    """Test that an unversioned database is migrated and keeps its events"""
+    db = get_connection(legacy_db)
+    assert get_schema_version(db) == SCHEMA_VERSION
+
+    # Events survive the migration, get an integer key and reference their habit by id
+    rows = db.execute("SELECT t.id, t.date, h.name FROM habit_tracker t JOIN habits h ON h.id = t.habit_id"
+                      " ORDER BY t.id").fetchall()
+    assert rows == [(1, "2025-06-01", "Read"), (2, "2025-06-02", "Read")]
+
+    # The weekly rollups are filled from the events: 2025-06-01 is a Sunday, 2025-06-02 the Monday after it
+    assert db.execute("SELECT week_start, days, completions FROM habit_week_rollup ORDER BY week_start").fetchall() \
+        == [("2025-05-26", 0b1000000, 1), ("2025-06-02", 0b1, 1)]
+
+    # The existing habits are the first snapshot of the event log, with the date of their last event
+    assert db.execute("SELECT snapshot_seq, name, streak, event_count, last_event FROM habit_snapshots").fetchall() \
+        == [(0, "Read", 2, 2, "2025-06-02")]
+
+    # The last event lookup is served by the composite index instead of a table scan
+    plan = db.execute("EXPLAIN QUERY PLAN SELECT date FROM habit_tracker WHERE habit_id = ?"
+                      " ORDER BY date DESC LIMIT 1", (1,)).fetchall()
+    assert any("idx_habit_tracker_habit_date" in row[-1] for row in plan)
+
+    # Deleting a habit cascades to its events
+    db.execute("DELETE FROM habits WHERE name = 'Read'")
+    assert db.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == 0
+    db.close()
+
+def test_migration_is_idempotent(legacy_db):
+    """Test that reopening a migrated database does not run the migrations again"""
+    get_connection(legacy_db).close()
+    db = get_connection(legacy_db)
+    assert db.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == 2
+    db.close()
+
+def test_connection_profile_is_applied(tmp_path):
+    """Test that the default profile opens the database in WAL mode with the tuned settings"""
+    db = get_connection(str(tmp_path / "tuned.db"))
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert db.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    assert db.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    db.close()
+
+    db = get_connection(str(tmp_path / "tuned.db"), ConnectionProfile(journal_mode="DELETE", busy_timeout=1))
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert db.execute("PRAGMA busy_timeout").fetchone()[0] == 1000
+    db.close()
+
+def test_unknown_profile(tmp_path):
+    """Test that an unknown profile name is rejected"""
+    with pytest.raises(ValueError):
+        get_connection(str(tmp_path / "tuned.db"), "turbo")
+
+def test_current_schema_skips_migrations(tmp_path, monkeypatch):
+    """Test that opening a database at the current schema version runs no DDL"""
+    get_connection(str(tmp_path / "current.db")).close()
+
+    def fail(db):
+        raise AssertionError("migrations should not run")
+    monkeypatch.setattr(database, "create_tables", fail)
+    get_connection(str(tmp_path / "current.db")).close()
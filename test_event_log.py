@@ -0,0 +1,83 @@
+from datetime import date, timedelta
+from event_log import replay, take_snapshot, compact, checkpoint, recover
+from streaks import recompute_all
+
+def table_state(repo):
+    """Return the habits of the repository's user as the log records them: by id, name and counters."""
+    return {habit.habit_id: (habit.name, habit.streak, habit.longest_streak, habit.event_count)
+            for habit in repo.get_all_habits()}
+
+def replayed_state(repo):
+    """Replay the log of the repository's user and return it like table_state."""
+    replayed = replay(repo.db, repo.user_id)
+    return {state.habit_id: (state.name, state.streak, state.longest_streak, state.event_count)
+            for state in replayed.habits.values()}
+
+def test_log_replays_to_the_tables(repo):
+    """Test that every write is logged, so replaying the log gives the state of the habits table, and that deleted
+    habits keep their history"""
+    today = date.today()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habits_bulk([("Walk", "Go for a walk", "Daily"), ("Plan", "Plan the week", "ISO weekly")])
+    repo.add_habit_event("Read", (today - timedelta(days=3)).isoformat())
+    repo.add_habit_events_bulk([("Walk", today - timedelta(days=2)), ("Walk", today - timedelta(days=1)),
+                                ("Read", today)])
+    repo.rename_habit("Walk", "Stroll")
+    repo.reset_streaks([habit.habit_id for habit in repo.get_all_habits()])
+    recompute_all(repo)
+    repo.delete_habit("Plan")
+    assert replayed_state(repo) == table_state(repo)
+
+    # A backdated event of a habit without a schedule does not move its last event back
+    repo.add_habit("Paint", "Whenever", "Sometimes")
+    repo.add_habit_event("Paint", "2025-06-10")
+    repo.add_habit_event("Paint", "2025-06-01")
+    paint = repo.get_one_habit("Paint")[0].habit_id
+    assert replay(repo.db, repo.user_id).habits[paint].last_event == repo.get_last_event_date("Paint")
+
+    kinds = [entry.kind for entry in repo.get_audit_trail("Stroll")]
+    assert kinds == ["habit_added", "event_added", "habit_renamed", "streak_reset", "streaks_recomputed"]
+    assert repo.get_audit_trail("Stroll")[1].payload["dates"] == [(today - timedelta(days=2)).isoformat(),
+                                                                  (today - timedelta(days=1)).isoformat()]
+    assert [entry.kind for entry in repo.get_audit_trail() if entry.payload.get("name") == "Plan"] \
+        == ["habit_added", "habit_deleted"]
+
+    # Another user's writes are logged apart, clearing only forgets that user's habits
+    alice = repo.for_user("alice")
+    alice.add_habit("Read", "Read a book", "Daily")
+    alice.clear_database()
+    assert replayed_state(alice) == {} and replayed_state(repo) == table_state(repo)
+
+def test_snapshots_bound_replay_and_recover_the_tables(repo):
+    """Test that replay starts from the latest snapshot, compaction drops the log before it, and recovery repairs
+    the habits table from the log"""
+    today = date.today()
+    for name in ("Read", "Walk"):
+        repo.add_habit(name, "", "Daily")
+        repo.add_habit_event(name, (today - timedelta(days=1)).isoformat())
+    assert checkpoint(repo, interval=100) is None
+    first = take_snapshot(repo)
+    assert (first.entries, replay(repo.db).entries) == (4, 0)
+
+    repo.add_habit_event("Read")
+    second = take_snapshot(repo)
+    assert (second.snapshot_seq, second.entries) == (first.seq, 1)
+    assert compact(repo, keep_snapshots=1) == 5
+    assert repo.get_audit_trail() == []
+    assert replayed_state(repo) == table_state(repo)
+
+    # Counters that went wrong and lost rows come back from the log
+    read = repo.get_one_habit("Read")[0]
+    # Foreign keys are off, so the events of the lost row stay behind
+    repo.db.execute("PRAGMA foreign_keys = OFF")
+    with repo.db:
+        repo.db.execute("UPDATE habits SET streak = 0, event_count = 7 WHERE name = 'Read'")
+        repo.db.execute("DELETE FROM habits WHERE name = 'Walk'")
+    repo.db.execute("PRAGMA foreign_keys = ON")
+    repo.cache.clear()
+    assert sorted(recover(repo, dry_run=True)) == ["Read", "Walk"]
+    assert sorted(recover(repo)) == ["Read", "Walk"]
+    assert (repo.get_one_habit("Read")[0].streak, repo.get_one_habit("Read")[0].event_count) == (2, 2)
+    assert repo.get_one_habit("Read")[0].habit_id == read.habit_id
+    assert repo.get_last_event_date("Walk") == today - timedelta(days=1)
+    assert recover(repo) == []
@@ -1,7 +1,9 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 import pytest
-from datetime import date
+from datetime import date, timedelta
 from habit_repository import HabitRepository
+from rollups import rebuild_rollups
 
 @pytest.fixture
 def repo():
@@ -75,4 +77,187 @@ def test_get_last_event_date(repo):
     today = date.today()
     repo.add_habit_event("Run", today.isoformat())
     last_date = repo.get_last_event_date("Run")
-    assert last_date == today
\ No newline at end of file
+    assert last_date == today
+
+def test_add_habit_events_bulk(repo):
+    """Test that bulk ingestion applies the single event rules and reports rejected rows"""
+    repo.add_habit("Walk", "Go for a walk", "Daily")
+    today = date.today()
+    events = [
+        ("Walk", (today - timedelta(days=5)).isoformat()),
+        ("Walk", (today - timedelta(days=4)).isoformat()),
+        ("Walk", (today - timedelta(days=4)).isoformat()),  # too soon
+        ("Walk", (today - timedelta(days=1)).isoformat()),  # resets the streak
+        ("Walk", (today + timedelta(days=1)).isoformat()),  # future
+        ("Swim", today.isoformat()),                         # unknown habit
+        ("Walk", "not a date"),                              # invalid
+    ]
+    report = repo.add_habit_events_bulk(events)
+    assert report.accepted == 3
+    assert [(rejected.index, rejected.reason) for rejected in report.rejected] == [
+        (2, "too_soon"), (4, "future_date"), (5, "unknown_habit"), (6, "invalid_date")]
+    assert report.streak_resets == 1
+    habit = repo.get_one_habit("Walk")[0]
+    assert habit.streak == 1
+    assert habit.event_count == 3
+    assert repo.get_last_event_date("Walk") == today - timedelta(days=1)
+
+def test_iter_events_pages_through_all_events(repo):
+    """Test that streaming events with a small batch size returns every event once, in order"""
+    today = date.today()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit("Write", "Write a page", "Daily")
+    repo.add_habit_events_bulk([(name, (today - timedelta(days=days_ago)).isoformat())
+                                for name in ("Read", "Write") for days_ago in range(4, -1, -1)])
+
+    events = list(repo.iter_events(batch_size=3))
+    assert [(event.habit_name, event.completed_at) for event in events] == [
+        (name, today - timedelta(days=days_ago)) for name in ("Read", "Write") for days_ago in range(4, -1, -1)]
+
+    window = list(repo.iter_events(habit="Write", since=today - timedelta(days=3), until=today - timedelta(days=1),
+                                   batch_size=2))
+    assert [event.completed_at for event in window] == [today - timedelta(days=days_ago) for days_ago in (3, 2, 1)]
+
+def test_get_event_batch(repo):
+    """Test that the columnar event batch holds every event once, with interned habit names"""
+    today = date.today()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit("Write", "Write a page", "Weekly")
+    repo.add_habit_events_bulk([("Read", today - timedelta(days=1)), ("Read", today),
+                                ("Write", today - timedelta(days=7))])
+    batch = repo.get_event_batch()
+    assert len(batch) == 3
+    assert batch.habit_names == ["Read", "Write"]
+    assert [(event.habit_name, event.completed_at) for event in batch] == [
+        ("Read", today - timedelta(days=1)), ("Read", today), ("Write", today - timedelta(days=7))]
+    assert len(repo.get_event_batch(since=today)) == 1
+
+def test_rename_habit_keeps_events(repo):
+    """Test that renaming a habit keeps its events and analytics attached"""
+    repo.add_habit("Jog", "Go jogging", "Daily")
+    repo.add_habit_event("Jog")
+    repo.rename_habit("Jog", "Run")
+    assert repo.get_one_habit("Jog") == []
+    assert [event.habit_name for event in repo.get_one_habit_events("Run")] == ["Run"]
+    assert repo.get_leaderboard(1)[0].name == "Run"
+
+def test_repository_is_thread_safe(repo):
+    """Test that several threads can write and read through one repository at the same time"""
+    names = [f"Habit {number}" for number in range(8)]
+    for name in names:
+        repo.add_habit(name, "Threaded", "Daily")
+    today = date.today()
+
+    def complete_every_day(name):
+        for days_ago in range(20, -1, -1):
+            repo.add_habit_event(name, (today - timedelta(days=days_ago)).isoformat())
+            repo.get_leaderboard(3)
+        return repo.get_one_habit(name)[0].event_count
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        event_counts = list(executor.map(complete_every_day, names))
+    assert event_counts == [21] * 8
+    assert len(repo.get_all_habit_events()) == 8 * 21
+
+def test_users_are_isolated(repo):
+    """Test that two users of one database can use the same habit names without seeing each other's habits"""
+    alice = repo.for_user("alice")
+    today = date.today()
+    repo.add_habit("Read", "Default user", "Daily", streak=2)
+    alice.add_habit("Read", "Alice", "Weekly")
+    alice.add_habit("Write", "Alice", "Daily")
+    alice.add_habit_events_bulk([("Read", today - timedelta(days=7)), ("Read", today)])
+
+    assert [habit.description for habit in repo.get_all_habits()] == ["Default user"]
+    assert [habit.name for habit in alice.get_all_habits()] == ["Read", "Write"]
+    assert repo.get_one_habit_events("Read") == []
+    assert [event.completed_at for event in alice.iter_events(batch_size=1)] == [today - timedelta(days=7), today]
+    assert len(alice.get_event_batch()) == 2 and len(repo.get_event_batch()) == 0
+    assert [habit.name for habit in repo.get_leaderboard()] == ["Read"]
+    assert [habit.name for habit in alice.get_overdue_habits()] == ["Write"]
+
+    # Renaming, deleting and clearing only touch the user's own habits
+    alice.rename_habit("Write", "Journal")
+    repo.delete_habit("Write")
+    assert [habit.name for habit in alice.get_all_habits()] == ["Read", "Journal"]
+    alice.clear_database()
+    assert alice.get_all_habits() == []
+    assert [habit.name for habit in repo.get_all_habits()] == ["Read"]
+
+def test_due_habits_follow_their_schedule(repo):
+    """Test that the next due dates follow the schedule of each periodicity and can be queried by range"""
+    today = date.today()
+    last = today - timedelta(days=today.weekday() + 7)  # Monday of last week
+    for name, periodicity in [("Read", "Daily"), ("Run", "Every 3 days"), ("Plan", "ISO weekly"),
+                              ("Budget", "Monthly"), ("Gym", "Weekdays: mon, thu"), ("Paint", "Sometimes")]:
+        repo.add_habit(name, "", periodicity)
+        repo.add_habit_event(name, last.isoformat())
+
+    due = {habit.name: habit.next_due for habit in repo.get_due_habits(date.min, date.max)}
+    assert due == {"Read": last + timedelta(days=1), "Run": last + timedelta(days=3),
+                   "Plan": last + timedelta(days=7), "Gym": last + timedelta(days=3),
+                   "Budget": date(last.year + last.month // 12, last.month % 12 + 1, 1)}
+    assert [habit.name for habit in repo.get_due_habits(last + timedelta(days=1))] == ["Read"]
+    assert repo.add_habit_event("Plan", (last + timedelta(days=6)).isoformat()).code == "too_soon"
+
+def test_week_rollups_follow_every_write(repo):
+    """Test that the weekly rollups are kept current by single and bulk events, deletes and clears, and match a
+    rebuild from the events"""
+    monday = date.today() - timedelta(days=date.today().weekday() + 14)
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit("Paint", "Whenever", "Sometimes")
+    repo.add_habit_event("Read", monday.isoformat())
+    repo.add_habit_events_bulk([("Read", monday + timedelta(days=2)), ("Read", monday + timedelta(days=8)),
+                                ("Paint", monday + timedelta(days=1)), ("Paint", monday + timedelta(days=1))])
+
+    rollups = [(rollup.habit_name, rollup.week_start, rollup.days, rollup.completions)
+               for rollup in repo.get_week_rollups()]
+    assert rollups == [("Read", monday, 0b101, 2), ("Read", monday + timedelta(days=7), 0b10, 1),
+                       ("Paint", monday, 0b10, 2)]
+    assert repo.get_week_rollups(habit="Read", since=monday + timedelta(days=9))[0].completed_on(1)
+
+    # A rebuild from the events gives the same rollups
+    with repo.pool.writer() as db:
+        with db:
+            rebuild_rollups(db, repo.user_id)
+    assert [(rollup.habit_name, rollup.week_start, rollup.days, rollup.completions)
+            for rollup in repo.get_week_rollups()] == rollups
+
+    repo.delete_habit("Paint")
+    assert {rollup.habit_name for rollup in repo.get_week_rollups()} == {"Read"}
+    repo.clear_database()
+    assert repo.get_week_rollups() == []
+
+def test_habit_lookups_are_cached_until_a_write(repo):
+    """Test that repeated lookups of a habit are served from the cache and every write drops what it changed"""
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.get_one_habit("Read")
+    repo.cache.reset_stats()
+    assert repo.get_one_habit("Read")[0].event_count == 0
+    assert repo.get_last_event_date("Read") is None
+    assert repo.get_last_event_date("Read") is None
+    assert (repo.cache.stats().hits, repo.cache.stats().misses) == (2, 1)
+
+    # Callers get objects of their own
+    repo.get_one_habit("Read")[0].increment_event()
+    assert repo.get_one_habit("Read")[0].event_count == 0
+
+    repo.add_habit_event("Read")
+    assert repo.get_one_habit("Read")[0].event_count == 1
+    assert repo.get_last_event_date("Read") == date.today()
+    repo.rename_habit("Read", "Study")
+    assert repo.get_one_habit("Read") == [] and repo.get_one_habit("Study")[0].event_count == 1
+    repo.reset_streaks([repo.get_one_habit("Study")[0].habit_id])
+    assert repo.get_one_habit("Study")[0].streak == 0
+    repo.delete_habit("Study")
+    assert repo.get_one_habit("Study") == [] and repo.get_last_event_date("Study") is None
+
+def test_backdated_events_keep_the_last_event(repo):
+    """Test that a backdated event of a habit without a schedule does not move its last event back"""
+    repo.add_habit("Paint", "Whenever", "Sometimes")
+    repo.add_habit("Sketch", "Whenever", "Sometimes")
+    repo.add_habit_event("Paint", "2025-06-10")
+    repo.add_habit_event("Paint", "2025-06-01")
+    repo.add_habit_events_bulk([("Sketch", "2025-06-10"), ("Sketch", "2025-06-01")])
+    assert {stats.name: stats.last_event for stats in repo.get_stats()} == {"Paint": date(2025, 6, 10),
+                                                                           "Sketch": date(2025, 6, 10)}
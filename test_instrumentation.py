@@ -0,0 +1,46 @@
+import pytest
+from habit_repository import HabitRepository
+from instrumentation import metrics
+
+@pytest.fixture
+def enabled_metrics():
+    """Fixture enabling the process metrics for one test and switching them off again afterwards."""
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+def test_disabled_metrics_record_nothing():
+    """Test that nothing is collected while the metrics are disabled"""
+    metrics.reset()
+    repo = HabitRepository(":memory:")
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit_event("Read", "2025-6-1")
+    repo.get_all_habits()
+    repo.close()
+    assert metrics.snapshot() == {"timers": {}, "counters": {}, "queries": {}, "statements": {}}
+
+def test_timers_queries_and_statements(enabled_metrics, tmp_path):
+    """Test that methods are timed, queries counted with their rows and statements traced"""
+    repo = HabitRepository(str(tmp_path / "metrics.db"))
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit("Run", "Go for a run", "Weekly")
+    repo.add_habit_event("Read", "2025-6-1")
+    repo.get_all_habits()
+    repo.close()
+
+    snapshot = enabled_metrics.snapshot()
+    assert snapshot["timers"]["HabitRepository.add_habit_event"]["calls"] == 1
+    assert snapshot["timers"]["HabitRepository.get_one_habit"]["calls"] >= 2
+    assert snapshot["counters"] == {"get_valid_date.strptime": 1}
+    all_habits = [query for sql, query in snapshot["queries"].items() if "ORDER BY id" in sql]
+    assert [(query["calls"], query["rows"]) for query in all_habits] == [(1, 2)]
+    # Statements that only differ in their values are counted together
+    assert snapshot["statements"]["INSERT INTO habit_tracker (habit_id, date) VALUES (?, ?)"] == 1
+
+    text = enabled_metrics.to_prometheus()
+    assert 'habit_method_calls_total{method="HabitRepository.add_habit_event"} 1' in text
+    assert "# TYPE habit_query_rows_total counter" in text
+    enabled_metrics.write_prometheus(str(tmp_path / "habits.prom"))
+    assert (tmp_path / "habits.prom").read_text() == text
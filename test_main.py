@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# Modules that only the interactive menu, rich output or bulk analytics need
+HEAVY_MODULES = ("rich", "questionary", "prompt_toolkit", "numpy")
+
+# Largest total import time of a one-shot command, generous for slow machines
+IMPORT_BUDGET_MS = 150
+
+def run_main(tmp_path, *arguments, python_options=()):
+    """Run main.py in tmp_path with JSON output to a database there, return the completed process."""
+    env = dict(os.environ, HABIT_OUTPUT="json", HABIT_DB=str(tmp_path / "cli.db"))
+    return subprocess.run([sys.executable, *python_options, MAIN, *arguments], cwd=tmp_path, env=env,
+                          capture_output=True, text=True)
+
+def test_import_is_lazy(tmp_path):
+    """Test that importing main neither opens a database nor imports the heavy modules"""
+    script = (f"import sys; sys.path.insert(0, {os.path.dirname(MAIN)!r}); import main;"
+              f" print([module for module in {HEAVY_MODULES!r} if module in sys.modules])")
+    result = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, capture_output=True, text=True)
+    assert result.stdout.strip() == "[]"
+    assert os.listdir(tmp_path) == []
+
+def test_one_shot_commands(tmp_path):
+    """Test the non-interactive commands, their output and exit status"""
+    assert run_main(tmp_path, "add", "Read", "--periodicity", "Weekly").returncode == 0
+    assert run_main(tmp_path, "add", "Read").returncode == 1
+    rejected = run_main(tmp_path, "add", "Stretch", "--periodicity", "Every 0 days")
+    assert (rejected.returncode, json.loads(rejected.stdout)["code"]) == (1, "invalid_periodicity")
+    done = run_main(tmp_path, "done", "Read")
+    assert done.returncode == 0
+    assert json.loads(done.stdout)["code"] == "event_added"
+    assert run_main(tmp_path, "done", "Read").returncode == 1
+    assert run_main(tmp_path, "done", "Walk").returncode == 1
+
+    status = json.loads(run_main(tmp_path, "status", "Read").stdout)
+    assert (status["periodicity"], status["completed"], status["due_in_days"]) == ("Weekly", True, 7)
+    top = json.loads(run_main(tmp_path, "top", "--by", "longest_streak").stdout)
+    assert [habit["name"] for habit in top["habits"]] == ["Read"]
+    trends = json.loads(run_main(tmp_path, "trends", "--windows", "7", "--weeks", "1").stdout)
+    assert trends["habits"][0]["rates"] == {"7": 1.0}
+
+    # A habit without a schedule has no completion state to check
+    run_main(tmp_path, "add", "Paint", "--periodicity", "Sometimes")
+    unscheduled = run_main(tmp_path, "status", "Paint")
+    assert (unscheduled.returncode, json.loads(unscheduled.stdout)["code"]) == (2, "no_schedule")
+
+def test_one_shot_import_budget(tmp_path):
+    """Test that a one-shot command imports no heavy module and stays within the import time budget"""
+    run_main(tmp_path, "add", "Read")
+    result = run_main(tmp_path, "overdue", python_options=("-X", "importtime"))
+    assert result.returncode == 0
+
+    # Lines look like "import time:   self |  cumulative | name", nested imports are indented
+    imports = [line.split("|") for line in result.stderr.splitlines() if line.startswith("import time:")][1:]
+    names = {name.strip() for _, _, name in imports}
+    assert not any(name.split(".")[0] in HEAVY_MODULES for name in names)
+    total_ms = sum(int(cumulative) for _, cumulative, name in imports if not name.startswith("  ")) / 1000
+    assert total_ms < IMPORT_BUDGET_MS
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from periodicity import EveryNDays, IsoWeekly, Monthly, OnWeekdays, Unscheduled, check_periodicity, parse_periodicity
+
+def test_parse_periodicity():
+    """Test that the periodicity texts of the habits table map to their schedules"""
+    assert parse_periodicity("Daily").gap == 1 and parse_periodicity("weekly").gap == 7
+    assert parse_periodicity("Every 3 days").gap == 3
+    assert isinstance(parse_periodicity("ISO weekly"), IsoWeekly)
+    assert isinstance(parse_periodicity("Monthly"), Monthly)
+    assert parse_periodicity("Weekdays").weekdays == (0, 1, 2, 3, 4)
+    assert parse_periodicity("Weekdays: mon, wed, Fri").weekdays == (0, 2, 4)
+    assert isinstance(parse_periodicity("Yearly"), Unscheduled)
+    assert isinstance(parse_periodicity(None), Unscheduled)
+
+def test_check_periodicity():
+    """Test that periodicities looking like a schedule they cannot follow are refused, and no others"""
+    for text in ("Every 0 days", "every three days", "Weekdays: Funday", "Weekdays:"):
+        with pytest.raises(ValueError):
+            check_periodicity(text)
+    for text in ("Every 3 days", "Weekdays", "Weekdays: mon, fri", "Sometimes", "", None):
+        check_periodicity(text)
+
+def test_calendar_aligned_schedules():
+    """Test too soon, streak breaks and next due dates of the calendar-aligned schedules"""
+    # Wednesday 2025-01-29 and Sunday 2025-02-02 are in the same ISO week, Monday 2025-02-03 starts the next one
+    iso_weekly = IsoWeekly()
+    assert iso_weekly.event_too_soon(date(2025, 1, 29), date(2025, 2, 2))
+    assert not iso_weekly.event_too_soon(date(2025, 1, 29), date(2025, 2, 3))
+    assert iso_weekly.next_due(date(2025, 1, 29)) == date(2025, 2, 3)
+    assert not iso_weekly.breaks_streak(date(2025, 1, 27), date(2025, 2, 9))
+    assert iso_weekly.breaks_streak(date(2025, 1, 27), date(2025, 2, 10))
+
+    monthly = Monthly()
+    assert monthly.next_due(date(2025, 12, 31)) == date(2026, 1, 1)
+    assert monthly.event_too_soon(date(2025, 1, 1), date(2025, 1, 31))
+    assert monthly.breaks_streak(date(2025, 1, 31), date(2025, 3, 1))
+
+    mon_wed_fri = OnWeekdays((0, 2, 4))
+    assert mon_wed_fri.next_due(date(2025, 1, 29)) == date(2025, 1, 31)
+    assert mon_wed_fri.next_due(date(2025, 1, 31)) == date(2025, 2, 3)
+    # Thursday still counts for the Wednesday it was due on, Saturday already for Friday
+    assert mon_wed_fri.event_too_soon(date(2025, 1, 29), date(2025, 1, 30))
+    assert not mon_wed_fri.event_too_soon(date(2025, 1, 29), date(2025, 2, 1))
+
+    assert EveryNDays(2).next_due(date(2025, 1, 31)) == date(2025, 2, 2)
+    assert Unscheduled().next_due(date(2025, 1, 31)) is None
+
+def test_vectorized_period_indexes_match():
+    """Test that the period numbers of whole arrays match those of single days, and period_start inverts them"""
+    days = [date(2024, 1, 1) + timedelta(days=offset) for offset in range(800)]
+    ordinals = np.array([day.toordinal() for day in days], dtype=np.int64)
+    for schedule in (EveryNDays(3), IsoWeekly(), Monthly(), OnWeekdays((1, 3, 6))):
+        indexes = schedule.period_indexes(ordinals)
+        assert indexes.tolist() == [schedule.period_index(day) for day in days]
+        for day in days:
+            start = schedule.period_start(schedule.period_index(day))
+            assert start <= day and schedule.period_index(start) == schedule.period_index(day)
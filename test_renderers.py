@@ -0,0 +1,46 @@
+import io
+import json
+import pytest
+from datetime import date, timedelta
+from analyzer import HabitAnalyzer
+from renderers import JsonRenderer, RichRenderer, get_renderer
+from results import HABIT_ADDED, HABIT_EXISTS, EVENT_ADDED, TOO_SOON
+
+def test_writes_return_outcomes_without_output(repo, capsys):
+    """Test that writes return typed outcomes and the default renderer prints nothing"""
+    assert repo.add_habit("Read", "Read a book", "Daily").code == HABIT_ADDED
+    duplicate = repo.add_habit("Read", "Read a book", "Daily")
+    assert not duplicate.ok and duplicate.code == HABIT_EXISTS
+    added = repo.add_habit_event("Read")
+    assert added.ok and added.code == EVENT_ADDED and added.event_date == date.today()
+    assert repo.add_habit_event("Read").code == TOO_SOON
+    assert repo.get_all_habit_events() and repo.get_one_habit_events("Unknown") == []
+    repo.list_all_habits()
+    assert capsys.readouterr().out == ""
+
+def test_rich_renderer_prints_messages(repo, capsys):
+    """Test that the rich renderer prints the outcomes and views"""
+    repo.renderer = RichRenderer()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit_event("Read", (date.today() - timedelta(days=1)).isoformat())
+    repo.list_one_habit_events("Read")
+    output = capsys.readouterr().out
+    assert "Habit 'Read' added successfully." in output
+    assert "Event added for habit 'Read'" in output
+    assert "Event date:" in output
+
+def test_json_renderer_writes_json_lines(repo):
+    """Test that the json renderer writes one JSON object per rendered result"""
+    stream = io.StringIO()
+    repo.renderer = JsonRenderer(stream)
+    repo.add_habit("Read", "Read a book", "Daily")
+    HabitAnalyzer(repo).list_all_overdue_habits()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]["type"] == "outcome" and lines[0]["ok"] and lines[0]["habit_name"] == "Read"
+    assert lines[1] == {"type": "overdue", "habits": [{"name": "Read", "periodicity": "Daily",
+                                                       "last_event_date": None}]}
+
+def test_unknown_renderer():
+    """Test that an unknown renderer name is rejected"""
+    with pytest.raises(ValueError):
+        get_renderer("html")
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+from scheduler import DueScheduler
+from streaks import recompute_all
+
+def test_reminders_and_streak_resets(repo):
+    """Test that habits are reminded on their due date and lose their stored streak once it expired"""
+    today = date.today()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit("Run", "Go for a run", "Weekly")
+    repo.add_habit("Never", "Never done", "Daily")
+    repo.add_habit_event("Read", today.isoformat())
+    repo.add_habit_event("Run", today.isoformat())
+
+    scheduler = DueScheduler(repo).load()
+    assert scheduler.next_deadline() == today + timedelta(days=1)
+    assert scheduler.run(today).reminders == []
+
+    run = scheduler.run(today + timedelta(days=1))
+    assert [reminder.habit_name for reminder in run.reminders] == ["Read"]
+    assert run.streak_resets == []
+
+    run = scheduler.run(today + timedelta(days=8))
+    assert [reminder.habit_name for reminder in run.reminders] == ["Run"]
+    assert run.streak_resets == ["Read", "Run"]
+    assert [habit.streak for habit in repo.get_all_habits()] == [0, 0, 0]
+    assert [stats.struggle for stats in repo.get_stats()][:2] == [1.0, 1.0]
+    assert scheduler.next_deadline() is None
+
+def test_deadlines_move_with_new_events(repo):
+    """Test that a deadline that moved because of a new event is rescheduled and not processed"""
+    today = date.today()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit_event("Read", (today - timedelta(days=1)).isoformat())
+    scheduler = DueScheduler(repo).load()
+
+    # The event of today is not known to the scheduler, its deadlines are found to have moved when they come up
+    repo.add_habit_event("Read", today.isoformat())
+    run = scheduler.run(today)
+    assert run.reminders == [] and run.streak_resets == []
+    assert scheduler.next_deadline() == today + timedelta(days=1)
+    assert scheduler.run(today + timedelta(days=2)).streak_resets == ["Read"]
+
+    # A reminder is only emitted once per due date, even if the habit is tracked again
+    scheduler.track("Read")
+    assert scheduler.run(today + timedelta(days=3)).reminders == []
+
+def test_one_shot_runs_remind_once(repo):
+    """Test that one-shot runs only look up the habits that reached a deadline, and remind of a due date once"""
+    today = date.today()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit("Run", "Go for a run", "Weekly")
+    repo.add_habit_event("Read", (today - timedelta(days=1)).isoformat())
+    repo.add_habit_event("Run", today.isoformat())
+    assert [stats.name for stats in repo.get_pending_deadlines(today)] == ["Read"]
+
+    assert [reminder.habit_name for reminder in DueScheduler(repo).load_due(today).run(today).reminders] == ["Read"]
+    assert DueScheduler(repo).load_due(today).run(today).reminders == []
+    # The streak of Read can still expire, so the habit stays pending until it did
+    assert DueScheduler(repo).load_due(today + timedelta(days=1)).run(today + timedelta(days=1)).streak_resets \
+        == ["Read"]
+    assert repo.get_pending_deadlines(today + timedelta(days=1)) == []
+
+    # Recomputing the analytics keeps the reminded due dates, a new event brings the next reminder
+    recompute_all(repo)
+    assert DueScheduler(repo).load_due(today).run(today).reminders == []
+    repo.add_habit_event("Read", today.isoformat())
+    run = DueScheduler(repo).load_due(today + timedelta(days=1)).run(today + timedelta(days=1))
+    assert [reminder.habit_name for reminder in run.reminders] == ["Read"]
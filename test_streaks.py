@@ -0,0 +1,53 @@
+import numpy as np
+from datetime import date, timedelta
+from streaks import compute_streaks, recompute_all
+
+def test_compute_streaks_runs():
+    """Test run detection over two habits with gaps"""
+    # Habit 0 (daily): days 1, 2, 3, 5, 6 -> runs of 3 and 2. Habit 1 (weekly): days 1, 8, 20 -> runs of 2 and 1.
+    codes = np.array([0, 0, 1, 0, 0, 1, 0, 1])
+    ordinals = np.array([1, 2, 1, 3, 5, 8, 6, 20])
+    streaks, longest, counts = compute_streaks(codes, ordinals, np.array([1, 7]), today_ordinal=7)
+    assert list(streaks) == [2, 1]
+    assert list(longest) == [3, 2]
+    assert list(counts) == [5, 3]
+
+def test_compute_streaks_expired():
+    """Test that the current streak is zero once the habit is overdue"""
+    streaks, longest, counts = compute_streaks(np.array([0, 0]), np.array([1, 2]), np.array([1]), today_ordinal=10)
+    assert list(streaks) == [0]
+    assert list(longest) == [2]
+
+def test_recompute_all(repo):
+    """Test that drifted counters are rebuilt from the event log"""
+    today = date.today()
+    repo.add_habit("Stretch", "Stretch daily", "Daily", streak=40)
+    repo.add_habit("Unused", "Never done", "Weekly", streak=3)
+    for days_ago in (6, 5, 4, 1, 0):
+        repo.add_habit_event("Stretch", (today - timedelta(days=days_ago)).isoformat())
+
+    summaries = {summary.name: summary for summary in recompute_all(repo, today)}
+    assert summaries["Stretch"].streak == 2
+    assert summaries["Stretch"].longest_streak == 3
+    assert summaries["Stretch"].event_count == 5
+    assert summaries["Unused"].streak == 0
+
+    habit = repo.get_one_habit("Stretch")[0]
+    assert (habit.streak, habit.longest_streak, habit.event_count) == (2, 3, 5)
+
+def test_recompute_all_calendar_schedules(repo):
+    """Test that streaks of calendar-aligned habits are counted in their periods and not in days"""
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    repo.add_habit("Plan", "Once per ISO week", "ISO weekly")
+    repo.add_habit("Budget", "Once per month", "Monthly")
+    # Monday three weeks ago, then Sunday two weeks ago and Sunday last week: 13 and 7 days apart, no week missed
+    for day in (monday - timedelta(days=21), monday - timedelta(days=8), monday - timedelta(days=1)):
+        repo.add_habit_event("Plan", day.isoformat())
+    repo.add_habit_events_bulk([("Budget", date(2020, 1, 31)), ("Budget", date(2020, 2, 1)),
+                                ("Budget", date(2020, 4, 1))])
+
+    summaries = {summary.name: summary for summary in recompute_all(repo, today)}
+    assert (summaries["Plan"].streak, summaries["Plan"].longest_streak) == (3, 3)
+    assert (summaries["Budget"].streak, summaries["Budget"].longest_streak) == (0, 2)
+    assert repo.get_leaderboard(1)[0].next_due == monday
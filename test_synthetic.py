@@ -0,0 +1,20 @@
+from datetime import date
+from benchmarks.synthetic import generate
+from habit_repository import HabitRepository
+
+def test_synthetic_data_is_reproducible():
+    """Test that the same seed generates the same habits and events, all accepted by the bulk ingestion"""
+    def snapshot(seed):
+        repo = HabitRepository(":memory:")
+        names = generate(repo, habits=50, events=2_000, seed=seed, today=date(2025, 6, 30))
+        batch = repo.get_event_batch()
+        habits = [(habit.name, habit.periodicity, habit.event_count) for habit in repo.get_all_habits()]
+        repo.close()
+        return names, habits, list(batch.ordinals)
+
+    names, habits, ordinals = snapshot(seed=7)
+    assert snapshot(seed=7) == (names, habits, ordinals)
+    assert snapshot(seed=8)[2] != ordinals
+    assert len(names) == 50 and abs(len(ordinals) - 2_000) < 50
+    assert sum(count for *_, count in habits) == len(ordinals)
+    assert max(ordinals) <= date(2025, 6, 30).toordinal()
@@ -0,0 +1,21 @@
+from datetime import date
+from tenants import TenantRouter, shard_names, shard_of
+
+def test_users_are_routed_to_stable_shards(tmp_path):
+    """Test that every user is served from one shard, chosen the same way every time"""
+    names = shard_names(str(tmp_path), 4)
+    users = [f"user-{number}" for number in range(20)]
+    router = TenantRouter(names)
+    for user in users:
+        router.repository(user).add_habit("Read", f"Habit of {user}", "Daily")
+        router.repository(user).add_habit_event("Read", date.today().isoformat())
+    router.close()
+
+    # A new router finds every user again, each in exactly one of the shard files
+    router = TenantRouter(names)
+    for user in users:
+        habits = router.repository(user).get_all_habits()
+        assert [(habit.description, habit.event_count) for habit in habits] == [(f"Habit of {user}", 1)]
+        assert router.analyzer(user).overdue_habits() == []
+    assert len({shard_of(user, 4) for user in users}) > 1
+    router.close()
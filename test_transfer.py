@@ -0,0 +1,69 @@
+import pytest
+from datetime import date, timedelta
+from habit_repository import HabitRepository
+from transfer import export_events, export_habits, import_events, import_habits
+
+@pytest.fixture
+def populated_repo(tmp_path):
+    """Fixture to create a HabitRepository with a daily and a weekly habit and some of their events."""
+    repo = HabitRepository(db_name=str(tmp_path / "source.db"))
+    today = date.today()
+    repo.add_habit("Read", "Read a book", "Daily")
+    repo.add_habit("Run", "Go for a run", "Weekly")
+    repo.add_habit_events_bulk([("Read", today - timedelta(days=days_ago)) for days_ago in range(30, -1, -1)] +
+                               [("Run", today - timedelta(weeks=weeks_ago)) for weeks_ago in range(5, -1, -1)])
+    yield repo
+    repo.close()
+
+@pytest.mark.parametrize("extension", ["csv", "ndjson", "parquet"])
+def test_export_import_round_trip(populated_repo, tmp_path, extension):
+    """Test that habits and events exported in chunks are imported into another database unchanged"""
+    if extension == "parquet":
+        pytest.importorskip("pyarrow")
+    habits_path, events_path = str(tmp_path / f"habits.{extension}"), str(tmp_path / f"events.{extension}")
+    assert export_habits(populated_repo, habits_path).rows == 2
+    assert export_events(populated_repo, events_path, chunk_size=7).rows == 37
+
+    target = HabitRepository(db_name=str(tmp_path / "target.db"))
+    assert import_habits(target, habits_path).rows == 2
+    report = import_events(target, events_path, chunk_size=10)
+    assert (report.rows, report.ingest.accepted, report.ingest.rejected) == (37, 37, [])
+
+    def snapshot(repository):
+        return ([(habit.name, habit.description, habit.periodicity, habit.streak, habit.event_count)
+                 for habit in repository.get_all_habits()], repository.get_all_habit_events())
+    assert snapshot(target) == snapshot(populated_repo)
+
+    # Importing the habits again adds nothing
+    assert import_habits(target, habits_path).rows == 0
+    target.close()
+
+def test_rejected_rows_keep_their_position(populated_repo, tmp_path):
+    """Test that rejected events report their row number in the whole file, not within their chunk"""
+    populated_repo.add_habit("Write", "Write a page", "Daily")
+    path = tmp_path / "events.csv"
+    path.write_text("habit,date\nWrite,2020-01-01\nWrite,2020-01-02\nWalk,2020-01-03\nWrite,2020-01-02\n")
+    report = import_events(populated_repo, str(path), chunk_size=2)
+    assert report.ingest.accepted == 2
+    assert [(rejection.index, rejection.reason) for rejection in report.ingest.rejected] == \
+        [(2, "unknown_habit"), (3, "too_soon")]
+
+def test_events_need_a_date(populated_repo, tmp_path):
+    """Test that a file without a date column is refused and an event with an empty date is rejected, not dated
+    today"""
+    path = tmp_path / "events.csv"
+    path.write_text("habit,when\nRead,2025-01-01\n")
+    with pytest.raises(ValueError, match="no date column"):
+        import_events(populated_repo, str(path))
+    path = tmp_path / "events.ndjson"
+    path.write_text('{"habit": "Read"}\n')
+    with pytest.raises(ValueError, match="no date column"):
+        import_events(populated_repo, str(path))
+
+    events = populated_repo.get_all_habit_events()
+    path = tmp_path / "events.csv"
+    path.write_text("habit,date\nRead,\nRun\n")
+    report = import_events(populated_repo, str(path))
+    assert [(rejection.index, rejection.reason) for rejection in report.ingest.rejected] == \
+        [(0, "invalid_date"), (1, "invalid_date")]
+    assert populated_repo.get_all_habit_events() == events
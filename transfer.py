@@ -0,0 +1,187 @@
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, replace
+from itertools import islice
+from habit_event import BulkIngestReport
+from renderers import get_renderer
+
+# Number of rows read, written or ingested at a time. Bounds the memory of a transfer, no matter how large the file.
+TRANSFER_CHUNK_SIZE = 100_000
+
+# Columns of the exported habits and habit events, in file order
+HABIT_FIELDS = ("name", "description", "periodicity")
+EVENT_FIELDS = ("habit", "date")
+
+# File formats by extension
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".parquet": "parquet"}
+
+@dataclass
+class TransferReport:
+    """A data class to represent the outcome of an import or export: how many rows went through, and for event
+    imports the BulkIngestReport of all chunks together."""
+    path: str
+    rows: int = 0
+    elapsed: float = 0.0
+    ingest: BulkIngestReport = None
+
+    @property
+    def rows_per_second(self):
+        """Throughput of the transfer."""
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+def format_of(path, file_format=None):
+    """Return the format of a file, given explicitly or guessed from its extension."""
+    file_format = file_format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format not in READERS:
+        raise ValueError(f"Unknown file format of '{path}', expected one of {', '.join(READERS)}.")
+    return file_format
+
+def _chunks(rows, chunk_size):
+    """Split an iterable of rows into lists of at most chunk_size rows."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+def _pyarrow():
+    """Import pyarrow, which only the Parquet format needs."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError("The Parquet format needs pyarrow, install it with 'pip install pyarrow'.") from error
+    return pyarrow
+
+def _check_fields(path, fields, names):
+    """Raise a ValueError if a file lacks a column of the given fields, instead of importing empty values."""
+    missing = [field for field in fields if field not in names]
+    if missing:
+        raise ValueError(f"'{path}' has no {', '.join(missing)} column, expected {', '.join(fields)}.")
+
+def _write_csv(path, fields, chunks):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            yield len(chunk)
+
+def _write_ndjson(path, fields, chunks):
+    with open(path, "w", encoding="utf-8") as file:
+        for chunk in chunks:
+            file.write("".join(json.dumps(dict(zip(fields, row))) + "\n" for row in chunk))
+            yield len(chunk)
+
+def _write_parquet(path, fields, chunks):
+    pa = _pyarrow()
+    # Event dates are stored as Arrow dates, everything else as text. Every chunk becomes one row group.
+    schema = pa.schema([(field, pa.date32() if field == "date" else pa.string()) for field in fields])
+    with pa.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            columns = [pa.array(column, pa.string()) for column in zip(*chunk)]
+            writer.write_table(pa.Table.from_arrays([column.cast(schema.field(index).type)
+                                                     for index, column in enumerate(columns)], schema=schema))
+            yield len(chunk)
+
+def _read_csv(path, fields, chunk_size):
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        _check_fields(path, fields, header)
+        positions = [header.index(field) for field in fields]
+        rows = (tuple(row[position] if position < len(row) else None for position in positions)
+                for row in reader if row)
+        yield from _chunks(rows, chunk_size)
+
+def _read_ndjson(path, fields, chunk_size):
+    def row(record):
+        # Every record has all keys of the fields, as export writes them
+        _check_fields(path, fields, record)
+        return tuple(record[field] for field in fields)
+
+    with open(path, encoding="utf-8") as file:
+        records = (json.loads(line) for line in file if line.strip())
+        yield from _chunks((row(record) for record in records), chunk_size)
+
+def _read_parquet(path, fields, chunk_size):
+    pa = _pyarrow()
+    # Only one batch is held in memory, dates are handed over as ISO text like from the other formats
+    parquet_file = pa.parquet.ParquetFile(path)
+    _check_fields(path, fields, parquet_file.schema_arrow.names)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=list(fields)):
+        yield list(zip(*(batch.column(field).cast(pa.string()).to_pylist() for field in fields)))
+
+WRITERS = {"csv": _write_csv, "ndjson": _write_ndjson, "parquet": _write_parquet}
+READERS = {"csv": _read_csv, "ndjson": _read_ndjson, "parquet": _read_parquet}
+
+def _export(path, file_format, fields, chunks):
+    """Write chunks of rows to a file and return a TransferReport."""
+    start = time.perf_counter()
+    report = TransferReport(path)
+    for written in WRITERS[format_of(path, file_format)](path, fields, chunks):
+        report.rows += written
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def export_habits(repo, path, file_format=None):
+    """Export all habits of the repository's user to a CSV, NDJSON or Parquet file. Returns a TransferReport."""
+    habits = ((habit.name, habit.description, habit.periodicity) for habit in repo.get_all_habits())
+    return _export(path, file_format, HABIT_FIELDS, _chunks(habits, TRANSFER_CHUNK_SIZE))
+
+def export_events(repo, path, file_format=None, since=None, until=None, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Export the habit events of the repository's user, optionally between two dates (inclusive), to a CSV, NDJSON
+    or Parquet file. Events are streamed chunk_size rows at a time. Returns a TransferReport."""
+    return _export(path, file_format, EVENT_FIELDS, repo.iter_event_rows(since=since, until=until,
+                                                                         batch_size=chunk_size))
+
+def import_habits(repo, path, file_format=None):
+    """Import habits from a file written by export_habits. Habits that already exist are left as they are.
+    Raises a ValueError if the file lacks a column of HABIT_FIELDS. Returns a TransferReport counting the habits
+    added."""
+    start = time.perf_counter()
+    report = TransferReport(path)
+    for chunk in READERS[format_of(path, file_format)](path, HABIT_FIELDS, TRANSFER_CHUNK_SIZE):
+        report.rows += repo.add_habits_bulk(chunk)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def import_events(repo, path, file_format=None, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Import habit events from a file written by export_events. Every chunk of chunk_size rows is ingested in one
+    transaction by HabitRepository.add_habit_events_bulk, with its checks. Events of a habit are expected in
+    chronological order, as they are exported, and events without a date are rejected. Raises a ValueError if the
+    file lacks a column of EVENT_FIELDS. Returns a TransferReport with the combined BulkIngestReport, whose rejected
+    events carry their row number in the file."""
+    start = time.perf_counter()
+    report = TransferReport(path, ingest=BulkIngestReport())
+    # Render the combined report once at the end instead of once per chunk
+    renderer, repo = repo.renderer, repo.for_user(repo.user_id)
+    repo.renderer = get_renderer("quiet")
+    for chunk in READERS[format_of(path, file_format)](path, EVENT_FIELDS, chunk_size):
+        ingested = repo.add_habit_events_bulk(chunk)
+        report.ingest.accepted += ingested.accepted
+        report.ingest.streak_resets += ingested.streak_resets
+        report.ingest.rejected += [replace(rejection, index=rejection.index + report.rows)
+                                   for rejection in ingested.rejected]
+        report.rows += len(chunk)
+    report.elapsed = report.ingest.elapsed = time.perf_counter() - start
+    renderer.bulk_report(report.ingest)
+    return report
+
+if __name__ == "__main__":
+    # Move data in and out from the command line:
+    # python transfer.py import|export habits|events path [db_name] [user_id]
+    from database import DEFAULT_USER
+    from habit_repository import HabitRepository
+
+    direction, kind, file_path, *options = sys.argv[1:]
+    repository = HabitRepository(options[0] if options else "main.db", profile="bulk", renderer="rich",
+                                 user_id=options[1] if len(options) > 1 else DEFAULT_USER)
+    transfer = {("export", "habits"): export_habits, ("export", "events"): export_events,
+                ("import", "habits"): import_habits, ("import", "events"): import_events}[(direction, kind)]
+    result = transfer(repository, file_path)
+    done = {"import": "Imported", "export": "Exported"}[direction]
+    print(f"{done} {result.rows} {kind} in {result.elapsed:.2f}s"
+          f" ({result.rows_per_second:,.0f} rows/s).")
+    repository.close()
@@ -0,0 +1,109 @@
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from periodicity import parse_periodicity
+from rollups import week_start
+
+# Windows in days the completion rate is computed over, ending today
+WINDOWS = (7, 30, 90)
+
+# Number of ISO weeks in a heatmap, ending with the current week
+HEATMAP_WEEKS = 12
+
+# Days of the longest period of any schedule, a calendar month. A completion up to that many days before a window
+# can fall in a period due in it.
+LONGEST_PERIOD = 31
+
+@dataclass
+class HabitTrends:
+    """A data class to represent how regularly a habit was completed lately: the share of its periods due in each
+    window that were completed, a heatmap of the days completed per ISO week (oldest first) and weekday (Monday
+    first), and the days completed per weekday over the whole analyzed range. Completions count days a habit was
+    completed on; the rate of a window is None if nothing was due in it."""
+    name: str
+    periodicity: str
+    rates: Dict[int, Optional[float]] = field(default_factory=dict)
+    completions: Dict[int, int] = field(default_factory=dict)
+    heatmap: List[List[int]] = field(default_factory=list)
+    weekdays: List[int] = field(default_factory=list)
+
+def first_week(today: date, windows=WINDOWS, weeks=HEATMAP_WEEKS):
+    """Return the Monday of the first week the heatmap or a period due in any of the windows covers, so only the
+    weekly rollups from there on need to be read."""
+    return week_start(min(today - timedelta(days=7 * (weeks - 1)),
+                          today - timedelta(days=max(windows) - 1 + LONGEST_PERIOD)))
+
+def due_periods(schedule, today: date, days: int):
+    """Return the first and the end index of the periods of a schedule whose deadline, their last day, falls in the
+    days up to today. A period still running today is not due yet, so a habit on schedule is not marked down for it.
+    The schedule asks for one completion per gap of these periods."""
+    # The last period due is the one before the period of tomorrow
+    return schedule.period_index(today - timedelta(days=days - 1)), schedule.period_index(today + timedelta(days=1))
+
+def compute_trends(habits, rollups, today: date, windows=WINDOWS, weeks=HEATMAP_WEEKS):
+    """Compute the HabitTrends of every habit from the weekly rollups of at least the weeks from first_week on, as
+    returned by HabitRepository.get_week_rollup_columns. The weekday bitmaps of all rollups are unpacked into one
+    array, every statistic is a sum over it. The rate of a window is the share of the due periods, see due_periods,
+    a completion fell in, so a period completed before the window started counts as well."""
+    habit_count = len(habits)
+    codes = {habit.name: index for index, habit in enumerate(habits)}
+    rollups = [(codes[name], ordinals, bitmaps) for name, ordinals, bitmaps in rollups if name in codes]
+    habit_codes = np.concatenate([np.full(len(ordinals), code) for code, ordinals, _ in rollups] or [[]])
+    habit_codes = habit_codes.astype(np.int64)
+    week_ordinals = np.concatenate([ordinals for _, ordinals, _ in rollups] or [[]]).astype(np.int64)
+    bitmaps = np.concatenate([bitmaps for *_, bitmaps in rollups] or [[]]).astype(np.int64)
+
+    # One row per rollup and one column per weekday, 1 where the habit was completed on that day
+    completed = (bitmaps[:, None] >> np.arange(7)) & 1
+    day_ordinals = week_ordinals[:, None] + np.arange(7)
+    today_ordinal = today.toordinal()
+    completed[day_ordinals > today_ordinal] = 0
+    completed[day_ordinals < first_week(today, windows, weeks).toordinal()] = 0
+
+    # Days completed per habit in every window
+    completions = {days: np.bincount(habit_codes, weights=(completed * (day_ordinals > today_ordinal - days)).sum(1),
+                                     minlength=habit_count).astype(int) for days in windows}
+
+    # The heatmap takes the bitmaps of its weeks as they are, the weekdays are summed over all weeks
+    heatmap = np.zeros((habit_count, weeks, 7), dtype=np.int64)
+    week_numbers = (week_ordinals - (week_start(today).toordinal() - 7 * (weeks - 1))) // 7
+    in_heatmap = (week_numbers >= 0) & (week_numbers < weeks)
+    heatmap[habit_codes[in_heatmap], week_numbers[in_heatmap]] = completed[in_heatmap]
+    per_weekday = np.zeros((habit_count, 7), dtype=np.int64)
+    np.add.at(per_weekday, habit_codes, completed)
+
+    # Habits of the same periodicity share their due periods. The completed days of their rollups are mapped to
+    # period indexes, every due period completed at least once is a hit.
+    by_periodicity = {}
+    for index, habit in enumerate(habits):
+        by_periodicity.setdefault(habit.periodicity, []).append(index)
+    expected = {}
+    hits = {days: np.zeros(habit_count, dtype=np.int64) for days in windows}
+    for periodicity, indexes in by_periodicity.items():
+        schedule = parse_periodicity(periodicity)
+        if schedule.gap is None:
+            expected[periodicity] = [None] * len(windows)
+            continue
+        rows, weekdays = np.nonzero(completed & np.isin(habit_codes, indexes)[:, None])
+        done_codes, done_periods = habit_codes[rows], schedule.period_indexes(day_ordinals[rows, weekdays])
+        expected[periodicity] = []
+        for days in windows:
+            first, end = due_periods(schedule, today, days)
+            expected[periodicity].append((end - first) / schedule.gap)
+            due = (done_periods >= first) & (done_periods < end)
+            hit_codes, _ = np.unique(np.stack([done_codes[due], done_periods[due]]), axis=1)
+            np.add.at(hits[days], hit_codes, 1)
+    completions = {days: completions[days].tolist() for days in windows}
+    hits = {days: hits[days].tolist() for days in windows}
+    heatmap, per_weekday = heatmap.tolist(), per_weekday.tolist()
+
+    trends = []
+    for index, habit in enumerate(habits):
+        result = HabitTrends(name=habit.name, periodicity=habit.periodicity, heatmap=heatmap[index],
+                             weekdays=per_weekday[index])
+        for days, due in zip(windows, expected[habit.periodicity]):
+            result.completions[days] = completions[days][index]
+            result.rates[days] = min(hits[days][index] / due, 1.0) if due else None
+        trends.append(result)
+    return trends